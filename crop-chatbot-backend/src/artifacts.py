@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import threading
+import time
+import joblib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from forest_engine import load_or_compile
+
+logger = logging.getLogger(__name__)
+
+# Default file name of every artifact, relative to the artifact directory
+DEFAULT_FILES = {
+    'model': 'crop_recommendation_model.pkl',
+    'label_encoder': 'label_encoder.pkl',
+    'forest': 'crop_forest',
+    'crop_info': 'crop_info.json',
+    'agricultural_knowledge': 'agricultural_knowledge.json',
+    'quick_facts': 'quick_agricultural_facts.json',
+    'offline_bundle': 'offline_bundle.json',
+}
+
+
+def _load_json(path: str) -> Any:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _load_static_asset(path: str) -> Any:
+    from static_assets import StaticAsset
+    with open(path, 'rb') as f:
+        return StaticAsset(os.path.basename(path), f.read())
+
+
+def _stat(path: str) -> Tuple[int, int]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ArtifactStore:
+    """Lazily loads model and knowledge artifacts from a configurable directory
+
+    Paths resolve in this order: the `paths` argument, a
+    CROPBOT_<NAME>_PATH environment variable, then `base_dir` (or
+    CROPBOT_ARTIFACT_DIR), which defaults to the src/ directory. Nothing is
+    read until an artifact is first used or warmup() is called, and the
+    time each load took is kept in `load_times`.
+    """
+
+    def __init__(self, base_dir: Optional[str] = None, paths: Optional[Dict[str, str]] = None,
+                 mmap_mode: Optional[str] = 'r'):
+        self.base_dir = base_dir or os.environ.get('CROPBOT_ARTIFACT_DIR') or os.path.dirname(os.path.abspath(__file__))
+        self.paths = {}
+        for name, filename in DEFAULT_FILES.items():
+            override = (paths or {}).get(name) or os.environ.get(f'CROPBOT_{name.upper()}_PATH')
+            self.paths[name] = override or os.path.join(self.base_dir, filename)
+        # The compiled forest's arrays are memory-mapped and shared page-for-page
+        # between worker processes. sklearn's Tree.__setstate__ copies its node
+        # arrays, so each process still holds its own copy of the pickled forest
+        self.mmap_mode = mmap_mode
+        self.load_times: Dict[str, float] = {}
+        self._loaded: Dict[str, Any] = {}
+        self._versions: Dict[str, Tuple[int, int]] = {}
+        # Re-entrant: derived artifacts load their parents while holding it
+        self._lock = threading.RLock()
+        self._loaders: Dict[str, Callable[[], Any]] = {
+            'model': lambda: self._joblib_load(self.paths['model']),
+            'label_encoder': lambda: self._joblib_load(self.paths['label_encoder']),
+            'forest': self._load_forest,
+            'forest_label_encoder': lambda: self.get('forest').label_encoder(),
+            'crop_info': lambda: _load_json(self.paths['crop_info']),
+            'agricultural_knowledge': lambda: _load_json(self.paths['agricultural_knowledge']),
+            'quick_facts': lambda: _load_json(self.paths['quick_facts']),
+            # Kept as bytes, precompressed, since it is only ever sent to browsers
+            'offline_bundle': lambda: _load_static_asset(self.paths['offline_bundle']),
+        }
+
+    def _joblib_load(self, path: str) -> Any:
+        return joblib.load(path, mmap_mode=self.mmap_mode)
+
+    def _load_forest(self) -> Any:
+        return load_or_compile(self.paths['forest'], self.paths['model'], self.paths['label_encoder'],
+                               mmap_mode=self.mmap_mode)
+
+    def get(self, name: str) -> Any:
+        """Return an artifact, loading it on first use"""
+        if name in self._loaded:
+            return self._loaded[name]
+        if name not in self._loaders:
+            raise KeyError(f"Unknown artifact: {name}")
+        with self._lock:
+            if name not in self._loaded:
+                start = time.perf_counter()
+                if name in self.paths:
+                    self._versions[name] = self.version(name)
+                value = self._loaders[name]()
+                self.load_times[name] = time.perf_counter() - start
+                self._loaded[name] = value
+                logger.info("Loaded artifact %s in %.1f ms", name, self.load_times[name] * 1000)
+        return self._loaded[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._loaded
+
+    def warmup(self, names: Iterable[str]) -> Dict[str, float]:
+        """Load the given artifacts now and return their load times in seconds"""
+        names = list(names)
+        for name in names:
+            self.get(name)
+        return {name: self.load_times[name] for name in names}
+
+    def version(self, name: str) -> Tuple[int, ...]:
+        """(mtime_ns, size) of an artifact on disk, used to detect replaced files"""
+        path = self.paths[name]
+        if name == 'forest':
+            # The compiled forest is derived from the pickle, so it changes with it
+            return _stat(os.path.join(path, 'meta.json')) + _stat(self.paths['model'])
+        return _stat(path)
+
+    def refresh(self, names: Iterable[str]) -> List[str]:
+        """Forget loaded artifacts whose files changed so the next get() reloads them"""
+        dropped = []
+        with self._lock:
+            for name in names:
+                if name in self._loaded and name in self.paths and self.version(name) != self._versions.get(name):
+                    dropped.append(name)
+            if 'forest' in dropped:
+                dropped.append('forest_label_encoder')
+            for name in dropped:
+                self._loaded.pop(name, None)
+                self._versions.pop(name, None)
+        if dropped:
+            logger.info("Artifacts changed on disk, reloading: %s", ', '.join(dropped))
+        return dropped
+
+    def report(self) -> Dict[str, Any]:
+        """Load state of every artifact, for health checks"""
+        return {
+            'base_dir': self.base_dir,
+            'loaded': sorted(self._loaded),
+            'load_times_ms': {name: round(seconds * 1000, 3) for name, seconds in self.load_times.items()},
+        }
@@ -0,0 +1,396 @@
+"""ASGI entry point for the crop recommendation API
+
+    uvicorn src.asgi:app --host 0.0.0.0 --port 8000
+
+Serves the same routes as main.py. Requests are handed to the Flask app on
+a bounded thread pool, so CPU-bound work (inference, rule scoring) never
+blocks the event loop and at most CROPBOT_ASGI_THREADS requests run it at
+once. With the ML API (CROPBOT_API=ml), POST /api/crop/chat is served
+natively: the local answer and prompt building run on the same pool, while
+the LLM call is a coroutine. Hundreds of chats can then wait on the model
+without holding a thread (up to CROPBOT_LLM_ASYNC_MAX_CONCURRENCY at once,
+256 by default), and recommendations keep their latency when the LLM slows
+down.
+"""
+import asyncio
+import functools
+import io
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Same import root as main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.main import app as flask_app
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = int(os.environ.get('CROPBOT_ASGI_MAX_BODY', 16 * 1024 * 1024))
+
+_END = object()
+
+
+class BoundedExecutor:
+    """Thread pool for blocking calls, with a cap on calls queued behind it
+
+    Callers beyond `max_pending` wait on the event loop (not in the pool's
+    unbounded queue), so a burst of slow requests applies back-pressure
+    instead of piling up.
+    """
+
+    def __init__(self, threads: int, max_pending: int):
+        self.threads = threads
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='cropbot-asgi')
+        self._pending = asyncio.Semaphore(max_pending)
+        self.calls = 0
+        self.waiting = 0
+
+    async def run(self, fn: Callable, *args) -> Any:
+        self.waiting += 1
+        try:
+            await self._pending.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            self.calls += 1
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args))
+        finally:
+            self._pending.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'threads': self.threads, 'max_pending': self.max_pending, 'calls': self.calls,
+                'waiting': self.waiting}
+
+
+def _headers(scope) -> Dict[str, str]:
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+
+def _environ(scope, body: bytes) -> Dict[str, Any]:
+    """WSGI environ for an ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif key != 'CONTENT_LENGTH':
+            key = f'HTTP_{key}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    """The whole request body, or None if it is over MAX_BODY_BYTES"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return b''.join(chunks)
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_response(send, status: int, headers: List[Tuple[str, str]], body: bytes):
+    headers = headers + [('content-length', str(len(body)))]
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _json_body(payload: Dict[str, Any]) -> bytes:
+    # Byte-for-byte what Flask's jsonify produces outside debug mode
+    return (json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class CropAPI:
+    """The ASGI application: native routes first, everything else through the Flask app"""
+
+    def __init__(self, wsgi_app, threads: int = None, max_pending: int = None):
+        self.wsgi_app = wsgi_app
+        self.threads = threads or int(os.environ.get('CROPBOT_ASGI_THREADS', min(32, (os.cpu_count() or 1) + 4)))
+        self.max_pending = max_pending or int(os.environ.get('CROPBOT_ASGI_MAX_PENDING', self.threads * 4))
+        self.executor: Optional[BoundedExecutor] = None
+        self.ml_routes = None
+        blueprint = wsgi_app.blueprints.get('crop')
+        if blueprint is not None and blueprint.import_name.endswith('routes.crop'):
+            self.ml_routes = sys.modules[blueprint.import_name]
+        self.native_routes: Dict[Tuple[str, str], Callable[..., Awaitable[None]]] = {}
+        if self.ml_routes is not None:
+            self.native_routes[('POST', '/api/crop/chat')] = self.chat
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if self.executor is None:
+            self.executor = BoundedExecutor(self.threads, self.max_pending)
+        body = await _read_body(receive)
+        if body is None:
+            await _send_response(send, 413, [('content-type', 'application/json')],
+                                 _json_body({'error': 'Request body too large'}))
+            return
+        handler = self.native_routes.get((scope['method'], scope['path']))
+        if handler is not None:
+            await handler(scope, body, send)
+        else:
+            await self.call_wsgi(scope, body, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    from src.serve import preload
+                    self.executor = BoundedExecutor(self.threads, self.max_pending)
+                    await self.executor.run(preload, self.wsgi_app)
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                chatbot = self.ml_routes.chatbot if self.ml_routes is not None else None
+                if chatbot is not None and chatbot.async_llm is not None:
+                    chatbot.async_llm.pool.close()
+                if self.executor is not None:
+                    await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _run_wsgi(self, environ, loop, queue: asyncio.Queue, disconnected: threading.Event):
+        """Run the Flask app on one pool thread, passing its output to the event loop
+
+        The response is iterated on the thread that started it, so streamed
+        responses keep their request context.
+        """
+        def put(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        def start_response(status, headers, exc_info=None):
+            put(('start', int(status.split(' ', 1)[0]), headers))
+            return lambda data: put(('body', data))
+
+        iterable = None
+        try:
+            iterable = self.wsgi_app(environ, start_response)
+            for chunk in iterable:
+                if disconnected.is_set():
+                    break
+                if chunk:
+                    put(('body', chunk))
+        except Exception as e:
+            put(('error', e))
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+            put(_END)
+
+    async def call_wsgi(self, scope, body: bytes, send):
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        disconnected = threading.Event()
+        task = asyncio.ensure_future(self.executor.run(self._run_wsgi, _environ(scope, body), loop, queue, disconnected))
+        started = False
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                kind, *values = item
+                if kind == 'error':
+                    if not started:
+                        await _send_response(send, 500, [('content-type', 'text/plain')], b'Internal Server Error')
+                        started = True
+                    break
+                if kind == 'start':
+                    status, headers = values
+                    await send({'type': 'http.response.start', 'status': status,
+                                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                            for name, value in headers]})
+                    started = True
+                else:
+                    await send({'type': 'http.response.body', 'body': values[0], 'more_body': True})
+            if started:
+                await send({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            disconnected.set()
+        finally:
+            disconnected.set()
+            await task
+
+    async def _offload_in_app(self, fn):
+        """Run fn on the pool inside a Flask app context (session persistence needs one)"""
+        def call():
+            with self.wsgi_app.app_context():
+                return fn()
+        return await self.executor.run(call)
+
+    async def chat(self, scope, body: bytes, send):
+        """POST /api/crop/chat of the ML API, with the LLM call as a coroutine"""
+        from src.session_store import SessionStore
+        routes = self.ml_routes
+        headers = [('content-type', 'application/json'), ('access-control-allow-origin', '*')]
+
+        if routes.chatbot is None and not await self.executor.run(routes.init_chatbot):
+            await _send_response(send, 500, headers, _json_body({'error': 'Chatbot initialization failed'}))
+            return
+        chatbot = routes.chatbot
+
+        try:
+            data = json.loads(body or b'null')
+            if not isinstance(data, dict):
+                raise ValueError('Expected a JSON object')
+            if 'message' not in data:
+                await _send_response(send, 400, headers, _json_body({'error': 'Missing message field'}))
+                return
+            user_message = data['message']
+            conversation_history = data.get('conversation_history', [])
+            session_id = data.get('session_id')
+            if session_id or not conversation_history:
+                session_id = session_id or SessionStore.new_session_id()
+                conversation_history = await self._offload_in_app(
+                    lambda: routes.get_session_store().history(session_id))
+        except Exception as e:
+            await _send_response(send, 500, headers, _json_body({'error': f'Internal server error: {str(e)}'}))
+            return
+
+        streaming = data.get('stream') or 'text/event-stream' in _headers(scope).get('accept', '')
+        parts = []
+        if streaming:
+            headers[0] = ('content-type', 'text/event-stream; charset=utf-8')
+            headers += [('cache-control', 'no-cache'), ('x-accel-buffering', 'no')]
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+            await send({'type': 'http.response.body', 'body': b': stream open\n\n', 'more_body': True})
+        try:
+            async for text in chatbot.astream_user_input(user_message, conversation_history, self.executor.run):
+                parts.append(text)
+                if streaming:
+                    await send({'type': 'http.response.body', 'more_body': True,
+                                'body': routes.sse_event('token', {'text': text}).encode('utf-8')})
+        except OSError:
+            return
+        except Exception as e:
+            error = {'error': f'Internal server error: {str(e)}'}
+            if streaming:
+                await send({'type': 'http.response.body', 'body': routes.sse_event('error', error).encode('utf-8')})
+            else:
+                await _send_response(send, 500, headers, _json_body(error))
+            return
+
+        response_text = ''.join(parts)
+        if session_id is not None:
+            await self._offload_in_app(lambda: routes.get_session_store().append(
+                session_id,
+                {'role': 'user', 'content': user_message},
+                {'role': 'assistant', 'content': response_text}))
+        payload = {
+            'success': True,
+            'user_message': user_message,
+            'bot_response': response_text,
+            'session_id': session_id,
+            'timestamp': str(routes.np.datetime64('now'))
+        }
+        if streaming:
+            await send({'type': 'http.response.body', 'body': routes.sse_event('done', payload).encode('utf-8')})
+        else:
+            await _send_response(send, 200, headers, _json_body(payload))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'executor': self.executor.stats() if self.executor is not None else None,
+            'native_routes': [f'{method} {path}' for method, path in self.native_routes],
+        }
+
+
+app = CropAPI(flask_app)
+
+
+if __name__ == "__main__":
+    # In-process load test: slow LLM chats in flight while recommendations are timed.
+    # Run with CROPBOT_API=ml and OPENAI_BASE_URL pointing at llm_stub_server.py;
+    # --bridge sends chats through the Flask app too, for comparison.
+    import time
+
+    async def request(method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+                 'headers': [(b'content-type', b'application/json')], 'server': ('localhost', 8000),
+                 'client': ('127.0.0.1', 0)}
+        sent = iter([{'type': 'http.request', 'body': body, 'more_body': False}])
+        status = []
+
+        async def receive():
+            return next(sent, {'type': 'http.disconnect'})
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+        await app(scope, receive, send)
+        return status[0]
+
+    async def main(chats: int = 200, recommends: int = 50):
+        conditions = {'N': 90, 'P': 42, 'K': 43, 'temperature': 20.88, 'humidity': 82.0, 'ph': 6.5, 'rainfall': 202.94}
+        await request('POST', '/api/crop/recommend', conditions)
+
+        async def timed_recommends():
+            latencies = []
+            for _ in range(recommends):
+                start = time.perf_counter()
+                await request('POST', '/api/crop/recommend', conditions)
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+            return sorted(latencies)
+
+        start = time.perf_counter()
+        # With history the answer cache is skipped, so every chat reaches the LLM
+        history = [{'role': 'user', 'content': 'Hello'}, {'role': 'assistant', 'content': 'Hello! Ask me about crops.'}]
+        chat_tasks = [asyncio.ensure_future(request('POST', '/api/crop/chat', {
+            'message': 'How do I grow rice?', 'conversation_history': history})) for _ in range(chats)]
+        latencies = await timed_recommends()
+        statuses = await asyncio.gather(*chat_tasks)
+        elapsed = time.perf_counter() - start
+        print(f"{chats} chats ({'native' if app.native_routes else 'via Flask'}): "
+              f"{statuses.count(200)} ok in {elapsed:.2f}s")
+        print(f"recommend latency while chatting: p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f}ms")
+        print(f"executor: {app.executor.stats()}")
+
+    if '--bridge' in sys.argv:
+        app.native_routes.clear()
+    asyncio.run(main())
@@ -1,25 +1,120 @@
-import openai
+import asyncio
 import json
-import joblib
+import os
+import time
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple, Any
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from artifacts import ArtifactStore
+from recommendation_cache import RecommendationCache
+from knowledge_index import KnowledgeIndex, KNOWLEDGE_FILES, format_passages
+from llm_client import AsyncLLMClient, LLMClient, LLMError
+from semantic_cache import SemanticCache
+from prompt_builder import PromptBuilder
+from entity_extractor import extract_conditions, is_follow_up
+from crop_registry import CropRegistry, default_registry
+
+class RecommendationResult:
+    """A single crop recommendation, computed once and rendered on demand"""
+
+    def __init__(self, conditions: Dict[str, float], recommended_crop: str,
+                 top_crops: List[Tuple[str, float]], crop_details: Dict[str, Any]):
+        self.conditions = conditions
+        self.recommended_crop = recommended_crop
+        self.top_crops = top_crops
+        self.crop_details = crop_details
+
+    def to_markdown(self) -> str:
+        """Format a comprehensive crop recommendation"""
+        c = self.conditions
+        best_crop = self.recommended_crop
+        recommendation = f"""Based on your soil and climate conditions:
+- Nitrogen (N): {c['N']}
+- Phosphorus (P): {c['P']}
+- Potassium (K): {c['K']}
+- Temperature: {c['temperature']}°C
+- Humidity: {c['humidity']}%
+- pH: {c['ph']}
+- Rainfall: {c['rainfall']}mm
+
+**Recommended Crop: {best_crop.title()}**
+
+**Top 3 Recommendations:**
+"""
+        for i, (crop, confidence) in enumerate(self.top_crops, 1):
+            recommendation += f"{i}. {crop.title()} (Confidence: {confidence:.1%})\n"
+        
+        # Add crop-specific details
+        crop_details = self.crop_details
+        if crop_details:
+            recommendation += f"\n**Optimal conditions for {best_crop.title()}:**\n"
+            recommendation += f"- Average N requirement: {crop_details['avg_N']:.1f}\n"
+            recommendation += f"- Average P requirement: {crop_details['avg_P']:.1f}\n"
+            recommendation += f"- Average K requirement: {crop_details['avg_K']:.1f}\n"
+            recommendation += f"- Temperature range: {crop_details['temperature_range'][0]:.1f}-{crop_details['temperature_range'][1]:.1f}°C\n"
+            recommendation += f"- Humidity range: {crop_details['humidity_range'][0]:.1f}-{crop_details['humidity_range'][1]:.1f}%\n"
+            recommendation += f"- pH range: {crop_details['ph_range'][0]:.1f}-{crop_details['ph_range'][1]:.1f}\n"
+            recommendation += f"- Rainfall range: {crop_details['rainfall_range'][0]:.1f}-{crop_details['rainfall_range'][1]:.1f}mm\n"
+        
+        return recommendation
+
+    def to_dict(self, include_formatted: bool = False) -> Dict[str, Any]:
+        """Build the JSON response body; the markdown text is only rendered when asked for"""
+        response = {
+            'success': True,
+            'input_conditions': dict(self.conditions),
+            'recommended_crop': self.recommended_crop,
+            'top_recommendations': [
+                {'crop': crop, 'confidence': float(confidence)}
+                for crop, confidence in self.top_crops
+            ],
+            'crop_details': self.crop_details
+        }
+        if include_formatted:
+            response['formatted_recommendation'] = self.to_markdown()
+        return response
 
 class CropChatbot:
-    def __init__(self):
-        # Load the trained model and label encoder
-        self.model = joblib.load('/home/ubuntu/crop_recommendation_model.pkl')
-        self.label_encoder = joblib.load('/home/ubuntu/label_encoder.pkl')
+    def __init__(self, engine: str = None, artifacts: ArtifactStore = None,
+                 recommendation_cache: RecommendationCache = None, llm: LLMClient = None,
+                 response_cache: SemanticCache = None, registry: CropRegistry = None):
+        # 'sklearn' scores with the pickled forest, 'compiled' with the array-backed engine
+        self.engine = engine or os.environ.get('CROPBOT_ENGINE', 'sklearn')
+        if self.engine not in ('sklearn', 'compiled'):
+            raise ValueError(f"Unknown inference engine: {self.engine}")
+        
+        # Model and knowledge files are loaded on first use (or by warmup())
+        self.artifacts = artifacts or ArtifactStore()
         
-        # Load knowledge bases
-        with open('/home/ubuntu/crop_info.json', 'r') as f:
-            self.crop_info = json.load(f)
+        # Per-crop statistics, swapped in without a restart when crop_info.json changes;
+        # the process-wide registry, shared with the blueprints
+        self.registry = registry or default_registry()
         
-        with open('/home/ubuntu/agricultural_knowledge.json', 'r') as f:
-            self.agricultural_knowledge = json.load(f)
+        # Repeat and near-identical readings skip the forest entirely; entries
+        # are dropped (and the model reloaded) when the model file changes
+        self.recommendation_cache = recommendation_cache or RecommendationCache(
+            version_fn=self._model_version, on_invalidate=self._reload_model
+        )
         
-        with open('/home/ubuntu/quick_agricultural_facts.json', 'r') as f:
-            self.quick_facts = json.load(f)
+        # Search index over the knowledge files, built on first use
+        self._knowledge_index = None
+        
+        # Prompt assembly with the static system prefix, built on first chat
+        self._prompt_builder = None
+        
+        # Pooled, deadline-bound chat completions client (OPENAI_BASE_URL may
+        # point at llm_stub_server.py for offline load tests)
+        self.llm = llm or LLMClient.from_env()
+        
+        # Its asyncio counterpart for the ASGI app, created inside the event loop on first use
+        self.async_llm: Optional[AsyncLLMClient] = None
+        
+        # LLM answers to history-free questions, keyed on normalized text and
+        # kept across restarts until a knowledge file changes
+        self.response_cache = response_cache or SemanticCache.from_env(
+            default_path=os.path.join(self.artifacts.base_dir, 'chat_cache.json'),
+            version_fn=self._knowledge_version
+        )
         
         # System prompt for the chatbot
         self.system_prompt = """You are an expert agricultural advisor and crop recommendation specialist. You have access to:
@@ -37,20 +132,151 @@ Your role is to:
 
 Always provide helpful, accurate, and practical advice. When making crop recommendations, explain the reasoning behind your suggestions. Be conversational but professional, and ask clarifying questions when needed."""
 
+    @property
+    def model(self):
+        if self.engine == 'compiled':
+            # Same probabilities as the sklearn forest, without importing sklearn
+            return self.artifacts.get('forest')
+        return self.artifacts.get('model')
+
+    @property
+    def label_encoder(self):
+        if self.engine == 'compiled':
+            return self.artifacts.get('forest_label_encoder')
+        return self.artifacts.get('label_encoder')
+
+    @property
+    def crop_info(self) -> Dict[str, Any]:
+        return self.registry.snapshot.crop_info()
+
+    @property
+    def agricultural_knowledge(self) -> Dict[str, Any]:
+        return self.artifacts.get('agricultural_knowledge')
+
+    @property
+    def quick_facts(self) -> Dict[str, Any]:
+        return self.artifacts.get('quick_facts')
+
+    @property
+    def knowledge_index(self) -> KnowledgeIndex:
+        if self._knowledge_index is None:
+            index = KnowledgeIndex()
+            for name in KNOWLEDGE_FILES:
+                index.add_json_file(name, self.artifacts.paths[name])
+            # Per-crop guidance, re-indexed when the registry loads a new snapshot
+            index.add_source('crop_data', lambda: self.registry.snapshot.crop_data(),
+                             lambda: self.registry.snapshot.version)
+            self._knowledge_index = index
+        return self._knowledge_index
+
+    @property
+    def prompt_builder(self) -> PromptBuilder:
+        if self._prompt_builder is None:
+            # Everything that does not depend on the message is serialized once
+            system_prefix = f"""{self.system_prompt}
+
+Agricultural Knowledge Available:
+- Crop Categories: {json.dumps(self.agricultural_knowledge['crop_categories'], separators=(',', ':'))}
+- Available crops for recommendation: {', '.join(self.label_encoder.classes_)}"""
+            self._prompt_builder = PromptBuilder.from_env(system_prefix, self.knowledge_index)
+        return self._prompt_builder
+
+    def _knowledge_version(self):
+        return [self.artifacts.version(name) for name in KNOWLEDGE_FILES] + [self.registry.file_versions()]
+
+    def _model_artifacts(self) -> List[str]:
+        if self.engine == 'compiled':
+            return ['forest', 'forest_label_encoder']
+        return ['model', 'label_encoder']
+
+    def _model_version(self):
+        return self.artifacts.version('model'), self.artifacts.version('label_encoder')
+
+    def _reload_model(self):
+        self.artifacts.refresh(['model', 'label_encoder', 'forest'])
+
+    def warmup(self) -> Dict[str, float]:
+        """Load every artifact this chatbot needs now instead of on the first request"""
+        names = self._model_artifacts() + ['agricultural_knowledge', 'quick_facts']
+        load_times = self.artifacts.warmup(names)
+        start = time.perf_counter()
+        self.crop_info
+        load_times['crop_info'] = time.perf_counter() - start
+        start = time.perf_counter()
+        self.knowledge_index
+        load_times['knowledge_index'] = time.perf_counter() - start
+        return load_times
+
+    def recommend(self, N: float, P: float, K: float, temperature: float,
+                  humidity: float, ph: float, rainfall: float, top_k: int = 3) -> RecommendationResult:
+        """Run the model once and collect everything needed to answer a recommendation"""
+        conditions = {
+            'N': N,
+            'P': P,
+            'K': K,
+            'temperature': temperature,
+            'humidity': humidity,
+            'ph': ph,
+            'rainfall': rainfall
+        }
+        
+        cache_key = self.recommendation_cache.key(conditions, top_k)
+        top_crops = self.recommendation_cache.get(cache_key)
+        if top_crops is None:
+            features = np.array([[N, P, K, temperature, humidity, ph, rainfall]])
+            probabilities = self.model.predict_proba(features)[0]
+            
+            # Descending by probability, ties broken by class index so the first
+            # entry is exactly the argmax that model.predict would return
+            top_indices = np.argsort(-probabilities, kind='stable')[:top_k]
+            class_names = self.label_encoder.classes_
+            top_crops = [(class_names[idx], float(probabilities[idx])) for idx in top_indices]
+            self.recommendation_cache.put(cache_key, top_crops)
+        
+        best_crop = top_crops[0][0]
+        return RecommendationResult(conditions, best_crop, top_crops, self.get_crop_details(best_crop))
+
     def predict_crop(self, N: float, P: float, K: float, temperature: float, 
                     humidity: float, ph: float, rainfall: float) -> Tuple[str, List[Tuple[str, float]]]:
         """Predict the best crop for given conditions"""
-        features = np.array([[N, P, K, temperature, humidity, ph, rainfall]])
-        prediction = self.model.predict(features)[0]
-        crop_name = self.label_encoder.inverse_transform([prediction])[0]
-        
-        # Get prediction probabilities
-        probabilities = self.model.predict_proba(features)[0]
-        top_3_indices = np.argsort(probabilities)[-3:][::-1]
-        top_3_crops = [(self.label_encoder.inverse_transform([idx])[0], probabilities[idx]) 
-                      for idx in top_3_indices]
-        
-        return crop_name, top_3_crops
+        result = self.recommend(N, P, K, temperature, humidity, ph, rainfall)
+        return result.recommended_crop, result.top_crops
+
+    def predict_crops_batch(self, features, top_k: int = 3) -> Tuple[List[str], List[List[Tuple[str, float]]]]:
+        """Predict the best crops for many rows of conditions in one inference pass
+
+        `features` is an (n_rows, 7) array-like in the order
+        N, P, K, temperature, humidity, ph, rainfall.
+        """
+        features = np.asarray(features, dtype=np.float64)
+        if features.ndim != 2 or features.shape[1] != 7:
+            raise ValueError(f"Expected an (n_rows, 7) feature matrix, got shape {features.shape}")
+        if features.shape[0] == 0:
+            return [], []
+
+        probabilities = self.model.predict_proba(features)
+        n_classes = probabilities.shape[1]
+        k = max(1, min(top_k, n_classes))
+
+        # Unordered top-k per row, then sort just those k columns
+        if k < n_classes:
+            top_indices = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+        else:
+            top_indices = np.tile(np.arange(n_classes), (features.shape[0], 1))
+        top_probabilities = np.take_along_axis(probabilities, top_indices, axis=1)
+        order = np.argsort(-top_probabilities, axis=1, kind='stable')
+        top_indices = np.take_along_axis(top_indices, order, axis=1)
+        top_probabilities = np.take_along_axis(top_probabilities, order, axis=1)
+
+        # Decode every label in one lookup instead of one inverse_transform per item
+        top_names = np.asarray(self.label_encoder.classes_)[top_indices]
+        best_crops = top_names[:, 0].tolist()
+        top_crops = [
+            list(zip(names, map(float, probs)))
+            for names, probs in zip(top_names.tolist(), top_probabilities)
+        ]
+
+        return best_crops, top_crops
 
     def get_crop_details(self, crop_name: str) -> Dict[str, Any]:
         """Get detailed information about a specific crop"""
@@ -61,114 +287,160 @@ Always provide helpful, accurate, and practical advice. When making crop recomme
     def format_crop_recommendation(self, N: float, P: float, K: float, temperature: float, 
                                  humidity: float, ph: float, rainfall: float) -> str:
         """Format a comprehensive crop recommendation"""
-        best_crop, top_crops = self.predict_crop(N, P, K, temperature, humidity, ph, rainfall)
-        
-        recommendation = f"""Based on your soil and climate conditions:
-- Nitrogen (N): {N}
-- Phosphorus (P): {P}
-- Potassium (K): {K}
-- Temperature: {temperature}°C
-- Humidity: {humidity}%
-- pH: {ph}
-- Rainfall: {rainfall}mm
+        return self.recommend(N, P, K, temperature, humidity, ph, rainfall).to_markdown()
 
-**Recommended Crop: {best_crop.title()}**
+    def search_knowledge(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
+        """Top-k knowledge passages relevant to a free-text query"""
+        return [passage.to_dict(score) for score, passage in self.knowledge_index.search(query, k=k)]
 
-**Top 3 Recommendations:**
-"""
-        for i, (crop, confidence) in enumerate(top_crops, 1):
-            recommendation += f"{i}. {crop.title()} (Confidence: {confidence:.1%})\n"
-        
-        # Add crop-specific details
-        crop_details = self.get_crop_details(best_crop)
-        if crop_details:
-            recommendation += f"\n**Optimal conditions for {best_crop.title()}:**\n"
-            recommendation += f"- Average N requirement: {crop_details['avg_N']:.1f}\n"
-            recommendation += f"- Average P requirement: {crop_details['avg_P']:.1f}\n"
-            recommendation += f"- Average K requirement: {crop_details['avg_K']:.1f}\n"
-            recommendation += f"- Temperature range: {crop_details['temperature_range'][0]:.1f}-{crop_details['temperature_range'][1]:.1f}°C\n"
-            recommendation += f"- Humidity range: {crop_details['humidity_range'][0]:.1f}-{crop_details['humidity_range'][1]:.1f}%\n"
-            recommendation += f"- pH range: {crop_details['ph_range'][0]:.1f}-{crop_details['ph_range'][1]:.1f}\n"
-            recommendation += f"- Rainfall range: {crop_details['rainfall_range'][0]:.1f}-{crop_details['rainfall_range'][1]:.1f}mm\n"
+    def get_agricultural_advice(self, topic: str, k: int = 3) -> str:
+        """Get specific agricultural advice on various topics"""
+        return self.advice_with_passages(topic, k=k)[0]
+
+    def advice_with_passages(self, topic: str, k: int = 3) -> Tuple[str, List[Dict[str, Any]]]:
+        """Advice text on a topic and the passages it was built from, from a single search"""
+        passages = self.knowledge_index.search(topic, k=k)
+        if not passages:
+            return "I can help with pest management, fertilizers, irrigation, crop diseases, sustainable practices, and harvesting. What specific topic would you like to know about?", []
         
-        return recommendation
+        return format_passages(passages), [passage.to_dict(score) for score, passage in passages]
 
-    def get_agricultural_advice(self, topic: str) -> str:
-        """Get specific agricultural advice on various topics"""
-        topic_lower = topic.lower()
-        
-        if 'pest' in topic_lower:
-            return json.dumps(self.agricultural_knowledge['pest_management'], indent=2)
-        elif 'fertilizer' in topic_lower or 'nutrient' in topic_lower:
-            return json.dumps(self.agricultural_knowledge['fertilizer_recommendations'], indent=2)
-        elif 'irrigation' in topic_lower or 'water' in topic_lower:
-            return json.dumps(self.agricultural_knowledge['irrigation_practices'], indent=2)
-        elif 'disease' in topic_lower:
-            return json.dumps(self.agricultural_knowledge['crop_diseases'], indent=2)
-        elif 'sustainable' in topic_lower or 'organic' in topic_lower:
-            return json.dumps(self.agricultural_knowledge['sustainable_practices'], indent=2)
-        elif 'harvest' in topic_lower:
-            return json.dumps(self.agricultural_knowledge['harvesting_guidelines'], indent=2)
-        else:
-            return "I can help with pest management, fertilizers, irrigation, crop diseases, sustainable practices, and harvesting. What specific topic would you like to know about?"
+    def _chat_messages(self, user_message: str, conversation_history: List[Dict] = None) -> List[Dict]:
+        """System prefix, relevant knowledge and as much history as the token budget allows"""
+        return self.prompt_builder.build(user_message, conversation_history).messages
+
+    def _llm_error_message(self, error: Exception) -> str:
+        return f"I apologize, but I'm having trouble connecting to my AI service. However, I can still help you with crop recommendations and agricultural advice using my built-in knowledge. Error: {str(error)}"
 
     def chat_with_openai(self, user_message: str, conversation_history: List[Dict] = None) -> str:
         """Generate response using OpenAI API with agricultural context"""
-        if conversation_history is None:
-            conversation_history = []
-        
-        # Prepare context with agricultural knowledge
-        context = f"""
-Agricultural Knowledge Available:
-- Crop Categories: {json.dumps(self.agricultural_knowledge['crop_categories'])}
-- Quick Facts: {json.dumps(self.quick_facts)}
-- Available crops for recommendation: {', '.join(self.label_encoder.classes_)}
-
-User Message: {user_message}
-"""
+        # Answers that depend on earlier turns are not reusable
+        use_cache = not conversation_history
+        if use_cache:
+            cached = self.response_cache.get(user_message)
+            if cached is not None:
+                return cached
         
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": context}
-        ]
+        try:
+            answer = self.llm.complete(self._chat_messages(user_message, conversation_history),
+                                       max_tokens=1000, temperature=0.7)
+        except LLMError as e:
+            return self._llm_error_message(e)
         
-        # Add conversation history
-        messages.extend(conversation_history)
+        if use_cache:
+            self.response_cache.put(user_message, answer)
+        return answer
+
+    def stream_chat_with_openai(self, user_message: str, conversation_history: List[Dict] = None) -> Iterator[str]:
+        """Like chat_with_openai, but yields the answer token by token as it arrives"""
+        use_cache = not conversation_history
+        if use_cache:
+            cached = self.response_cache.get(user_message)
+            if cached is not None:
+                yield cached
+                return
         
+        parts = []
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=1000,
-                temperature=0.7
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"I apologize, but I'm having trouble connecting to my AI service. However, I can still help you with crop recommendations and agricultural advice using my built-in knowledge. Error: {str(e)}"
-
-    def process_user_input(self, user_input: str) -> str:
-        """Process user input and provide appropriate response"""
+            for text in self.llm.stream(self._chat_messages(user_message, conversation_history),
+                                        max_tokens=1000, temperature=0.7):
+                parts.append(text)
+                yield text
+        except LLMError as e:
+            yield self._llm_error_message(e)
+            return
+        
+        if use_cache:
+            self.response_cache.put(user_message, ''.join(parts))
+
+    def _earlier_conditions(self, conversation_history: List[Dict] = None) -> Dict[str, float]:
+        """Values the user gave in turns we answered with a follow-up question"""
+        earlier: Dict[str, float] = {}
+        turns = [turn for turn in conversation_history or [] if turn.get('role') in ('user', 'assistant')]
+        # Walk back over (user, follow-up) pairs; stop at the first turn that was answered otherwise
+        index = len(turns) - 1
+        while index >= 1 and turns[index]['role'] == 'assistant' and is_follow_up(turns[index]['content']) \
+                and turns[index - 1]['role'] == 'user':
+            for field, value in extract_conditions(turns[index - 1]['content']).values.items():
+                earlier.setdefault(field, value)
+            index -= 2
+        return earlier
+
+    def answer_locally(self, user_input: str, conversation_history: List[Dict] = None) -> Optional[str]:
+        """Answer from the model or knowledge base, or None if the LLM is needed"""
         user_input_lower = user_input.lower()
         
-        # Check if user is asking for crop recommendation with specific values
-        if any(keyword in user_input_lower for keyword in ['recommend', 'suggest', 'predict', 'best crop']):
-            # Try to extract numerical values for crop prediction
-            try:
-                # This is a simplified extraction - in a real app, you'd use more sophisticated NLP
-                numbers = [float(s) for s in user_input.split() if s.replace('.', '').isdigit()]
-                if len(numbers) >= 7:
-                    N, P, K, temp, humidity, ph, rainfall = numbers[:7]
-                    return self.format_crop_recommendation(N, P, K, temp, humidity, ph, rainfall)
-            except:
-                pass
+        # Soil and climate values go straight to the model, or to a question about what is missing
+        conditions = extract_conditions(user_input)
+        if conditions.values or conditions.invalid:
+            earlier = self._earlier_conditions(conversation_history)
+            if earlier or conditions.wants_recommendation or len(conditions.values) + len(conditions.invalid) >= 2:
+                conditions = conditions.merged_over(earlier)
+                if conditions.complete:
+                    return self.format_crop_recommendation(**conditions.values)
+                return conditions.follow_up_question()
         
         # Check for specific agricultural topics
         if any(keyword in user_input_lower for keyword in ['pest', 'fertilizer', 'irrigation', 'disease', 'sustainable', 'harvest']):
             advice = self.get_agricultural_advice(user_input)
             return f"Here's information about {user_input}:\n\n{advice}"
         
+        return None
+
+    def process_user_input(self, user_input: str, conversation_history: List[Dict] = None) -> str:
+        """Process user input and provide appropriate response"""
+        answer = self.answer_locally(user_input, conversation_history)
+        if answer is not None:
+            return answer
+        
         # Use OpenAI for general conversation
-        return self.chat_with_openai(user_input)
+        return self.chat_with_openai(user_input, conversation_history)
+
+    def stream_user_input(self, user_input: str, conversation_history: List[Dict] = None) -> Iterator[str]:
+        """process_user_input as a stream: local answers in one piece, LLM answers token by token"""
+        answer = self.answer_locally(user_input, conversation_history)
+        if answer is not None:
+            yield answer
+            return
+        
+        yield from self.stream_chat_with_openai(user_input, conversation_history)
+
+    async def astream_user_input(self, user_input: str, conversation_history: List[Dict] = None,
+                                 offload: Callable[..., Awaitable[Any]] = None) -> AsyncIterator[str]:
+        """stream_user_input for asyncio
+
+        Local answers, cache lookups and prompt building are CPU work and run
+        through `offload(fn, *args)` (by default the loop's executor); the
+        LLM call itself is a coroutine, so waiting on it holds no thread.
+        """
+        if offload is None:
+            offload = lambda fn, *args: asyncio.get_running_loop().run_in_executor(None, fn, *args)
+        answer = await offload(self.answer_locally, user_input, conversation_history)
+        if answer is not None:
+            yield answer
+            return
+        
+        use_cache = not conversation_history
+        if use_cache:
+            cached = await offload(self.response_cache.get, user_input)
+            if cached is not None:
+                yield cached
+                return
+        
+        if self.async_llm is None:
+            self.async_llm = AsyncLLMClient.from_env()
+        messages = await offload(self._chat_messages, user_input, conversation_history)
+        parts = []
+        try:
+            async for text in self.async_llm.stream(messages, max_tokens=1000, temperature=0.7):
+                parts.append(text)
+                yield text
+        except LLMError as e:
+            yield self._llm_error_message(e)
+            return
+        
+        if use_cache:
+            await offload(self.response_cache.put, user_input, ''.join(parts))
 
 # Test the chatbot
 if __name__ == "__main__":
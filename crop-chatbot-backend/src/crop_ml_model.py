@@ -6,6 +6,7 @@ from sklearn.metrics import accuracy_score, classification_report, confusion_mat
 from sklearn.preprocessing import LabelEncoder
 import joblib
 import json
+from crop_stats import CropStatsAggregator
 
 # Load the dataset
 df = pd.read_csv('/home/ubuntu/upload/Crop_recommendation.csv')
@@ -43,25 +44,7 @@ joblib.dump(model, '/home/ubuntu/crop_recommendation_model.pkl')
 joblib.dump(label_encoder, '/home/ubuntu/label_encoder.pkl')
 
 # Save crop information for the chatbot
-crop_info = {}
-for crop in label_encoder.classes_:
-    crop_data = df[df['label'] == crop]
-    crop_info[crop] = {
-        'avg_N': float(crop_data['N'].mean()),
-        'avg_P': float(crop_data['P'].mean()),
-        'avg_K': float(crop_data['K'].mean()),
-        'avg_temperature': float(crop_data['temperature'].mean()),
-        'avg_humidity': float(crop_data['humidity'].mean()),
-        'avg_ph': float(crop_data['ph'].mean()),
-        'avg_rainfall': float(crop_data['rainfall'].mean()),
-        'N_range': [float(crop_data['N'].min()), float(crop_data['N'].max())],
-        'P_range': [float(crop_data['P'].min()), float(crop_data['P'].max())],
-        'K_range': [float(crop_data['K'].min()), float(crop_data['K'].max())],
-        'temperature_range': [float(crop_data['temperature'].min()), float(crop_data['temperature'].max())],
-        'humidity_range': [float(crop_data['humidity'].min()), float(crop_data['humidity'].max())],
-        'ph_range': [float(crop_data['ph'].min()), float(crop_data['ph'].max())],
-        'rainfall_range': [float(crop_data['rainfall'].min()), float(crop_data['rainfall'].max())]
-    }
+crop_info = CropStatsAggregator().update(X, y).crop_info(label_encoder.classes_)
 
 with open('/home/ubuntu/crop_info.json', 'w') as f:
     json.dump(crop_info, f, indent=2)
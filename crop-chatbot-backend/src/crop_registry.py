@@ -0,0 +1,314 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rule_engine import RULE_FEATURES, FEATURE_ALIASES, parse_range
+
+logger = logging.getLogger(__name__)
+
+# Default file names, relative to the artifact directory
+REGISTRY_FILE = 'crop_registry.json'
+CROP_INFO_FILE = 'crop_info.json'
+
+GUIDANCE_TYPES = ('fielding', 'management', 'maintenance')
+
+# Names the offline (browser) model uses for nutrient ranges
+OFFLINE_NUTRIENT_NAMES = {'N': 'nitrogen', 'P': 'phosphorus', 'K': 'potassium'}
+
+
+def _load_json(path: str) -> Any:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _stat(path: str) -> Tuple[int, int]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _intern_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a flat dict with its keys and short string values interned"""
+    return {
+        sys.intern(key): sys.intern(value) if isinstance(value, str) and len(value) <= 32 else value
+        for key, value in data.items()
+    }
+
+
+class CropRecord:
+    """Curated facts and guidance for one crop"""
+
+    __slots__ = ('key', 'index', 'name', 'category', 'description', 'conditions', 'guidance')
+
+    def __init__(self, key: str, index: int, data: Dict[str, Any]):
+        self.key = sys.intern(key)
+        self.index = index
+        self.name = sys.intern(data.get('name', key.title()))
+        self.category = sys.intern(data.get('category', 'other'))
+        self.description = data.get('description', '')
+        self.conditions = _intern_dict(data.get('optimal_conditions', {}))
+        self.guidance = {
+            sys.intern(guidance_type): _intern_dict(data[guidance_type])
+            for guidance_type in GUIDANCE_TYPES if guidance_type in data
+        }
+
+    def to_dict(self, detailed: bool = True) -> Dict[str, Any]:
+        """The crop as the API has always returned it; without guidance when not `detailed`"""
+        data = {
+            'name': self.name,
+            'category': self.category,
+            'optimal_conditions': dict(self.conditions),
+            'description': self.description,
+        }
+        if detailed:
+            data.update(self.guidance)
+        return data
+
+
+class CropStats:
+    """Per-feature statistics of one crop in the training data
+
+    Averages, observed ranges and standard deviations are parsed into
+    arrays (NaN where a file predates them); the sample count and the
+    percentile bands are kept as given.
+    """
+
+    __slots__ = ('key', 'averages', 'ranges', 'stds', 'sample_count', 'percentiles')
+
+    def __init__(self, key: str, data: Dict[str, Any]):
+        self.key = sys.intern(key)
+        self.averages = np.array([data.get(f'avg_{feature}', np.nan) for feature in RULE_FEATURES], dtype=np.float64)
+        self.ranges = np.array([data.get(f'{feature}_range', (np.nan, np.nan)) for feature in RULE_FEATURES],
+                               dtype=np.float64)
+        self.stds = np.array([data.get(f'std_{feature}', np.nan) for feature in RULE_FEATURES], dtype=np.float64)
+        self.sample_count = data.get('sample_count')
+        self.percentiles = {feature: dict(data[f'{feature}_percentiles']) for feature in RULE_FEATURES
+                            if isinstance(data.get(f'{feature}_percentiles'), dict)}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The crop_info.json entry for this crop"""
+        data: Dict[str, Any] = {}
+        for column, feature in enumerate(RULE_FEATURES):
+            if not np.isnan(self.averages[column]):
+                data[f'avg_{feature}'] = float(self.averages[column])
+        for column, feature in enumerate(RULE_FEATURES):
+            if not np.isnan(self.ranges[column, 0]):
+                data[f'{feature}_range'] = [float(self.ranges[column, 0]), float(self.ranges[column, 1])]
+        if self.sample_count is not None:
+            data['sample_count'] = self.sample_count
+        for column, feature in enumerate(RULE_FEATURES):
+            if not np.isnan(self.stds[column]):
+                data[f'std_{feature}'] = float(self.stds[column])
+        for feature, bands in self.percentiles.items():
+            data[f'{feature}_percentiles'] = dict(bands)
+        return data
+
+
+class RegistrySnapshot:
+    """One immutable, fully loaded view of the crop data
+
+    `lower` and `upper` hold every crop's optimal ranges (rows in registry
+    order, columns in RULE_FEATURES order, NaN where unset), parsed once.
+    Dict views for the API are built on first use and kept with the
+    snapshot, so a reload never mutates what a concurrent request is reading.
+    """
+
+    __slots__ = ('version', 'crops', 'index', 'lower', 'upper', 'stats', '_views', '_lock')
+
+    def __init__(self, version: int, crop_data: Dict[str, Dict[str, Any]], crop_info: Dict[str, Dict[str, Any]]):
+        self.version = version
+        self.crops = tuple(CropRecord(key, row, crop_data[key]) for row, key in enumerate(crop_data))
+        self.index = {record.key: record for record in self.crops}
+        self.lower = np.full((len(self.crops), len(RULE_FEATURES)), np.nan)
+        self.upper = np.full((len(self.crops), len(RULE_FEATURES)), np.nan)
+        for record in self.crops:
+            data = crop_data[record.key]
+            nutrients = data.get('nutrient_ranges', {})
+            for column, feature in enumerate(RULE_FEATURES):
+                parsed = None
+                if feature in nutrients:
+                    parsed = parse_range(nutrients[feature], feature)
+                else:
+                    for alias in FEATURE_ALIASES[feature]:
+                        if alias in record.conditions:
+                            parsed = parse_range(record.conditions[alias], feature)
+                            break
+                if parsed is not None:
+                    self.lower[record.index, column], self.upper[record.index, column] = parsed
+        self.lower.flags.writeable = False
+        self.upper.flags.writeable = False
+        self.stats = {key: CropStats(key, data) for key, data in crop_info.items()}
+        self._views: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _view(self, name: str, build: Callable[[], Any]) -> Any:
+        view = self._views.get(name)
+        if view is None:
+            with self._lock:
+                view = self._views.get(name)
+                if view is None:
+                    view = self._views[name] = build()
+        return view
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def get(self, key: str) -> Optional[CropRecord]:
+        return self.index.get(key)
+
+    def keys(self) -> List[str]:
+        return [record.key for record in self.crops]
+
+    def crop_data(self, detailed: bool = True) -> Dict[str, Dict[str, Any]]:
+        """Crop key -> API dict, in registry order"""
+        return self._view(f'crop_data:{detailed}', lambda: {
+            record.key: record.to_dict(detailed) for record in self.crops
+        })
+
+    def categories(self) -> Dict[str, List[str]]:
+        """Category -> crop keys, in registry order"""
+        def build():
+            categories: Dict[str, List[str]] = {}
+            for record in self.crops:
+                categories.setdefault(record.category, []).append(record.key)
+            return categories
+        return self._view('categories', build)
+
+    def crop_info(self) -> Dict[str, Dict[str, Any]]:
+        """Training-data statistics per crop, in crop_info.json's format"""
+        return self._view('crop_info', lambda: {key: stats.to_dict() for key, stats in self.stats.items()})
+
+    def offline_table(self) -> Dict[str, Dict[str, Any]]:
+        """Crop table for the browser's offline model: every range as a [low, high] pair"""
+        def build():
+            table = {}
+            for record in self.crops:
+                conditions = {}
+                for column, feature in enumerate(RULE_FEATURES):
+                    if not np.isnan(self.lower[record.index, column]):
+                        name = OFFLINE_NUTRIENT_NAMES.get(feature, feature)
+                        conditions[name] = [float(self.lower[record.index, column]),
+                                            float(self.upper[record.index, column])]
+                table[record.key] = {**record.to_dict(), 'optimal_conditions': conditions}
+            return table
+        return self._view('offline_table', build)
+
+
+class CropRegistry:
+    """Crop data shared by every blueprint, reloaded when its files change
+
+    Curated crop facts come from crop_registry.json and training-data
+    statistics from crop_info.json. Paths resolve like ArtifactStore's:
+    the arguments, then CROPBOT_CROP_REGISTRY_PATH / CROPBOT_CROP_INFO_PATH,
+    then CROPBOT_ARTIFACT_DIR (default src/). File mtimes are checked at
+    most every `check_interval` seconds; a changed file is loaded into a new
+    snapshot that replaces the old one in a single assignment, and
+    subscribers are then called with it. A file that fails to load leaves
+    the previous snapshot in place.
+    """
+
+    def __init__(self, path: Optional[str] = None, crop_info_path: Optional[str] = None,
+                 check_interval: float = 1.0):
+        base_dir = os.environ.get('CROPBOT_ARTIFACT_DIR') or os.path.dirname(os.path.abspath(__file__))
+        self.path = path or os.environ.get('CROPBOT_CROP_REGISTRY_PATH') or os.path.join(base_dir, REGISTRY_FILE)
+        self.crop_info_path = (crop_info_path or os.environ.get('CROPBOT_CROP_INFO_PATH')
+                               or os.path.join(base_dir, CROP_INFO_FILE))
+        self.check_interval = check_interval
+        self._files: Tuple[Tuple[int, int], ...] = ()
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[RegistrySnapshot], None]] = []
+        self.reloads = 0
+        self.load_time = 0.0
+        self._snapshot = RegistrySnapshot(0, {}, {})
+        self.refresh(force=True)
+
+    def file_versions(self) -> Tuple[Tuple[int, int], ...]:
+        """(mtime, size) of the registry and crop info files, for caches of data derived from them"""
+        return (_stat(self.path), _stat(self.crop_info_path))
+
+    def _load(self, path: str) -> Dict[str, Any]:
+        return _load_json(path) if os.path.exists(path) else {}
+
+    @property
+    def snapshot(self) -> RegistrySnapshot:
+        """The current snapshot; hold on to it for the length of a request"""
+        self.refresh()
+        return self._snapshot
+
+    def subscribe(self, callback: Callable[[RegistrySnapshot], None]):
+        """Call `callback(snapshot)` after every reload"""
+        self._subscribers.append(callback)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload if either file changed on disk; returns whether a new snapshot was swapped in"""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        with self._lock:
+            self._next_check = now + self.check_interval
+            files = self.file_versions()
+            if files == self._files and not force:
+                return False
+            start = time.perf_counter()
+            try:
+                snapshot = RegistrySnapshot(self._snapshot.version + 1, self._load(self.path),
+                                            self._load(self.crop_info_path))
+            except (OSError, ValueError):
+                # Usually a file caught mid-write; the next check retries
+                logger.exception("Could not load crop registry, keeping version %d", self._snapshot.version)
+                return False
+            self._snapshot = snapshot
+            self._files = files
+            self.reloads += 1
+            self.load_time = time.perf_counter() - start
+        logger.info("Crop registry version %d loaded in %.1f ms", snapshot.version, self.load_time * 1000)
+        for callback in self._subscribers:
+            callback(snapshot)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version,
+            'crops': len(snapshot.crops),
+            'crop_stats': len(snapshot.stats),
+            'reloads': self.reloads,
+            'load_time_ms': round(self.load_time * 1000, 3),
+        }
+
+
+_default_registry: Optional[CropRegistry] = None
+_default_lock = threading.Lock()
+
+
+def default_registry() -> CropRegistry:
+    """The process-wide registry every blueprint reads from"""
+    global _default_registry
+    if _default_registry is None:
+        with _default_lock:
+            if _default_registry is None:
+                _default_registry = CropRegistry()
+    return _default_registry
+
+
+if __name__ == "__main__":
+    registry = CropRegistry()
+    snapshot = registry.snapshot
+    print(f"Loaded {len(snapshot.crops)} crops and {len(snapshot.stats)} crop statistics "
+          f"in {registry.load_time * 1000:.1f}ms")
+    print(f"Categories: {snapshot.categories()}")
+
+    repeats = 100000
+    start = time.perf_counter()
+    for _ in range(repeats):
+        registry.snapshot.crop_data()
+    print(f"Snapshot access: {(time.perf_counter() - start) / repeats * 1e6:.2f}us")
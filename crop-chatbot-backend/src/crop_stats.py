@@ -0,0 +1,326 @@
+"""Per-crop statistics of the training data in one pass over chunks
+
+CropStatsAggregator keeps, for every crop and feature, the count, mean and
+sum of squared deviations (merged with Chan's parallel formula), min, max
+and a quantile sketch. Rows can arrive in any number of chunks, and
+aggregators built on separate chunks, in separate processes, merge into
+the same result as one built on all the rows. The sketch stores counts
+in logarithmic buckets (as in DDSketch): every percentile it reports is
+within RELATIVE_ACCURACY of a value of that rank, and merging sketches
+just adds the counts.
+
+    python src/crop_stats.py Crop_recommendation.csv
+"""
+import math
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+FEATURE_NAMES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Percentiles written to crop_info.json as `<feature>_percentiles` {"p5": ..., ...}
+PERCENTILES = (5, 25, 50, 75, 95)
+PERCENTILE_DECIMALS = 3
+
+# Rows aggregated at a time when splitting an in-memory dataset
+CHUNK_ROWS = 1_000_000
+
+# Sketch layout, fixed so that any two sketches can be merged: magnitudes
+# below MIN_MAGNITUDE count as zero and those above MAX_MAGNITUDE share the
+# top bucket (their percentiles are still clipped to the exact min and max)
+RELATIVE_ACCURACY = 0.005
+MIN_MAGNITUDE = 1e-3
+MAX_MAGNITUDE = 1e5
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_KEY_MIN = math.ceil(math.log(MIN_MAGNITUDE) / _LOG_GAMMA)
+_KEYS = math.ceil(math.log(MAX_MAGNITUDE) / _LOG_GAMMA) - _KEY_MIN + 1
+# Negative buckets (mirrored), the zero bucket, then positive buckets
+_ZERO_SLOT = _KEYS
+SKETCH_SLOTS = 2 * _KEYS + 1
+
+
+def _slots(values: np.ndarray) -> np.ndarray:
+    """Sketch bucket of every value"""
+    magnitude = np.abs(values)
+    keys = np.ceil(np.log(np.clip(magnitude, MIN_MAGNITUDE, MAX_MAGNITUDE)) / _LOG_GAMMA).astype(np.int64) - _KEY_MIN
+    slots = np.where(values > 0, _ZERO_SLOT + 1 + keys, _ZERO_SLOT - 1 - keys)
+    slots[magnitude < MIN_MAGNITUDE] = _ZERO_SLOT
+    return slots
+
+
+def _slot_values(slots: np.ndarray) -> np.ndarray:
+    """Value each bucket stands for (within RELATIVE_ACCURACY of everything in it)"""
+    offset = slots - _ZERO_SLOT
+    magnitude = 2 * _GAMMA ** (np.abs(offset) - 1 + _KEY_MIN) / (_GAMMA + 1)
+    return np.where(offset == 0, 0.0, np.sign(offset) * magnitude)
+
+
+def _json_float(value: float) -> float:
+    """A float for JSON; float32 values are written as the shortest float that reads back to them"""
+    value = float(value)
+    if math.isfinite(value) and float(np.float32(value)) == value:
+        return float(str(np.float32(value)))
+    return value
+
+
+class CropStatsAggregator:
+    """Mergeable count, mean, variance, min, max and quantile sketch per (crop, feature)"""
+
+    __slots__ = ('feature_names', 'groups', '_index', 'count', 'mean', 'm2', 'min', 'max', 'sketch')
+
+    def __init__(self, feature_names: Sequence[str] = FEATURE_NAMES):
+        self.feature_names = list(feature_names)
+        self.groups: List[str] = []
+        self._index: Dict[str, int] = {}
+        n_features = len(self.feature_names)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros((0, n_features))
+        self.m2 = np.zeros((0, n_features))
+        self.min = np.zeros((0, n_features))
+        self.max = np.zeros((0, n_features))
+        self.sketch = np.zeros((0, n_features, SKETCH_SLOTS), dtype=np.int64)
+
+    def _rows(self, names: Iterable[str]) -> np.ndarray:
+        """Row of each group name, adding rows for new groups"""
+        rows = []
+        for name in names:
+            name = str(name)
+            row = self._index.get(name)
+            if row is None:
+                row = self._index[name] = len(self.groups)
+                self.groups.append(name)
+            rows.append(row)
+        added = len(self.groups) - len(self.count)
+        if added:
+            n_features = len(self.feature_names)
+            self.count = np.concatenate([self.count, np.zeros(added, dtype=np.int64)])
+            self.mean = np.vstack([self.mean, np.zeros((added, n_features))])
+            self.m2 = np.vstack([self.m2, np.zeros((added, n_features))])
+            self.min = np.vstack([self.min, np.full((added, n_features), np.inf)])
+            self.max = np.vstack([self.max, np.full((added, n_features), -np.inf)])
+            self.sketch = np.concatenate([self.sketch, np.zeros((added, n_features, SKETCH_SLOTS), dtype=np.int64)])
+        return np.asarray(rows, dtype=np.intp)
+
+    def update(self, X, labels, categories: Optional[Sequence[str]] = None) -> 'CropStatsAggregator':
+        """Add a chunk of rows; returns self
+
+        `labels` are crop names, a pandas Categorical, or integer codes into
+        `categories`. Rows with a missing value are skipped.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if categories is None and hasattr(labels, 'codes') and hasattr(labels, 'categories'):
+            labels, categories = labels.codes, labels.categories
+        if categories is None:
+            categories, codes = np.unique(np.asarray(labels).astype(str), return_inverse=True)
+        else:
+            codes = np.asarray(labels)
+        valid = (codes >= 0) & ~np.isnan(X).any(axis=1)
+        if not valid.all():
+            X, codes = X[valid], codes[valid]
+        rows = self._rows(categories)[codes]
+
+        n_groups, n_features = len(self.groups), len(self.feature_names)
+        count = np.bincount(rows, minlength=n_groups)
+        sums = np.column_stack([np.bincount(rows, weights=X[:, f], minlength=n_groups) for f in range(n_features)])
+        mean = sums / np.maximum(count, 1)[:, np.newaxis]
+        deviations = (X - mean[rows]) ** 2
+        m2 = np.column_stack([np.bincount(rows, weights=deviations[:, f], minlength=n_groups)
+                              for f in range(n_features)])
+        # Rows grouped by crop (a stable radix sort on small integers), so
+        # each crop's min and max is one contiguous reduction
+        order = np.argsort(rows, kind='stable')
+        present = np.flatnonzero(count)
+        starts = np.concatenate([[0], np.cumsum(count)[:-1]])[present]
+        grouped = X[order]
+        low = np.full((n_groups, n_features), np.inf)
+        high = np.full((n_groups, n_features), -np.inf)
+        if len(present):
+            low[present] = np.minimum.reduceat(grouped, starts)
+            high[present] = np.maximum.reduceat(grouped, starts)
+        flat = (rows[:, np.newaxis] * n_features + np.arange(n_features)) * SKETCH_SLOTS + _slots(X)
+        sketch = np.bincount(flat.ravel(), minlength=n_groups * n_features * SKETCH_SLOTS)
+        self._combine(count, mean, m2, low, high, sketch.reshape(n_groups, n_features, SKETCH_SLOTS))
+        return self
+
+    def merge(self, other: 'CropStatsAggregator') -> 'CropStatsAggregator':
+        """Add another aggregator's rows (e.g. from a worker); returns self"""
+        if other.feature_names != self.feature_names:
+            raise ValueError(f"Cannot merge statistics of {other.feature_names} into {self.feature_names}")
+        rows = self._rows(other.groups)
+        n_groups, n_features = len(self.groups), len(self.feature_names)
+        count = np.zeros(n_groups, dtype=np.int64)
+        mean = np.zeros((n_groups, n_features))
+        m2 = np.zeros((n_groups, n_features))
+        low = np.full((n_groups, n_features), np.inf)
+        high = np.full((n_groups, n_features), -np.inf)
+        sketch = np.zeros((n_groups, n_features, SKETCH_SLOTS), dtype=np.int64)
+        count[rows], mean[rows], m2[rows] = other.count, other.mean, other.m2
+        low[rows], high[rows], sketch[rows] = other.min, other.max, other.sketch
+        self._combine(count, mean, m2, low, high, sketch)
+        return self
+
+    def _combine(self, count, mean, m2, low, high, sketch):
+        """Fold per-group partial results into the totals (Chan et al.'s pairwise update)"""
+        total = (self.count + count)[:, np.newaxis].astype(np.float64)
+        weight = np.divide(count[:, np.newaxis], total, out=np.zeros_like(total), where=total > 0)
+        cross = np.divide(self.count[:, np.newaxis] * count[:, np.newaxis], total,
+                          out=np.zeros_like(total), where=total > 0)
+        delta = mean - self.mean
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2 + delta ** 2 * cross
+        self.count = self.count + count
+        self.min = np.minimum(self.min, low)
+        self.max = np.maximum(self.max, high)
+        self.sketch += sketch
+
+    def save(self, path: str):
+        """Write the full state (not just the summary), so later chunks can still be merged in"""
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, feature_names=np.asarray(self.feature_names), groups=np.asarray(self.groups, dtype=str),
+                                count=self.count, mean=self.mean, m2=self.m2, min=self.min, max=self.max,
+                                sketch=self.sketch, sketch_layout=np.array([RELATIVE_ACCURACY, MIN_MAGNITUDE, MAX_MAGNITUDE]))
+
+    @classmethod
+    def load(cls, path: str) -> 'CropStatsAggregator':
+        with np.load(path) as data:
+            if not np.array_equal(data['sketch_layout'], [RELATIVE_ACCURACY, MIN_MAGNITUDE, MAX_MAGNITUDE]):
+                raise ValueError(f"{path} was saved with a different sketch layout")
+            stats = cls([str(name) for name in data['feature_names']])
+            stats._rows(data['groups'])
+            stats.count, stats.mean, stats.m2 = data['count'], data['mean'], data['m2']
+            stats.min, stats.max, stats.sketch = data['min'], data['max'], data['sketch']
+        return stats
+
+    def percentiles(self, crop: str, percentiles: Sequence[float] = PERCENTILES) -> np.ndarray:
+        """Estimated percentiles of one crop, one row per feature"""
+        row = self._index[crop]
+        cumulative = np.cumsum(self.sketch[row], axis=1)
+        estimates = np.empty((len(self.feature_names), len(percentiles)))
+        for f in range(len(self.feature_names)):
+            ranks = np.asarray(percentiles, dtype=np.float64) / 100 * (self.count[row] - 1)
+            slots = np.searchsorted(cumulative[f], ranks, side='right')
+            estimates[f] = np.clip(_slot_values(slots), self.min[row, f], self.max[row, f])
+        return estimates
+
+    def crop_info(self, crops: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """crop_info.json entries for `crops` (every crop seen, sorted, by default)
+
+        Besides the averages, ranges and sample count, each entry has
+        `std_<feature>` (sample standard deviation) and
+        `<feature>_percentiles` ({"p5": ..., "p95": ...}).
+        """
+        crop_info = {}
+        for crop in (sorted(self.groups) if crops is None else crops):
+            row = self._index.get(str(crop))
+            if row is None or self.count[row] == 0:
+                continue
+            n = int(self.count[row])
+            std = np.sqrt(self.m2[row] / (n - 1)) if n > 1 else np.zeros(len(self.feature_names))
+            bands = self.percentiles(str(crop))
+            entry: Dict[str, Any] = {}
+            for f, feature in enumerate(self.feature_names):
+                entry[f'avg_{feature}'] = float(self.mean[row, f])
+            for f, feature in enumerate(self.feature_names):
+                entry[f'{feature}_range'] = [_json_float(self.min[row, f]), _json_float(self.max[row, f])]
+            entry['sample_count'] = n
+            for f, feature in enumerate(self.feature_names):
+                entry[f'std_{feature}'] = float(std[f])
+            for f, feature in enumerate(self.feature_names):
+                entry[f'{feature}_percentiles'] = {
+                    f'p{percentile:g}': round(float(value), PERCENTILE_DECIMALS)
+                    for percentile, value in zip(PERCENTILES, bands[f])
+                }
+            crop_info[str(crop)] = entry
+        return crop_info
+
+
+def iter_chunks(X, labels, rows: int = CHUNK_ROWS) -> Iterator[Tuple[Any, Any]]:
+    """(X, labels) in slices of `rows` rows"""
+    for start in range(0, len(X), rows):
+        yield X[start:start + rows], labels[start:start + rows]
+
+
+def _aggregate_chunk(feature_names: List[str], X, labels, categories) -> CropStatsAggregator:
+    return CropStatsAggregator(feature_names).update(X, labels, categories)
+
+
+def aggregate(chunks: Iterable[Tuple[Any, Any]], n_jobs: int = 1, categories: Optional[Sequence[str]] = None,
+              feature_names: Sequence[str] = FEATURE_NAMES) -> CropStatsAggregator:
+    """Statistics of every (X, labels) chunk, merged
+
+    With n_jobs > 1 the chunks are aggregated on a process pool, at most
+    two per worker in flight at a time, and the partial results are merged
+    in the parent.
+    """
+    total = CropStatsAggregator(feature_names)
+    if n_jobs <= 1:
+        for X, labels in chunks:
+            total.update(X, labels, categories)
+        return total
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        pending = deque()
+        for X, labels in chunks:
+            if len(pending) >= 2 * n_jobs:
+                total.merge(pending.popleft().result())
+            pending.append(pool.submit(_aggregate_chunk, list(feature_names), np.asarray(X), labels, categories))
+        while pending:
+            total.merge(pending.popleft().result())
+    return total
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Compare streaming crop statistics with per-crop DataFrame filtering')
+    parser.add_argument('csv')
+    parser.add_argument('--chunk-rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    crops = sorted(df['label'].unique())
+
+    start = time.perf_counter()
+    filtered = {}
+    for crop in crops:
+        crop_data = df[df['label'] == crop]
+        filtered[crop] = {feature: (crop_data[feature].mean(), crop_data[feature].std(),
+                                    crop_data[feature].quantile([p / 100 for p in PERCENTILES], interpolation='lower').to_numpy())
+                          for feature in FEATURE_NAMES}
+    filter_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stats = aggregate(iter_chunks(df[FEATURE_NAMES].to_numpy(), df['label'].to_numpy(), args.chunk_rows))
+    crop_info = stats.crop_info(crops)
+    stream_time = time.perf_counter() - start
+
+    # The same rows split in two and merged must give the same answer
+    half = len(df) // 2
+    merged = CropStatsAggregator().update(df[FEATURE_NAMES][:half], df['label'][:half])
+    merged.merge(CropStatsAggregator().update(df[FEATURE_NAMES][half:], df['label'][half:]))
+    merged_info = merged.crop_info(crops)
+    merge_error = max(abs(merged_info[crop][key] - crop_info[crop][key])
+                      for crop in crops for feature in FEATURE_NAMES for key in (f'avg_{feature}', f'std_{feature}'))
+    assert all(merged_info[crop][f'{feature}_percentiles'] == crop_info[crop][f'{feature}_percentiles']
+               for crop in crops for feature in FEATURE_NAMES)
+
+    mean_error = max(abs(crop_info[crop][f'avg_{feature}'] - filtered[crop][feature][0])
+                     for crop in crops for feature in FEATURE_NAMES)
+    std_error = max(abs(crop_info[crop][f'std_{feature}'] - filtered[crop][feature][1])
+                    for crop in crops for feature in FEATURE_NAMES)
+    percentile_error = max(
+        abs(estimate - exact) / max(abs(exact), MIN_MAGNITUDE)
+        for crop in crops for feature in FEATURE_NAMES
+        for estimate, exact in zip(crop_info[crop][f'{feature}_percentiles'].values(), filtered[crop][feature][2]))
+    print(f"{len(df)} rows, {len(crops)} crops")
+    print(f"Per-crop filtering (mean, std, percentiles): {filter_time * 1000:.0f}ms")
+    print(f"One pass in {args.chunk_rows}-row chunks (all statistics): {stream_time * 1000:.0f}ms")
+    print(f"Largest difference: mean {mean_error:.2e}, std {std_error:.2e}, "
+          f"percentiles {percentile_error:.2%} (relative, against the nearest-rank value)")
+    print(f"Two halves merged: largest difference from one pass {merge_error:.2e}, identical percentiles")
@@ -0,0 +1,244 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+FEATURE_NAMES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+LABEL_COLUMN = 'label'
+
+# CSV rows read (and written as one partition) at a time
+CHUNK_ROWS = 1_000_000
+
+MANIFEST = 'manifest.json'
+
+READ_CHUNK = 1024 * 1024
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_npy(path: str, array: np.ndarray):
+    """Write an array so a reader never sees a half-written file"""
+    temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temporary, 'wb') as f:
+        np.save(f, array)
+    os.replace(temporary, path)
+
+
+class DatasetStore:
+    """Training data as append-only columnar partitions on disk
+
+    Each CSV is converted once, CHUNK_ROWS rows at a time, into partitions
+    holding a float32 feature matrix (rows x FEATURE_NAMES) and int16 label
+    codes, saved as .npy files that load memory-mapped. Label names are
+    kept once in the manifest, and codes stay stable as new crops appear.
+    A source is recorded by its content hash; ingesting it again is a
+    no-op while the file is unchanged, and a changed file replaces its old
+    partitions. Peak memory while converting is one chunk, whatever the
+    size of the CSV.
+    """
+
+    def __init__(self, directory: str = 'dataset', chunk_rows: int = CHUNK_ROWS):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self._manifest_path = os.path.join(directory, MANIFEST)
+        self.manifest = self._load_manifest()
+
+    @classmethod
+    def from_env(cls) -> 'DatasetStore':
+        """Store configured from CROPBOT_DATASET_DIR"""
+        return cls(directory=os.environ.get('CROPBOT_DATASET_DIR', 'dataset'))
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if manifest is None or manifest.get('format_version') != FORMAT_VERSION:
+            manifest = {'format_version': FORMAT_VERSION, 'feature_names': FEATURE_NAMES,
+                        'categories': [], 'sources': {}, 'partitions': []}
+        return manifest
+
+    def _save_manifest(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f'{self._manifest_path}.{uuid.uuid4().hex}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(temporary, self._manifest_path)
+
+    def _source_key(self, path: str) -> str:
+        return os.path.abspath(path)
+
+    def is_current(self, path: str) -> bool:
+        """Whether `path` is ingested and unchanged since (checked by mtime and size, then content)"""
+        source = self.manifest['sources'].get(self._source_key(path))
+        if source is None:
+            return False
+        stat = os.stat(path)
+        if source['version'] == [stat.st_mtime_ns, stat.st_size]:
+            return True
+        if source['sha256'] == _file_sha256(path):
+            source['version'] = [stat.st_mtime_ns, stat.st_size]
+            self._save_manifest()
+            return True
+        return False
+
+    def _encode_labels(self, labels: np.ndarray) -> np.ndarray:
+        categories = self.manifest['categories']
+        codes = {name: code for code, name in enumerate(categories)}
+        names, inverse = np.unique(labels.astype(str), return_inverse=True)
+        for name in names:
+            if name not in codes:
+                codes[name] = len(categories)
+                categories.append(str(name))
+        return np.array([codes[name] for name in names], dtype=np.int16)[inverse]
+
+    def ingest_csv(self, path: str) -> List[str]:
+        """Convert a CSV into new partitions unless it is already stored; returns their names"""
+        if self.is_current(path):
+            return []
+        import pandas as pd
+
+        key = self._source_key(path)
+        start = time.perf_counter()
+        stat = os.stat(path)
+        sha256 = _file_sha256(path)
+        old_partitions = [partition for partition in self.manifest['partitions'] if partition['source'] == key]
+
+        added = []
+        dtypes = {name: np.float32 for name in FEATURE_NAMES}
+        dtypes[LABEL_COLUMN] = str
+        reader = pd.read_csv(path, usecols=FEATURE_NAMES + [LABEL_COLUMN], dtype=dtypes, chunksize=self.chunk_rows)
+        for chunk in reader:
+            name = f'part-{uuid.uuid4().hex[:12]}'
+            partition_dir = os.path.join(self.directory, name)
+            os.makedirs(partition_dir)
+            _save_npy(os.path.join(partition_dir, 'features.npy'),
+                      np.ascontiguousarray(chunk[FEATURE_NAMES].to_numpy(dtype=np.float32)))
+            _save_npy(os.path.join(partition_dir, 'labels.npy'), self._encode_labels(chunk[LABEL_COLUMN].to_numpy()))
+            added.append({'name': name, 'source': key, 'rows': len(chunk)})
+
+        # One manifest write switches readers from the old partitions to the new
+        self.manifest['partitions'] = [partition for partition in self.manifest['partitions']
+                                       if partition['source'] != key] + added
+        self.manifest['sources'][key] = {'version': [stat.st_mtime_ns, stat.st_size], 'sha256': sha256,
+                                         'rows': sum(partition['rows'] for partition in added)}
+        self._save_manifest()
+        for partition in old_partitions:
+            self._remove_partition(partition['name'])
+        logger.info("Ingested %s: %d rows in %d partition(s) in %.1fs", path,
+                    self.manifest['sources'][key]['rows'], len(added), time.perf_counter() - start)
+        return [partition['name'] for partition in added]
+
+    def _remove_partition(self, name: str):
+        partition_dir = os.path.join(self.directory, name)
+        for filename in ('features.npy', 'labels.npy'):
+            try:
+                os.remove(os.path.join(partition_dir, filename))
+            except OSError:
+                pass
+        try:
+            os.rmdir(partition_dir)
+        except OSError:
+            pass
+
+    def partitions(self, sources: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Partitions of the given source files (all of them by default), in ingestion order"""
+        if sources is None:
+            return list(self.manifest['partitions'])
+        keys = {self._source_key(path) for path in sources}
+        return [partition for partition in self.manifest['partitions'] if partition['source'] in keys]
+
+    def iter_partitions(self, sources: Optional[Iterable[str]] = None,
+                        mmap_mode: Optional[str] = 'r') -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """(features, label codes) of each partition, memory-mapped by default"""
+        for partition in self.partitions(sources):
+            partition_dir = os.path.join(self.directory, partition['name'])
+            yield (np.load(os.path.join(partition_dir, 'features.npy'), mmap_mode=mmap_mode),
+                   np.load(os.path.join(partition_dir, 'labels.npy'), mmap_mode=mmap_mode))
+
+    def load(self, sources: Optional[Iterable[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(float32 features, label codes) of the given sources
+
+        A single partition comes back memory-mapped, without a copy; several
+        are concatenated into one array each (28 bytes of features and 2 of
+        label per row).
+        """
+        parts = list(self.iter_partitions(sources))
+        if not parts:
+            return np.empty((0, len(FEATURE_NAMES)), dtype=np.float32), np.empty(0, dtype=np.int16)
+        if len(parts) == 1:
+            return parts[0]
+        return (np.concatenate([features for features, _ in parts]),
+                np.concatenate([labels for _, labels in parts]))
+
+    def sample(self, n: int, sources: Optional[Iterable[str]] = None,
+               rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Up to `n` rows drawn without replacement, reading only those rows from the mapped partitions"""
+        rng = rng or np.random.default_rng()
+        parts = list(self.iter_partitions(sources))
+        offsets = np.cumsum([0] + [len(labels) for _, labels in parts])
+        picks = np.sort(rng.choice(int(offsets[-1]), size=min(n, int(offsets[-1])), replace=False))
+        features, labels = [], []
+        for (part_features, part_labels), start, end in zip(parts, offsets[:-1], offsets[1:]):
+            rows = picks[(picks >= start) & (picks < end)] - start
+            features.append(np.asarray(part_features[rows]))
+            labels.append(np.asarray(part_labels[rows]))
+        if not parts:
+            return np.empty((0, len(FEATURE_NAMES)), dtype=np.float32), np.empty(0, dtype=np.int16)
+        return np.concatenate(features), np.concatenate(labels)
+
+    @property
+    def categories(self) -> np.ndarray:
+        """Label names, indexed by code"""
+        return np.asarray(self.manifest['categories'], dtype=object)
+
+    def labels(self, codes: np.ndarray) -> np.ndarray:
+        """Label names of an array of codes"""
+        return self.categories[codes]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'directory': self.directory,
+            'sources': len(self.manifest['sources']),
+            'partitions': len(self.manifest['partitions']),
+            'rows': sum(partition['rows'] for partition in self.manifest['partitions']),
+            'categories': len(self.manifest['categories']),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import resource
+
+    parser = argparse.ArgumentParser(description='Convert training CSVs and time loading them')
+    parser.add_argument('csv', nargs='+')
+    parser.add_argument('--dir', default='dataset')
+    args = parser.parse_args()
+
+    store = DatasetStore(args.dir)
+    for path in args.csv:
+        start = time.perf_counter()
+        added = store.ingest_csv(path)
+        print(f"{path}: {len(added)} new partition(s) in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    X, codes = store.load(args.csv)
+    print(f"Loaded {len(X)} rows in {(time.perf_counter() - start) * 1000:.1f}ms, "
+          f"{X.nbytes + codes.nbytes} bytes, peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB")
+    print(store.stats())
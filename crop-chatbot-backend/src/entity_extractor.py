@@ -0,0 +1,235 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Model inputs, in the order the model expects them
+FIELDS = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# How each field is named back to the user
+FIELD_NAMES = {
+    'N': 'nitrogen (N)',
+    'P': 'phosphorus (P)',
+    'K': 'potassium (K)',
+    'temperature': 'temperature (°C)',
+    'humidity': 'humidity (%)',
+    'ph': 'soil pH',
+    'rainfall': 'rainfall (mm)',
+}
+
+# Plausible range of each field after unit conversion
+FIELD_LIMITS = {
+    'N': (0, 200),
+    'P': (0, 200),
+    'K': (0, 250),
+    'temperature': (-10, 60),
+    'humidity': (0, 100),
+    'ph': (0, 14),
+    'rainfall': (0, 5000),
+}
+
+# Words that name each field; longer alternatives come first so "ph" wins over "p"
+LABELS = {
+    'nitrogen': 'N', 'n': 'N',
+    'phosphorus': 'P', 'phosphorous': 'P', 'phosphate': 'P', 'p': 'P',
+    'potassium': 'K', 'potash': 'K', 'k': 'K',
+    'temperature': 'temperature', 'temp': 'temperature',
+    'humidity': 'humidity', 'humid': 'humidity', 'rh': 'humidity',
+    'ph': 'ph', 'p.h.': 'ph', 'p.h': 'ph',
+    'rainfall': 'rainfall', 'rain': 'rainfall', 'precipitation': 'rainfall',
+}
+
+# Closing line of every follow-up question, so later turns can pick up the values already given
+FOLLOW_UP_EXAMPLE = 'For example: "N 90, P 42, K 43, temperature 21°C, humidity 82%, pH 6.5, rainfall 200mm".'
+
+RECOMMEND_PATTERN = re.compile(
+    r"\b(?:recommend\w*|suggest\w*|predict\w*|best crops?|which crops?|what crops?|"
+    r"what (?:should|can|could) i (?:grow|plant|sow)|what to (?:grow|plant|sow))\b"
+)
+
+_LABEL = r'(?P<label>' + '|'.join(re.escape(label) for label in sorted(LABELS, key=len, reverse=True)) + r')'
+_NUMBER = r'(?P<value>-?\d+(?:\.\d+)?)'
+_UNIT = (r'(?P<unit>(?:°|º|deg(?:rees?)?\s*)?\s*(?:celsius|fahrenheit|c|f)\b|°|%|percent\b|'
+         r'mm\b|millimet(?:er|re)s?\b|cm\b|centimet(?:er|re)s?\b|inch(?:es)?\b|'
+         r'kg(?:\s*/\s*ha)?\b|ppm\b)?')
+
+# "nitrogen: 90", "ph of 6.5", "temp 77 F", "rainfall is around 200mm"
+_LABEL_FIRST = re.compile(
+    r'(?<![\w.])' + _LABEL + r'(?![\w])\s*(?:[:=]|-(?!\d)|\bis\b|\bof\b|\bat\b|\baround\b|\babout\b|\s)*\s*'
+    + _NUMBER + r'\s*' + _UNIT
+)
+
+# "200mm rainfall", "25°C", "80% humidity", "90 kg/ha of nitrogen"
+_VALUE_FIRST = re.compile(
+    r'(?<![\w.])' + _NUMBER + r'\s*' + _UNIT + r'(?:\s*(?:of\s+)?' + _LABEL + r'(?![\w]))?'
+)
+
+# "NPK 90-42-43", "n-p-k: 90/42/43"
+_NPK = re.compile(
+    r'\bn\s*-?\s*p\s*-?\s*k\b\s*(?:[:=]|\bis\b|\bof\b|\s)*\s*'
+    r'(\d+(?:\.\d+)?)\s*[-/,:\s]\s*(\d+(?:\.\d+)?)\s*[-/,:\s]\s*(\d+(?:\.\d+)?)'
+)
+
+_BARE_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])')
+
+# Which field a unit implies when no label is given
+_UNIT_FIELDS = {'c': 'temperature', 'f': 'temperature', '%': 'humidity', 'mm': 'rainfall',
+                'cm': 'rainfall', 'inch': 'rainfall'}
+
+
+def _unit_key(unit: Optional[str]) -> Optional[str]:
+    """Canonical short form of a matched unit"""
+    if not unit:
+        return None
+    unit = unit.strip()
+    if unit.endswith(('fahrenheit', 'f')):
+        return 'f'
+    if unit.endswith(('celsius', 'c')) or unit in ('°', 'º'):
+        return 'c'
+    if unit in ('%', 'percent'):
+        return '%'
+    if unit.startswith(('mm', 'millimet')):
+        return 'mm'
+    if unit.startswith(('cm', 'centimet')):
+        return 'cm'
+    if unit.startswith('inch'):
+        return 'inch'
+    return None
+
+
+def _convert(field: str, value: float, unit: Optional[str]) -> float:
+    """Value in the unit the model was trained on (°C, %, mm)"""
+    if field == 'temperature' and unit == 'f':
+        return round((value - 32.0) * 5.0 / 9.0, 2)
+    if field == 'rainfall' and unit == 'cm':
+        return value * 10.0
+    if field == 'rainfall' and unit == 'inch':
+        return round(value * 25.4, 1)
+    return value
+
+
+class ExtractedConditions:
+    """Soil and climate values found in a message"""
+
+    __slots__ = ('values', 'invalid', 'wants_recommendation')
+
+    def __init__(self, values: Dict[str, float], invalid: Dict[str, float], wants_recommendation: bool):
+        self.values = values
+        self.invalid = invalid
+        self.wants_recommendation = wants_recommendation
+
+    @property
+    def missing(self) -> List[str]:
+        return [field for field in FIELDS if field not in self.values]
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing and not self.invalid
+
+    def merged_over(self, earlier: Dict[str, float]) -> 'ExtractedConditions':
+        """These values on top of ones given earlier in the conversation"""
+        values = dict(earlier)
+        values.update(self.values)
+        return ExtractedConditions(values, self.invalid, self.wants_recommendation)
+
+    def follow_up_question(self) -> str:
+        """Ask for whatever is still missing or out of range"""
+        lines = []
+        if self.values:
+            known = ', '.join(f"{FIELD_NAMES[field]} {self.values[field]:g}" for field in FIELDS if field in self.values)
+            lines.append(f"Got it: {known}.")
+        for field, value in self.invalid.items():
+            low, high = FIELD_LIMITS[field]
+            lines.append(f"A {FIELD_NAMES[field]} of {value:g} looks off; it should be between {low} and {high}.")
+        missing = [FIELD_NAMES[field] for field in self.missing if field not in self.invalid]
+        if missing:
+            lines.append(f"To recommend a crop I still need: {', '.join(missing)}.")
+        lines.append(FOLLOW_UP_EXAMPLE)
+        return '\n'.join(lines)
+
+
+def is_follow_up(answer: str) -> bool:
+    """Whether an assistant answer was a follow-up question asking for values"""
+    return answer.endswith(FOLLOW_UP_EXAMPLE)
+
+
+def extract_conditions(message: str) -> ExtractedConditions:
+    """Labelled and unit-tagged soil and climate values in a message
+
+    Labels may come before the value ("pH 6.5", "nitrogen: 90") or after it
+    ("200mm rainfall"), and a unit alone is enough for temperature,
+    humidity and rainfall ("25°C", "80%", "8 inches"). °F, cm and inches are
+    converted to °C and mm. A message with no labels at all but seven or
+    more numbers is read in model order (N, P, K, temperature, humidity, pH,
+    rainfall), as before.
+    """
+    text = message.lower()
+    found: List[Tuple[int, str, float]] = []
+    taken: List[Tuple[int, int]] = []
+
+    def overlaps(span):
+        return any(start < span[1] and span[0] < end for start, end in taken)
+
+    for match in _NPK.finditer(text):
+        for offset, field in enumerate(('N', 'P', 'K')):
+            found.append((match.start(), field, float(match.group(offset + 1))))
+        taken.append(match.span())
+
+    for match in _LABEL_FIRST.finditer(text):
+        if overlaps(match.span()):
+            continue
+        field = LABELS[match.group('label')]
+        found.append((match.start(), field, _convert(field, float(match.group('value')), _unit_key(match.group('unit')))))
+        taken.append(match.span())
+
+    for match in _VALUE_FIRST.finditer(text):
+        if overlaps(match.span()):
+            continue
+        unit = _unit_key(match.group('unit'))
+        field = LABELS[match.group('label')] if match.group('label') else _UNIT_FIELDS.get(unit)
+        if field is None:
+            continue
+        found.append((match.start(), field, _convert(field, float(match.group('value')), unit)))
+        taken.append(match.span())
+
+    if not found:
+        numbers = [float(number) for number in _BARE_NUMBER.findall(text)]
+        if len(numbers) >= len(FIELDS):
+            found = [(0, field, value) for field, value in zip(FIELDS, numbers)]
+
+    values: Dict[str, float] = {}
+    invalid: Dict[str, float] = {}
+    # Later mentions win, as in "N 80... actually N 90"
+    for _, field, value in sorted(found, key=lambda item: item[0]):
+        low, high = FIELD_LIMITS[field]
+        if low <= value <= high:
+            values[field] = value
+            invalid.pop(field, None)
+        else:
+            invalid[field] = value
+            values.pop(field, None)
+
+    return ExtractedConditions(values, invalid, bool(RECOMMEND_PATTERN.search(text)))
+
+
+if __name__ == "__main__":
+    import time
+
+    messages = [
+        "Recommend a crop for N 90, P 42, K 43, temperature 20.9°C, humidity 82%, pH 6.5, rainfall 203mm",
+        "nitrogen: 90 phosphorus: 42 potassium: 43 temp 69.6 F humidity 82 percent ph of 6.5 and 20.3 cm of rain",
+        "NPK 90-42-43, 21 C, 82% humidity, soil ph 6.5, rainfall around 200 mm. what should I grow?",
+        "what crop for pH 6.5 and 200mm rainfall?",
+        "recommend crop 90 42 43 20.87 82.00 6.50 202.93",
+        "suggest the best crop, rain 8 inches, temperature 25 degrees celsius",
+        "how do I control aphids on cotton?",
+    ]
+    for message in messages:
+        result = extract_conditions(message)
+        print(f"{message}\n  -> {result.values} missing={result.missing} invalid={result.invalid} "
+              f"recommend={result.wants_recommendation}")
+
+    repeats = 5000
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for message in messages:
+            extract_conditions(message)
+    print(f"\n{(time.perf_counter() - start) / (repeats * len(messages)) * 1e6:.1f}us per message")
@@ -0,0 +1,385 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+from typing import Dict, List, Any
+
+# Bumped whenever the on-disk layout of a compiled forest changes
+FORMAT_VERSION = 1
+
+# Leaf bitmasks are stored in 32-bit words so the highest set bit can be
+# found exactly through a float64 conversion
+WORD_BITS = 32
+
+# Rows scored per chunk, which bounds the size of the gathered bitmask block
+CHUNK_ROWS = 1024
+
+ARRAY_NAMES = [
+    'feature', 'threshold', 'left', 'right', 'leaf_values',
+    'node_leaf', 'tree_leaf_offset', 'search_keys', 'prefix_masks'
+]
+
+
+class StoredLabelEncoder:
+    """Minimal stand-in for sklearn's LabelEncoder built from stored class names"""
+
+    def __init__(self, classes: List[str]):
+        self.classes_ = np.asarray(classes, dtype=object)
+        self._index = {name: i for i, name in enumerate(classes)}
+
+    def inverse_transform(self, y):
+        return self.classes_[np.asarray(y, dtype=np.intp)]
+
+    def transform(self, y):
+        return np.array([self._index[name] for name in y], dtype=np.intp)
+
+
+def _float32_floor(values: np.ndarray) -> np.ndarray:
+    """Largest float32 that is <= each float64 value
+
+    sklearn compares float32 inputs against float64 thresholds, so
+    `x <= threshold` is the same test as `x <= _float32_floor(threshold)`.
+    """
+    rounded = values.astype(np.float32)
+    too_high = rounded.astype(np.float64) > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+def _order_keys(values: np.ndarray) -> np.ndarray:
+    """Map float32 values to uint32 keys with the same ordering (NaN sorts last)"""
+    bits = np.ascontiguousarray(values, dtype=np.float32).view(np.uint32)
+    sign = (bits.view(np.int32) >> 31).view(np.uint32)
+    return bits ^ (sign | np.uint32(0x80000000))
+
+
+class CompiledForest:
+    """Array-backed random-forest inference engine
+
+    The trained forest is flattened into contiguous node tables (feature,
+    threshold, left, right) plus a leaf-probability table. Scoring uses the
+    QuickScorer layout derived from those tables: every split is sorted by
+    feature and threshold, and for each feature the AND of the "leaves ruled
+    out" bitmasks of its first k splits is precomputed. One searchsorted per
+    input row then finds k for all seven features at once, and the exit leaf
+    of every tree is the leftmost leaf still set after ANDing seven rows.
+    Probabilities match sklearn's RandomForestClassifier.predict_proba exactly.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        for name in ARRAY_NAMES:
+            # Plain ndarray views keep memory-mapped data without np.memmap's per-op overhead
+            setattr(self, name, np.asarray(arrays[name]))
+        self.meta = meta
+        self.n_trees = int(meta['n_trees'])
+        self.n_features = int(meta['n_features'])
+        self.n_classes = int(meta['n_classes'])
+        self.n_words = int(meta['n_words'])
+        self.class_names = list(meta['class_names'])
+        self.feature_names = list(meta['feature_names'])
+        # Mirrors sklearn: the forest predicts encoded labels 0..n_classes-1
+        self.classes_ = np.arange(self.n_classes)
+        self._feature_offsets = (np.arange(self.n_features, dtype=np.uint64) << np.uint64(32))
+        self._feature_rows = np.arange(self.n_features, dtype=np.intp)
+        # First global leaf index covered by each (word, tree) bitmask word
+        self._word_start = (np.arange(self.n_words, dtype=np.intp) * WORD_BITS)[:, np.newaxis] + self.tree_leaf_offset
+        # frexp exponent of a word -> position of its highest set bit counted from
+        # the left; an empty word (exponent 0) maps past every real leaf
+        self._bit_position = np.concatenate([[len(self.leaf_values)], WORD_BITS - np.arange(1, WORD_BITS + 1)]).astype(np.intp)
+
+    @classmethod
+    def from_sklearn(cls, model, class_names=None, feature_names=None) -> 'CompiledForest':
+        """Flatten a fitted sklearn RandomForestClassifier"""
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        n_classes = int(model.n_classes_)
+        n_features = int(model.n_features_in_)
+        if class_names is None:
+            class_names = [str(c) for c in model.classes_]
+        if feature_names is None:
+            feature_names = [str(f) for f in getattr(model, 'feature_names_in_', range(n_features))]
+
+        node_offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        n_nodes = int(node_offsets[-1])
+        feature = np.full(n_nodes, -1, dtype=np.int32)
+        threshold = np.full(n_nodes, np.nan, dtype=np.float64)
+        left = np.full(n_nodes, -1, dtype=np.int32)
+        right = np.full(n_nodes, -1, dtype=np.int32)
+        node_leaf = np.full(n_nodes, -1, dtype=np.int32)
+
+        leaf_values = []
+        tree_leaf_offset = []
+        split_tree = []
+        split_node = []
+        split_masks = []
+        n_leaves_max = max(int((tree.children_left == -1).sum()) for tree in trees)
+        n_words = (n_leaves_max + WORD_BITS - 1) // WORD_BITS
+        all_ones = np.uint32(0xFFFFFFFF)
+
+        n_leaves_seen = 0
+        for tree_index, (tree, offset) in enumerate(zip(trees, node_offsets)):
+            children_left = tree.children_left
+            children_right = tree.children_right
+            is_leaf = children_left == -1
+            count = tree.node_count
+
+            feature[offset:offset + count] = np.where(is_leaf, -1, tree.feature)
+            threshold[offset:offset + count] = np.where(is_leaf, np.nan, tree.threshold)
+            left[offset:offset + count] = np.where(is_leaf, -1, children_left + offset)
+            right[offset:offset + count] = np.where(is_leaf, -1, children_right + offset)
+
+            # DecisionTreeClassifier.predict_proba returns the stored leaf
+            # fractions as they are; renormalising them would change the
+            # last bits of the sum and break parity
+            values = tree.value[:, 0, :n_classes]
+
+            # Number leaves left to right; each split rules out its left subtree when false
+            leaf_order = []
+            spans = {}
+            stack = [(0, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if is_leaf[node]:
+                    spans[node] = (len(leaf_order), len(leaf_order) + 1)
+                    leaf_order.append(node)
+                elif not expanded:
+                    stack.append((node, True))
+                    stack.append((children_right[node], False))
+                    stack.append((children_left[node], False))
+                else:
+                    spans[node] = (spans[children_left[node]][0], spans[children_right[node]][1])
+
+            for node in range(count):
+                if is_leaf[node]:
+                    continue
+                first, last = spans[children_left[node]]
+                mask = np.full(n_words, all_ones, dtype=np.uint32)
+                for leaf in range(first, last):
+                    mask[leaf // WORD_BITS] &= ~np.uint32(1 << (WORD_BITS - 1 - leaf % WORD_BITS))
+                split_tree.append(tree_index)
+                split_node.append(offset + node)
+                split_masks.append(mask)
+
+            tree_leaf_offset.append(n_leaves_seen)
+            for position, node in enumerate(leaf_order):
+                node_leaf[offset + node] = n_leaves_seen + position
+            leaf_values.append(values[leaf_order])
+            n_leaves_seen += len(leaf_order)
+
+        split_tree = np.asarray(split_tree, dtype=np.intp)
+        split_node = np.asarray(split_node, dtype=np.intp)
+        split_masks = np.asarray(split_masks, dtype=np.uint32).reshape(-1, n_words)
+        split_feature = feature[split_node]
+        split_keys = _order_keys(_float32_floor(threshold[split_node]))
+
+        # Sort splits by (feature, threshold) and build per-feature prefix ANDs,
+        # laid out (row, word, tree) so reductions run over contiguous trees
+        order = np.lexsort((split_keys, split_feature))
+        search_keys = (split_feature[order].astype(np.uint64) << np.uint64(32)) | split_keys[order].astype(np.uint64)
+        prefix_masks = np.empty((len(order) + n_features, n_words, len(trees)), dtype=np.uint32)
+        row = 0
+        position = 0
+        for f in range(n_features):
+            current = np.full((n_words, len(trees)), all_ones, dtype=np.uint32)
+            prefix_masks[row] = current
+            row += 1
+            while position < len(order) and split_feature[order[position]] == f:
+                split = order[position]
+                current[:, split_tree[split]] &= split_masks[split]
+                prefix_masks[row] = current
+                row += 1
+                position += 1
+
+        arrays = {
+            'feature': feature,
+            'threshold': threshold,
+            'left': left,
+            'right': right,
+            'leaf_values': np.concatenate(leaf_values).astype(np.float64),
+            'node_leaf': node_leaf,
+            'tree_leaf_offset': np.asarray(tree_leaf_offset, dtype=np.intp),
+            'search_keys': search_keys,
+            'prefix_masks': prefix_masks,
+        }
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'n_trees': len(trees),
+            'n_features': n_features,
+            'n_classes': n_classes,
+            'n_words': n_words,
+            'class_names': [str(c) for c in class_names],
+            'feature_names': feature_names,
+        }
+        return cls(arrays, meta)
+
+    def save(self, directory: str):
+        """Write the forest as one .npy file per array plus meta.json
+
+        The files go to a new directory that then replaces `directory` in
+        one step (see publish_directory), so no file a running server has
+        memory-mapped is ever rewritten.
+        """
+        staging = f'{os.path.abspath(directory)}.{uuid.uuid4().hex}.tmp'
+        os.makedirs(staging)
+        try:
+            for name in ARRAY_NAMES:
+                np.save(os.path.join(staging, f'{name}.npy'), getattr(self, name))
+            with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                json.dump(self.meta, f, indent=2)
+            publish_directory(staging, directory)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode=None) -> 'CompiledForest':
+        """Load a forest written by save(); pass mmap_mode='r' to memory-map the arrays"""
+        # Resolved once, so every file comes from the same published version
+        directory = os.path.realpath(directory)
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled forest format: {meta.get('format_version')}")
+        arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        return cls(arrays, meta)
+
+    def label_encoder(self) -> StoredLabelEncoder:
+        """Label encoder for this forest that does not need sklearn"""
+        return StoredLabelEncoder(self.class_names)
+
+    def _exit_leaves(self, X: np.ndarray) -> np.ndarray:
+        """Global leaf index reached in every tree, shape (n_rows, n_trees)"""
+        query = _order_keys(X.astype(np.float32)).astype(np.uint64) | self._feature_offsets
+        # Feature f's block of prefix rows starts f rows after its first sorted split
+        rows = np.searchsorted(self.search_keys, query, side='left') + self._feature_rows
+        surviving = np.bitwise_and.reduce(self.prefix_masks.take(rows, axis=0), axis=1)
+
+        # Leftmost surviving leaf = highest set bit of the first non-empty word
+        exponent = np.frexp(surviving.astype(np.float64))[1]
+        position = self._bit_position.take(exponent) + self._word_start
+        return position.min(axis=1)
+
+    def _probabilities(self, X: np.ndarray) -> np.ndarray:
+        # Summing over the tree axis adds trees in order, as sklearn does
+        return self.leaf_values.take(self._exit_leaves(X), axis=0).sum(axis=1) / self.n_trees
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Class probabilities for 1..N rows, identical to sklearn's forest"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, but the forest expects {self.n_features}")
+
+        if X.shape[0] <= CHUNK_ROWS:
+            return self._probabilities(X)
+        return np.concatenate([
+            self._probabilities(X[start:start + CHUNK_ROWS])
+            for start in range(0, X.shape[0], CHUNK_ROWS)
+        ])
+
+    def predict(self, X) -> np.ndarray:
+        """Encoded label of the most probable class for each row"""
+        return self.predict_proba(X).argmax(axis=1)
+
+
+def publish_directory(staging: str, directory: str):
+    """Make the fully written `staging` directory the contents of `directory`, atomically
+
+    `directory` becomes a symlink to a versioned sibling (crop_forest.v<id>),
+    and a new version is published by renaming a new link over it. Readers
+    open either the old files or the new ones, never a mix, and files that
+    are already memory-mapped stay untouched until unlinked (which leaves
+    existing mappings valid). The version just replaced is kept for loads
+    already under way; older ones are removed. Concurrent publishers are
+    serialized with a lock file (.crop_forest.lock). `staging` must be on
+    the same filesystem as `directory`.
+    """
+    parent, base = os.path.split(os.path.abspath(directory))
+    version = f'{base}.v{uuid.uuid4().hex[:12]}'
+    # Publishers (a worker recompiling, a training run, a cache restore) take
+    # turns, so none removes a version another is about to link
+    with open(os.path.join(parent, f'.{base}.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        os.replace(staging, os.path.join(parent, version))
+        previous = None
+        if os.path.islink(directory):
+            previous = os.path.basename(os.readlink(directory))
+        elif os.path.isdir(directory):
+            # A plain directory from before versioned publishing: moved aside,
+            # which leaves a short window in which the path does not exist
+            previous = f'{base}.v{uuid.uuid4().hex[:12]}'
+            os.replace(directory, os.path.join(parent, previous))
+        link = os.path.join(parent, f'.{base}.{uuid.uuid4().hex}.link')
+        os.symlink(version, link)
+        os.replace(link, directory)
+        for name in os.listdir(parent):
+            if name.startswith(f'{base}.v') and name not in (version, previous):
+                shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+def load_or_compile(directory: str, model_path: str, encoder_path: str, mmap_mode=None) -> CompiledForest:
+    """Load a compiled forest, (re)building it from the pickled model when missing or older
+
+    A rebuild publishes a new version of `directory` (see CompiledForest.save),
+    so forests other workers have mapped keep working.
+    """
+    meta_path = os.path.join(directory, 'meta.json')
+    if not os.path.exists(meta_path) or os.path.getmtime(model_path) > os.path.getmtime(meta_path):
+        import joblib
+        model = joblib.load(model_path)
+        label_encoder = joblib.load(encoder_path)
+        CompiledForest.from_sklearn(model, class_names=label_encoder.classes_).save(directory)
+    return CompiledForest.load(directory, mmap_mode=mmap_mode)
+
+
+def check_parity(forest: CompiledForest, model, X) -> bool:
+    """True when the compiled forest reproduces sklearn's probabilities bit for bit"""
+    return bool(np.array_equal(forest.predict_proba(X), model.predict_proba(X)))
+
+
+# Compile the shipped model, check parity with sklearn and time single-row scoring
+if __name__ == "__main__":
+    import joblib
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    model = joblib.load(os.path.join(base_dir, 'crop_recommendation_model.pkl'))
+    label_encoder = joblib.load(os.path.join(base_dir, 'label_encoder.pkl'))
+
+    forest = CompiledForest.from_sklearn(model, class_names=label_encoder.classes_)
+    output_dir = os.path.join(base_dir, 'crop_forest')
+    forest.save(output_dir)
+    forest = CompiledForest.load(output_dir, mmap_mode='r')
+    print(f"Compiled {forest.n_trees} trees to {output_dir}")
+
+    # Random samples spanning the training ranges, plus the shipped example row
+    rng = np.random.default_rng(42)
+    low = np.array([0, 5, 5, 8, 14, 3.5, 20])
+    high = np.array([140, 145, 205, 44, 100, 9.9, 300])
+    X = np.vstack([[90, 42, 43, 20.88, 82.00, 6.50, 202.94], rng.uniform(low, high, size=(5000, 7))])
+    print(f"Parity with sklearn on {len(X)} rows: {'OK' if check_parity(forest, model, X) else 'MISMATCH'}")
+
+    # The shipped pickle predates this sklearn; a forest fitted here (on the
+    # shipped model's labels for the same rows) checks the installed version
+    from sklearn.ensemble import RandomForestClassifier
+    fresh = RandomForestClassifier(n_estimators=100, max_depth=10, min_samples_split=5, min_samples_leaf=2,
+                                   random_state=0).fit(X.astype(np.float32), model.predict(X))
+    fresh_forest = CompiledForest.from_sklearn(fresh)
+    X_check = rng.uniform(low, high, size=(5000, 7))
+    print(f"Parity with a freshly fitted forest on {len(X_check)} rows: "
+          f"{'OK' if check_parity(fresh_forest, fresh, X_check) else 'MISMATCH'}")
+
+    row = X[:1]
+    for name, predict in [('sklearn', model.predict_proba), ('compiled', forest.predict_proba)]:
+        repeats = 20 if name == 'sklearn' else 5000
+        predict(row)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            predict(row)
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"{name:>8} single-row predict_proba: {elapsed * 1e6:.1f}us")
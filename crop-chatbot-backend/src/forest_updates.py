@@ -0,0 +1,158 @@
+"""Grow a trained forest with trees fitted on new data only
+
+Instead of refitting every tree on old plus new data, an update fits a few
+trees on the new rows and adds them to the forest. In a rolling window the
+oldest trees are dropped to keep the forest at a fixed size. The cost is
+proportional to the new rows. Each tree's origin (source file, row count,
+update) is recorded in a provenance file kept next to the model, listed
+in the same order as `model.estimators_`.
+
+    python src/training_pipeline.py --update region_samples.csv --trees 10 --window 100
+"""
+import copy
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PROVENANCE_FORMAT = 1
+
+
+def expand_tree(tree, classes: np.ndarray, n_classes: int):
+    """Make a tree fitted on some of the classes report probabilities for all `n_classes`
+
+    `classes` are the forest-wide class indices of the tree's own columns.
+    Returns the tree, changed in place.
+    """
+    from sklearn.tree._tree import Tree
+
+    if tree.n_classes_ == n_classes and np.array_equal(classes, np.arange(n_classes)):
+        return tree
+    state = tree.tree_.__getstate__()
+    values = np.zeros((state['values'].shape[0], 1, n_classes), dtype=state['values'].dtype)
+    values[:, :, classes] = state['values']
+    state['values'] = values
+    expanded = Tree(tree.n_features_in_, np.array([n_classes], dtype=np.intp), 1)
+    expanded.__setstate__(state)
+    tree.tree_ = expanded
+    tree.n_classes_ = n_classes
+    tree.classes_ = np.arange(n_classes, dtype=np.float64)
+    return tree
+
+
+def fit_trees(X, y, n_classes: int, n_trees: int, params: Dict[str, Any], random_state: int,
+              n_jobs: Optional[int] = None) -> List[Any]:
+    """`n_trees` bootstrapped trees fitted on (X, y), where y holds class indices of the full forest"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    params = {name: value for name, value in params.items() if name != 'n_estimators'}
+    forest = RandomForestClassifier(n_estimators=n_trees, random_state=random_state, n_jobs=n_jobs, **params)
+    forest.fit(X, y)
+    classes = forest.classes_.astype(np.intp)
+    return [expand_tree(tree, classes, n_classes) for tree in forest.estimators_]
+
+
+def initial_provenance(n_trees: int, sources: Sequence[str], rows: int) -> Dict[str, Any]:
+    """Provenance of a forest trained from scratch on `sources`"""
+    update = {
+        'id': uuid.uuid4().hex[:12],
+        'mode': 'full',
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'sources': [os.path.abspath(path) for path in sources],
+        'rows': int(rows),
+        'trees_added': n_trees,
+        'trees_removed': 0,
+    }
+    return {
+        'format_version': PROVENANCE_FORMAT,
+        'trees': [{'update': update['id'], 'sources': update['sources'], 'rows': update['rows']}] * n_trees,
+        'updates': [update],
+    }
+
+
+def load_provenance(path: str, n_trees: int, default_sources: Sequence[str]) -> Dict[str, Any]:
+    """Provenance saved with the model; a forest without one is taken to come from `default_sources`"""
+    try:
+        with open(path, 'r') as f:
+            provenance = json.load(f)
+    except (OSError, ValueError):
+        provenance = None
+    if (provenance is None or provenance.get('format_version') != PROVENANCE_FORMAT
+            or len(provenance['trees']) != n_trees):
+        provenance = initial_provenance(n_trees, default_sources, 0)
+        provenance['updates'][0]['mode'] = 'unknown'
+    return provenance
+
+
+def save_provenance(provenance: Dict[str, Any], path: str):
+    temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(provenance, f, indent=2)
+    os.replace(temporary, path)
+
+
+def provenance_sources(provenance: Dict[str, Any]) -> List[str]:
+    """Every source file some tree of the forest was fitted on, oldest first"""
+    sources = []
+    for tree in provenance['trees']:
+        for source in tree['sources']:
+            if source not in sources:
+                sources.append(source)
+    return sources
+
+
+def applied_before(provenance: Dict[str, Any], source: str, source_hash: Optional[str]) -> bool:
+    """Whether an earlier update used this exact file (same path and content)"""
+    source = os.path.abspath(source)
+    return source_hash is not None and any(
+        update.get('sha256') == source_hash and source in update['sources'] for update in provenance['updates'])
+
+
+def add_trees(model, trees: List[Any], provenance: Dict[str, Any], source: str, rows: int,
+              max_trees: Optional[int] = None, source_hash: Optional[str] = None) -> Tuple[Any, Dict[str, Any]]:
+    """(updated model, updated provenance) with `trees` appended
+
+    With `max_trees`, the oldest trees beyond it are dropped. Neither the
+    given model nor the provenance is modified, so a rejected update leaves
+    them as they were.
+    """
+    update = {
+        'id': uuid.uuid4().hex[:12],
+        'mode': 'append' if max_trees is None else 'rolling',
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'sources': [os.path.abspath(source)],
+        'sha256': source_hash,
+        'rows': int(rows),
+        'trees_added': len(trees),
+    }
+    estimators = list(model.estimators_) + list(trees)
+    records = list(provenance['trees']) + [{'update': update['id'], 'sources': update['sources'],
+                                            'rows': update['rows']}] * len(trees)
+    removed = max(0, len(estimators) - max_trees) if max_trees is not None else 0
+    update['trees_removed'] = removed
+
+    updated = copy.copy(model)
+    updated.estimators_ = estimators[removed:]
+    updated.n_estimators = len(updated.estimators_)
+    return updated, {
+        'format_version': PROVENANCE_FORMAT,
+        'trees': records[removed:],
+        'updates': list(provenance['updates']) + [update],
+    }
+
+
+def summarize(provenance: Dict[str, Any]) -> str:
+    """Trees in the forest per update, oldest first"""
+    counts: Dict[str, int] = {}
+    for tree in provenance['trees']:
+        counts[tree['update']] = counts.get(tree['update'], 0) + 1
+    lines = []
+    for update in provenance['updates']:
+        if update['id'] in counts:
+            sources = ', '.join(os.path.basename(source) for source in update['sources'])
+            lines.append(f"  {update['created']} {update['mode']:>7}: {counts[update['id']]:>3} trees "
+                         f"from {sources} ({update['rows']} rows)")
+    return '\n'.join(lines)
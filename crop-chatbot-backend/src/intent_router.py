@@ -0,0 +1,244 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Words shorter than this are only matched exactly, since one edit turns
+# short words like "corn", "weed" or "wheat" into everyday ones ("what")
+MIN_FUZZY_LENGTH = 6
+
+# Distinct words whose typo lookups are remembered; message vocabulary is
+# small and repetitive, so most words after warmup are answered from here
+FUZZY_CACHE_SIZE = 50000
+
+_WORD_PATTERN = re.compile(r'[a-z]{%d,}' % MIN_FUZZY_LENGTH)
+
+
+def _deletions(word: str) -> List[str]:
+    """The word itself plus every string one character shorter"""
+    return [word] + [word[:i] + word[i + 1:] for i in range(len(word))]
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if a and b differ by one insertion, deletion, substitution or transposition"""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]])
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class IntentMatch:
+    """The intent chosen for a message and the keywords that selected it"""
+
+    __slots__ = ('intent', 'keywords', 'fuzzy', 'candidates')
+
+    def __init__(self, intent: Optional[str], keywords: List[str], fuzzy: bool, candidates: List[str]):
+        self.intent = intent
+        self.keywords = keywords
+        self.fuzzy = fuzzy
+        self.candidates = candidates
+
+    def to_dict(self) -> Dict:
+        return {
+            'intent': self.intent,
+            'matched_keywords': self.keywords,
+            'fuzzy': self.fuzzy,
+            'candidates': self.candidates,
+        }
+
+
+class IntentRouter:
+    """Keyword intents compiled into one Aho-Corasick automaton
+
+    Intents are given in priority order. route() walks the message once,
+    collecting every keyword occurrence, and picks the highest priority
+    intent hit. Keywords match as substrings, so "water" also matches
+    "watering". Each longer word is also looked up in a symmetric-deletion
+    index, which finds keywords within one typo, such as "harvst" or
+    "fertiliser". Typos in the first letter are
+    not corrected, which keeps "later" from reading as "water".
+
+    The automaton is flattened into a DFA (failure links folded into the
+    transition tables) so matching costs one dict lookup per character.
+    """
+
+    def __init__(self, intents: Sequence[Tuple[str, Iterable[str]]]):
+        self.intents = [name for name, _ in intents]
+        self._priority = {name: rank for rank, name in enumerate(self.intents)}
+
+        # Trie as parallel lists: goto transitions, failure links and outputs per state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, str]]] = [[]]
+        self._fuzzy_index: Dict[str, List[Tuple[str, str]]] = {}
+        self._fuzzy_cache: Dict[str, List[Tuple[str, str]]] = {}
+
+        for name, keywords in intents:
+            for keyword in keywords:
+                keyword = keyword.lower()
+                self._add_keyword(keyword, name)
+                if ' ' not in keyword and len(keyword) >= MIN_FUZZY_LENGTH:
+                    for variant in _deletions(keyword):
+                        self._fuzzy_index.setdefault(variant, []).append((keyword, name))
+        self._build_failure_links()
+        self._transitions = self._build_transitions()
+
+    def _add_keyword(self, keyword: str, intent: str):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((keyword, intent))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                # Keywords ending at the failure state also end here
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def _build_transitions(self) -> List[Dict[str, int]]:
+        # States in breadth-first order, so a failure state is always done first
+        order = []
+        queue = deque([0])
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            queue.extend(self._goto[state].values())
+
+        transitions: List[Dict[str, int]] = [{} for _ in self._goto]
+        for state in order:
+            if state:
+                transitions[state].update(transitions[self._fail[state]])
+            transitions[state].update(self._goto[state])
+        return transitions
+
+    def find_all(self, message: str) -> List[Tuple[str, str]]:
+        """Every (keyword, intent) occurring in the message, in one pass"""
+        transitions, output = self._transitions, self._output
+        state = 0
+        hits = []
+        for char in message.lower():
+            state = transitions[state].get(char, 0)
+            if output[state]:
+                hits.extend(output[state])
+        return hits
+
+    def _fuzzy_word(self, word: str) -> List[Tuple[str, str]]:
+        hits = self._fuzzy_cache.get(word)
+        if hits is None:
+            hits = []
+            for variant in _deletions(word):
+                for keyword, intent in self._fuzzy_index.get(variant, ()):
+                    if keyword[0] == word[0] and _within_one_edit(word, keyword):
+                        hits.append((keyword, intent))
+            if len(self._fuzzy_cache) >= FUZZY_CACHE_SIZE:
+                self._fuzzy_cache.clear()
+            self._fuzzy_cache[word] = hits
+        return hits
+
+    def find_fuzzy(self, message: str) -> List[Tuple[str, str]]:
+        """(keyword, intent) pairs within one edit of a word in the message"""
+        hits = []
+        for word in _WORD_PATTERN.findall(message.lower()):
+            hits.extend(self._fuzzy_word(word))
+        return hits
+
+    def route(self, message: str) -> IntentMatch:
+        """Pick the highest priority intent mentioned in the message
+
+        Typos are only considered when no keyword occurs exactly, so a
+        near-miss ("showing" for "sowing") never outranks a real mention.
+        """
+        hits = self.find_all(message)
+        fuzzy = not hits
+        if fuzzy:
+            hits = self.find_fuzzy(message)
+        if not hits:
+            return IntentMatch(None, [], False, [])
+
+        candidates = sorted({intent for _, intent in hits}, key=self._priority.__getitem__)
+        best = candidates[0]
+        keywords = list(dict.fromkeys(keyword for keyword, intent in hits if intent == best))
+        return IntentMatch(best, keywords, fuzzy, candidates)
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import time
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from src.routes.crop_enhanced import CHAT_INTENTS
+
+    router = IntentRouter(CHAT_INTENTS)
+
+    def keyword_chain(message):
+        for name, keywords in CHAT_INTENTS:
+            if any(word in message for word in keywords):
+                return name
+        return None
+
+    messages = [
+        "How should I prepare land for the next season?",
+        "What's the best spacing for maize planting?",
+        "My tomato plants have yellow leaves, is it a nutrient problem?",
+        "Tell me about growing apples in cold regions and how to keep them healthy through winter",
+        "hello there, what can you do?",
+        "when should I harvst my wheat",
+        "which fertlizer works later in the season?",
+        # Everyday words one edit from a keyword (showing/sowing, planning/planting,
+        # seeing/seeding) must not beat the crop they mention
+        "my rice is showing yellow spots",
+        "i am planning to grow wheat",
+        "seeing brown patches on cotton",
+    ]
+    for message in messages:
+        match = router.route(message)
+        exact = keyword_chain(message.lower())
+        print(f"{match.intent!s:>18} (chain: {exact!s:>18}, fuzzy={match.fuzzy}) <- {message}")
+        assert exact is None or match.intent == exact, message
+
+    def benchmark(classify, messages, repeats=20000):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for message in messages:
+                classify(message)
+        return (time.perf_counter() - start) / (repeats * len(messages)) * 1e6
+
+    print(f" keyword chain: {benchmark(lambda m: keyword_chain(m.lower()), messages):.2f}us per message")
+    print(f"     automaton: {benchmark(router.route, messages):.2f}us per message")
+
+    # The chain rescans the message once per keyword; the automaton does not
+    CHAT_INTENTS = CHAT_INTENTS + [
+        (f'topic_{i}', [f'{keyword}{i}' for keyword in keywords])
+        for i in range(10) for _, keywords in CHAT_INTENTS
+    ]
+    router = IntentRouter(CHAT_INTENTS)
+    print(f"With {sum(len(k) for _, k in CHAT_INTENTS)} keywords:")
+    print(f" keyword chain: {benchmark(lambda m: keyword_chain(m.lower()), messages, 2000):.2f}us per message")
+    print(f"     automaton: {benchmark(router.route, messages, 2000):.2f}us per message")
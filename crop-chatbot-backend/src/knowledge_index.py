@@ -0,0 +1,274 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Knowledge files indexed by default, relative to the artifact directory
+KNOWLEDGE_FILES = {
+    'agricultural_knowledge': 'agricultural_knowledge.json',
+    'crop_info': 'crop_info.json',
+    'quick_facts': 'quick_agricultural_facts.json',
+}
+
+# BM25F weight of each passage field; a term in the section path says more
+# about what a passage is about than the same term in its body
+FIELD_WEIGHTS = {
+    'title': 2.5,
+    'body': 1.0,
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a about an and are as at be by can do does for from how i in is it me my of on or should
+tell the this to what when where which who why with you your
+""".split())
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def stem(token: str) -> str:
+    """Light suffix stripping so "pests"/"pest" and "harvesting"/"harvest" meet"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 5 and token.endswith('ing'):
+        return token[:-3]
+    if len(token) > 4 and token.endswith('ed'):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased, stemmed word tokens without stopwords"""
+    return [stem(token) for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def _humanize(key: Any) -> str:
+    return str(key).replace('_', ' ')
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f'{value:.2f}'.rstrip('0').rstrip('.')
+    if isinstance(value, list):
+        if len(value) == 2 and all(isinstance(v, (int, float)) for v in value):
+            return f'{_format_value(value[0])}-{_format_value(value[1])}'
+        return ', '.join(_format_value(v) for v in value)
+    return str(value)
+
+
+def _is_leaf(value: Any) -> bool:
+    return not isinstance(value, (dict, list)) or (
+        isinstance(value, list) and all(not isinstance(v, (dict, list)) for v in value)
+    )
+
+
+def _load_json(path: str) -> Any:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _stat(path: str) -> Tuple[int, int]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class Passage:
+    """One retrievable chunk of a knowledge source"""
+
+    __slots__ = ('source', 'path', 'title', 'text', 'length', 'terms')
+
+    def __init__(self, source: str, path: Tuple[str, ...], text: str):
+        self.source = source
+        self.path = path
+        self.title = ' > '.join(_humanize(part) for part in path)
+        self.text = text
+        # Weighted term frequencies across fields, and the matching weighted length
+        self.terms: Dict[str, float] = {}
+        self.length = 0.0
+        for field, content in (('title', self.title), ('body', text)):
+            weight = FIELD_WEIGHTS[field]
+            for token in tokenize(content):
+                self.terms[token] = self.terms.get(token, 0.0) + weight
+                self.length += weight
+
+    def to_dict(self, score: Optional[float] = None) -> Dict[str, Any]:
+        result = {'source': self.source, 'title': self.title, 'text': self.text}
+        if score is not None:
+            result['score'] = round(score, 4)
+        return result
+
+
+def format_passages(passages: Iterable[Tuple[float, Passage]]) -> str:
+    """Markdown answer text for search results"""
+    return '\n\n'.join(f'**{passage.title.title()}**\n{passage.text}' for _, passage in passages)
+
+
+def split_passages(source: str, data: Any, path: Tuple[str, ...] = ()) -> List[Passage]:
+    """Break a JSON document into passages
+
+    A dict whose values are all scalars or lists of scalars becomes one
+    passage ("key: value" lines). Larger dicts are split by key, with any
+    scalar values of their own kept together in a passage for the dict.
+    """
+    if _is_leaf(data):
+        return [Passage(source, path, _format_value(data))] if path else []
+    items = list(data.items()) if isinstance(data, dict) else list(enumerate(data))
+    if path and all(_is_leaf(value) for _, value in items):
+        text = '\n'.join(f'{_humanize(key)}: {_format_value(value)}' for key, value in items)
+        return [Passage(source, path, text)]
+
+    passages = []
+    scalars = [(key, value) for key, value in items if _is_leaf(value)]
+    if scalars and path:
+        passages.append(Passage(source, path, '\n'.join(f'{_humanize(key)}: {_format_value(value)}' for key, value in scalars)))
+    for key, value in items:
+        if not _is_leaf(value) or not path:
+            passages.extend(split_passages(source, value, path + (str(key),)))
+    return passages
+
+
+class KnowledgeIndex:
+    """BM25F inverted index over JSON knowledge sources
+
+    Each source is registered with a loader and a version function (a file's
+    mtime and size, or any token that changes with in-memory data). Sources
+    are re-checked at most every `check_interval` seconds on search, and a
+    changed source has only its own passages removed from and re-added to
+    the postings.
+    """
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self._sources: Dict[str, Tuple[Callable[[], Any], Callable[[], Hashable]]] = {}
+        self._versions: Dict[str, Hashable] = {}
+        self._source_passages: Dict[str, List[int]] = {}
+        self._passages: Dict[int, Passage] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._total_length = 0.0
+        self._next_id = 0
+        self._next_check = 0.0
+        self._lock = threading.RLock()
+        self.reindexes: Dict[str, int] = {}
+
+    def add_source(self, name: str, load: Callable[[], Any], version: Callable[[], Hashable]):
+        """Register a source and index it now"""
+        with self._lock:
+            self._sources[name] = (load, version)
+            self._index_source(name)
+
+    def add_json_file(self, name: str, path: str):
+        """Register a JSON file, re-indexed whenever it changes on disk"""
+        self.add_source(name, lambda: _load_json(path) if os.path.exists(path) else {}, lambda: _stat(path))
+
+    def _remove_source(self, name: str):
+        for passage_id in self._source_passages.pop(name, []):
+            passage = self._passages.pop(passage_id)
+            self._total_length -= passage.length
+            for term in passage.terms:
+                postings = self._postings[term]
+                del postings[passage_id]
+                if not postings:
+                    del self._postings[term]
+
+    def _index_source(self, name: str):
+        load, version = self._sources[name]
+        self._versions[name] = version()
+        passages = split_passages(name, load())
+        self._remove_source(name)
+        ids = []
+        for passage in passages:
+            passage_id = self._next_id
+            self._next_id += 1
+            self._passages[passage_id] = passage
+            self._total_length += passage.length
+            for term, frequency in passage.terms.items():
+                self._postings.setdefault(term, {})[passage_id] = frequency
+            ids.append(passage_id)
+        self._source_passages[name] = ids
+        self.reindexes[name] = self.reindexes.get(name, 0) + 1
+
+    def refresh(self, force: bool = False) -> List[str]:
+        """Re-index sources whose version changed; returns their names"""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return []
+        changed = []
+        with self._lock:
+            self._next_check = now + self.check_interval
+            for name, (_, version) in self._sources.items():
+                if version() != self._versions.get(name):
+                    self._index_source(name)
+                    changed.append(name)
+        return changed
+
+    def search(self, query: str, k: int = 3, sources: Optional[Iterable[str]] = None) -> List[Tuple[float, Passage]]:
+        """Top-k (score, passage) pairs for a free-text query"""
+        self.refresh()
+        terms = set(tokenize(query))
+        wanted = set(sources) if sources is not None else None
+        with self._lock:
+            count = len(self._passages)
+            if not count or not terms:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for passage_id, frequency in postings.items():
+                    length = self._passages[passage_id].length
+                    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * length / average_length)
+                    scores[passage_id] = scores.get(passage_id, 0.0) + idf * frequency * (BM25_K1 + 1.0) / (frequency + norm)
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            results = []
+            for passage_id, score in ranked:
+                passage = self._passages[passage_id]
+                if wanted is None or passage.source in wanted:
+                    results.append((score, passage))
+                    if len(results) == k:
+                        break
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'passages': len(self._passages),
+            'terms': len(self._postings),
+            'sources': {name: len(ids) for name, ids in self._source_passages.items()},
+            'reindexes': dict(self.reindexes),
+        }
+
+
+if __name__ == "__main__":
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    index = KnowledgeIndex()
+    for name, filename in KNOWLEDGE_FILES.items():
+        index.add_json_file(name, os.path.join(base_dir, filename))
+    print(f"Indexed {index.stats()['passages']} passages in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    queries = ['pest control for cotton', 'fertilizer for rice', 'how much water does banana need',
+               'acidic soil ph', 'when to harvest', 'apple temperature']
+    for query in queries:
+        results = index.search(query, k=2)
+        print(f"\n{query}:")
+        for score, passage in results:
+            print(f"  {score:5.2f}  {passage.title}: {passage.text[:70]!r}")
+
+    repeats = 2000
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for query in queries:
+            index.search(query, k=3)
+    print(f"\n{(time.perf_counter() - start) / (repeats * len(queries)) * 1e6:.1f}us per query")
@@ -0,0 +1,505 @@
+import asyncio
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = 'https://api.openai.com/v1'
+DEFAULT_MODEL = 'gpt-3.5-turbo'
+
+# Upstream statuses worth retrying; anything else 4xx is the caller's fault
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+# Returned by _sse_delta for the stream's closing "data: [DONE]" line
+_DONE = object()
+
+
+def _sse_delta(line: bytes):
+    """Text delta carried by one line of a streamed completion (None for other lines, _DONE at the end)"""
+    line = line.strip()
+    if not line.startswith(b'data:'):
+        return None
+    data = line[5:].strip()
+    if data == b'[DONE]':
+        return _DONE
+    choices = json.loads(data).get('choices') or [{}]
+    return (choices[0].get('delta') or {}).get('content')
+
+
+class LLMError(Exception):
+    """The upstream model could not produce an answer"""
+
+
+class LLMTimeout(LLMError):
+    """The call's deadline passed before the answer (or its next token) arrived"""
+
+
+class LLMBusy(LLMError):
+    """Every concurrent call slot stayed taken until the deadline"""
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to one upstream host
+
+    Connections are handed out one caller at a time and returned after the
+    response has been read to the end; a connection that saw an error is
+    closed instead of returned.
+    """
+
+    def __init__(self, base_url: str, size: int = 8):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.size = size
+        self._idle: 'queue.LifoQueue[http.client.HTTPConnection]' = queue.LifoQueue(maxsize=size)
+        self.created = 0
+
+    def acquire(self, timeout: float) -> http.client.HTTPConnection:
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(self.host, self.port, timeout=timeout)
+            self.created += 1
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection
+
+    def release(self, connection: http.client.HTTPConnection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def discard(self, connection: http.client.HTTPConnection):
+        connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class LLMClient:
+    """OpenAI-compatible chat completions over pooled connections
+
+    Every call has a deadline covering the wait for a concurrency slot,
+    retries and the whole response; streamed calls additionally fail if
+    no token arrives before it. At most `max_concurrency` calls are in
+    flight; callers beyond that wait for a slot only until their deadline.
+    Retries (with jittered backoff) happen only before the first token has
+    been handed to the caller, so a streamed answer is never duplicated.
+    """
+
+    # Variable and default from_env() reads max_concurrency from; each
+    # in-flight call holds a thread, so the limit stays small
+    MAX_CONCURRENCY_ENV = ('CROPBOT_LLM_MAX_CONCURRENCY', '8')
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, api_key: Optional[str] = None,
+                 model: str = DEFAULT_MODEL, timeout: float = 30.0, max_concurrency: int = 8,
+                 max_retries: int = 2, backoff: float = 0.25):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool = ConnectionPool(base_url, size=max_concurrency)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._stats_lock = threading.Lock()
+        self._stats = {'calls': 0, 'errors': 0, 'retries': 0, 'timeouts': 0, 'busy': 0,
+                       'first_token_seconds_total': 0.0, 'first_tokens': 0}
+
+    @classmethod
+    def from_env(cls) -> 'LLMClient':
+        """Client configured from OPENAI_BASE_URL / OPENAI_API_KEY and CROPBOT_LLM_* variables
+
+        Point OPENAI_BASE_URL at llm_stub_server.py to run without network access.
+        """
+        return cls(
+            base_url=os.environ.get('OPENAI_BASE_URL', DEFAULT_BASE_URL),
+            api_key=os.environ.get('OPENAI_API_KEY'),
+            model=os.environ.get('CROPBOT_LLM_MODEL', DEFAULT_MODEL),
+            timeout=float(os.environ.get('CROPBOT_LLM_TIMEOUT', '30')),
+            max_concurrency=int(os.environ.get(*cls.MAX_CONCURRENCY_ENV)),
+            max_retries=int(os.environ.get('CROPBOT_LLM_MAX_RETRIES', '2')),
+        )
+
+    def _count(self, name: str, value: float = 1):
+        with self._stats_lock:
+            self._stats[name] += value
+
+    def _headers(self, stream: bool) -> Dict[str, str]:
+        headers = {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream' if stream else 'application/json',
+            'Connection': 'keep-alive',
+        }
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        return headers
+
+    def _open(self, payload: Dict[str, Any], deadline: float):
+        """Send the request, retrying failed attempts; returns (connection, response)"""
+        body = json.dumps(payload).encode('utf-8')
+        path = self.pool.base_path + '/chat/completions'
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeout(f"No response within {self.timeout:.1f}s")
+            connection = self.pool.acquire(timeout=remaining)
+            try:
+                connection.request('POST', path, body=body, headers=self._headers(payload['stream']))
+                response = connection.getresponse()
+                if response.status == 200:
+                    return connection, response
+                detail = response.read()[:500].decode('utf-8', 'replace')
+                error = LLMError(f"Upstream returned HTTP {response.status}: {detail}")
+                retryable = response.status in RETRYABLE_STATUSES
+                self.pool.release(connection)
+            except (OSError, http.client.HTTPException) as e:
+                self.pool.discard(connection)
+                error = LLMTimeout(str(e)) if isinstance(e, TimeoutError) else LLMError(str(e))
+                retryable = True
+
+            attempt += 1
+            if not retryable or attempt > self.max_retries:
+                raise error
+            self._count('retries')
+            delay = self.backoff * (2 ** (attempt - 1)) * (0.5 + random.random())
+            if time.monotonic() + delay >= deadline:
+                raise error
+            logger.warning("LLM call failed (%s), retrying in %.2fs", error, delay)
+            time.sleep(delay)
+
+    def stream(self, messages: List[Dict[str, str]], max_tokens: int = 1000,
+               temperature: float = 0.7, timeout: Optional[float] = None) -> Iterator[str]:
+        """Yield the answer's text deltas as they arrive"""
+        start = time.monotonic()
+        deadline = start + (timeout if timeout is not None else self.timeout)
+        self._count('calls')
+        if not self._slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            self._count('busy')
+            raise LLMBusy(f"All {self.max_concurrency} LLM slots are in use")
+        connection = None
+        try:
+            payload = {'model': self.model, 'messages': messages, 'max_tokens': max_tokens,
+                       'temperature': temperature, 'stream': True}
+            connection, response = self._open(payload, deadline)
+            first_token = True
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeout(f"Answer not finished within {self.timeout:.1f}s")
+                connection.sock.settimeout(remaining)
+                line = response.readline()
+                if not line:
+                    break
+                text = _sse_delta(line)
+                if text is _DONE:
+                    # Drain the terminating chunk so the connection can be reused
+                    response.read()
+                    break
+                if text:
+                    if first_token:
+                        first_token = False
+                        self._count('first_token_seconds_total', time.monotonic() - start)
+                        self._count('first_tokens')
+                    yield text
+            self.pool.release(connection)
+            connection = None
+        except TimeoutError as e:
+            self._count('timeouts')
+            self._count('errors')
+            raise LLMTimeout(str(e)) from e
+        except LLMError as e:
+            if isinstance(e, LLMTimeout):
+                self._count('timeouts')
+            self._count('errors')
+            raise
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            self._count('errors')
+            raise LLMError(str(e)) from e
+        finally:
+            # Closed mid-stream (error or the consumer went away): the rest of
+            # the response is still on the wire, so the connection can't be reused
+            if connection is not None:
+                self.pool.discard(connection)
+            self._slots.release()
+
+    def complete(self, messages: List[Dict[str, str]], max_tokens: int = 1000,
+                 temperature: float = 0.7, timeout: Optional[float] = None) -> str:
+        """The whole answer as one string"""
+        return ''.join(self.stream(messages, max_tokens=max_tokens, temperature=temperature, timeout=timeout))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        first_tokens = stats.pop('first_tokens')
+        total = stats.pop('first_token_seconds_total')
+        stats['mean_time_to_first_token_ms'] = round(total / first_tokens * 1000, 1) if first_tokens else None
+        stats['connections_created'] = self.pool.created
+        stats['base_url'] = self.base_url
+        return stats
+
+
+class _AsyncResponse:
+    """Status, headers and body lines of one HTTP/1.1 response read from an asyncio stream"""
+
+    def __init__(self, reader: asyncio.StreamReader, status: int, headers: Dict[str, str]):
+        self.reader = reader
+        self.status = status
+        self.headers = headers
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        length = headers.get('content-length')
+        self._remaining = int(length) if length is not None and not self.chunked else None
+        self._buffer = b''
+        self.finished = False
+
+    @classmethod
+    async def read(cls, reader: asyncio.StreamReader) -> '_AsyncResponse':
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Upstream closed the connection")
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+            raise http.client.BadStatusLine(status_line.decode('latin-1', 'replace'))
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return cls(reader, int(parts[1]), headers)
+
+    @property
+    def reusable(self) -> bool:
+        """Whether the connection can carry another request once this body has been read"""
+        return (self.finished and (self.chunked or self._remaining is not None)
+                and self.headers.get('connection', '').lower() != 'close')
+
+    async def _fill(self) -> bool:
+        if self.finished:
+            return False
+        if self.chunked:
+            size = int((await self.reader.readline()).split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                await self.reader.readline()
+                self.finished = True
+                return False
+            self._buffer += await self.reader.readexactly(size)
+            await self.reader.readline()
+        elif self._remaining is not None:
+            if self._remaining == 0:
+                self.finished = True
+                return False
+            data = await self.reader.read(min(self._remaining, 65536))
+            if not data:
+                raise ConnectionResetError("Upstream closed the connection mid-response")
+            self._remaining -= len(data)
+            self._buffer += data
+        else:
+            data = await self.reader.read(65536)
+            if not data:
+                self.finished = True
+                return False
+            self._buffer += data
+        return True
+
+    async def readline(self) -> bytes:
+        while b'\n' not in self._buffer:
+            if not await self._fill():
+                line, self._buffer = self._buffer, b''
+                return line
+        line, _, self._buffer = self._buffer.partition(b'\n')
+        return line + b'\n'
+
+    async def read_all(self) -> bytes:
+        while await self._fill():
+            pass
+        data, self._buffer = self._buffer, b''
+        return data
+
+
+class AsyncConnectionPool:
+    """Keep-alive asyncio stream connections to one upstream host"""
+
+    def __init__(self, base_url: str, size: int = 8):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.scheme == 'https' else 80)
+        self.base_path = parts.path.rstrip('/')
+        self.size = size
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self.created = 0
+
+    async def acquire(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        connection = await asyncio.open_connection(self.host, self.port, ssl=self.scheme == 'https' or None)
+        self.created += 1
+        return connection
+
+    def release(self, connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter]):
+        if len(self._idle) < self.size:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+
+    def discard(self, connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter]):
+        connection[1].close()
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+class AsyncLLMClient(LLMClient):
+    """LLMClient for asyncio: the same deadlines, retries and limits, as coroutines
+
+    A call waiting on the upstream model holds no thread, so one event loop
+    can keep hundreds of chats in flight. Use it from a single event loop.
+    Its limit is configured separately (CROPBOT_LLM_ASYNC_MAX_CONCURRENCY),
+    with a default sized for that.
+    """
+
+    MAX_CONCURRENCY_ENV = ('CROPBOT_LLM_ASYNC_MAX_CONCURRENCY', '256')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = AsyncConnectionPool(self.base_url, size=self.max_concurrency)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    @staticmethod
+    def _remaining(deadline: float, message: str) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeout(message)
+        return remaining
+
+    async def _open(self, payload: Dict[str, Any], deadline: float):
+        """Send the request, retrying failed attempts; returns (connection, response)"""
+        body = json.dumps(payload).encode('utf-8')
+        headers = self._headers(payload['stream'])
+        headers['Host'] = self.pool.host
+        headers['Content-Length'] = str(len(body))
+        head = f"POST {self.pool.base_path}/chat/completions HTTP/1.1\r\n" + ''.join(
+            f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+        attempt = 0
+        while True:
+            message = f"No response within {self.timeout:.1f}s"
+            connection = None
+            try:
+                connection = await asyncio.wait_for(self.pool.acquire(), self._remaining(deadline, message))
+                connection[1].write(head.encode('latin-1') + body)
+                await asyncio.wait_for(connection[1].drain(), self._remaining(deadline, message))
+                response = await asyncio.wait_for(_AsyncResponse.read(connection[0]),
+                                                  self._remaining(deadline, message))
+                if response.status == 200:
+                    return connection, response
+                detail = (await asyncio.wait_for(response.read_all(), self._remaining(deadline, message)))[:500]
+                error = LLMError(f"Upstream returned HTTP {response.status}: {detail.decode('utf-8', 'replace')}")
+                retryable = response.status in RETRYABLE_STATUSES
+                if response.reusable:
+                    self.pool.release(connection)
+                else:
+                    self.pool.discard(connection)
+            except asyncio.TimeoutError as e:
+                if connection is not None:
+                    self.pool.discard(connection)
+                raise LLMTimeout(message) from e
+            except (OSError, http.client.HTTPException, asyncio.IncompleteReadError, ValueError) as e:
+                if connection is not None:
+                    self.pool.discard(connection)
+                error = LLMError(str(e) or type(e).__name__)
+                retryable = True
+
+            attempt += 1
+            if not retryable or attempt > self.max_retries:
+                raise error
+            self._count('retries')
+            delay = self.backoff * (2 ** (attempt - 1)) * (0.5 + random.random())
+            if time.monotonic() + delay >= deadline:
+                raise error
+            logger.warning("LLM call failed (%s), retrying in %.2fs", error, delay)
+            await asyncio.sleep(delay)
+
+    async def stream(self, messages: List[Dict[str, str]], max_tokens: int = 1000,
+                     temperature: float = 0.7, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Yield the answer's text deltas as they arrive"""
+        start = time.monotonic()
+        deadline = start + (timeout if timeout is not None else self.timeout)
+        self._count('calls')
+        try:
+            await asyncio.wait_for(self._slots.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self._count('busy')
+            raise LLMBusy(f"All {self.max_concurrency} LLM slots are in use") from None
+        connection = None
+        try:
+            payload = {'model': self.model, 'messages': messages, 'max_tokens': max_tokens,
+                       'temperature': temperature, 'stream': True}
+            connection, response = await self._open(payload, deadline)
+            message = f"Answer not finished within {self.timeout:.1f}s"
+            first_token = True
+            while True:
+                line = await asyncio.wait_for(response.readline(), self._remaining(deadline, message))
+                if not line:
+                    break
+                text = _sse_delta(line)
+                if text is _DONE:
+                    # Drain the terminating chunk so the connection can be reused
+                    await asyncio.wait_for(response.read_all(), self._remaining(deadline, message))
+                    break
+                if text:
+                    if first_token:
+                        first_token = False
+                        self._count('first_token_seconds_total', time.monotonic() - start)
+                        self._count('first_tokens')
+                    yield text
+            if response.reusable:
+                self.pool.release(connection)
+                connection = None
+        except asyncio.TimeoutError as e:
+            self._count('timeouts')
+            self._count('errors')
+            raise LLMTimeout(f"Answer not finished within {self.timeout:.1f}s") from e
+        except LLMError as e:
+            if isinstance(e, LLMTimeout):
+                self._count('timeouts')
+            self._count('errors')
+            raise
+        except (OSError, http.client.HTTPException, asyncio.IncompleteReadError, ValueError) as e:
+            self._count('errors')
+            raise LLMError(str(e) or type(e).__name__) from e
+        finally:
+            if connection is not None:
+                self.pool.discard(connection)
+            self._slots.release()
+
+    async def complete(self, messages: List[Dict[str, str]], max_tokens: int = 1000,
+                       temperature: float = 0.7, timeout: Optional[float] = None) -> str:
+        """The whole answer as one string"""
+        return ''.join([text async for text in self.stream(messages, max_tokens=max_tokens,
+                                                           temperature=temperature, timeout=timeout)])
@@ -0,0 +1,110 @@
+"""Local stand-in for an OpenAI-compatible chat completions API
+
+Serves POST /v1/chat/completions (streamed or not) with a canned agricultural
+answer, after a configurable time-to-first-token and per-token delay, so the
+chat endpoints can be load tested offline:
+
+    python llm_stub_server.py --port 8001 --first-token-ms 300 --token-ms 20
+    export OPENAI_BASE_URL=http://127.0.0.1:8001/v1
+"""
+import argparse
+import json
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ANSWER = (
+    "Healthy crops start with healthy soil. Test your soil before the season, "
+    "keep the pH between 6.0 and 7.5 for most crops, add compost to build organic "
+    "matter, and water early in the morning so less is lost to evaporation."
+)
+
+
+def _tokens(text):
+    words = text.split(' ')
+    return [word if i == 0 else ' ' + word for i, word in enumerate(words)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    first_token_delay = 0.3
+    token_delay = 0.02
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        tokens = _tokens(CANNED_ANSWER)[:request.get('max_tokens') or None]
+        model = request.get('model', 'stub')
+        time.sleep(self.first_token_delay)
+
+        if not request.get('stream'):
+            time.sleep(self.token_delay * len(tokens))
+            self._send_json(200, {
+                'object': 'chat.completion',
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                             'finish_reason': 'stop'}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.token_delay)
+            event = {'object': 'chat.completion.chunk', 'model': model,
+                     'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]}
+            self._write_chunk(b'data: ' + json.dumps(event).encode('utf-8') + b'\n\n')
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._write_chunk(b'')
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Clients abandoning a stream (deadlines, load-test shutdown) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def make_server(host='127.0.0.1', port=8001, first_token_ms=300, token_ms=20):
+    handler = type('ConfiguredStubHandler', (StubHandler,), {
+        'first_token_delay': first_token_ms / 1000.0,
+        'token_delay': token_ms / 1000.0,
+    })
+    return StubServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--first-token-ms', type=float, default=300)
+    parser.add_argument('--token-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.first_token_ms, args.token_ms)
+    print(f"Stub LLM listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -3,11 +3,17 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, jsonify
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.crop_enhanced import crop_enhanced_bp
+from src.static_assets import StaticAssets
+
+# The rule-based API by default; CROPBOT_API=ml serves the ML model and LLM chat instead
+if os.environ.get('CROPBOT_API', 'enhanced') == 'ml':
+    from src.routes.crop import crop_bp as crop_api_bp
+else:
+    from src.routes.crop_enhanced import crop_enhanced_bp as crop_api_bp
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -16,7 +22,7 @@ app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 CORS(app)
 
 app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(crop_enhanced_bp, url_prefix='/api/crop')
+app.register_blueprint(crop_api_bp, url_prefix='/api/crop')
 
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
@@ -25,21 +31,19 @@ db.init_app(app)
 with app.app_context():
     db.create_all()
 
+# The static folder is served from memory, precompressed, with fingerprinted URLs
+STATIC = StaticAssets(app.static_folder)
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
+    # Unknown API paths are errors, not page routes
+    if path.startswith('api/'):
+        return jsonify({'error': 'Not found'}), 404
+    response = STATIC.respond(path)
+    if response is None:
+        return "index.html not found", 404
+    return response
 
 
 if __name__ == '__main__':
@@ -0,0 +1,226 @@
+"""Successive-halving search for a smaller, faster forest at the same accuracy
+
+Candidates are random forests drawn from SEARCH_SPACE. Every round scores
+the surviving candidates on a stratified sample of the data: k-fold CV
+accuracy, serialized model size and median single-row inference latency.
+The sample grows by `factor` each round while the number of candidates
+shrinks by the same factor. Survivors are chosen by Pareto rank over the
+three objectives, then by accuracy, so small fast models are not dropped
+just for trailing the biggest forest by a fraction of a point. Folds are
+fitted on a process pool; latency is timed in the parent, one model at a
+time, once the round's fits have all finished, so the timings do not
+compete with training for the CPU.
+
+    python src/training_pipeline.py --data Crop_recommendation.csv --search --jobs -1
+"""
+import math
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Values tried for each RandomForestClassifier parameter
+SEARCH_SPACE = {
+    'n_estimators': [10, 25, 50, 100, 200],
+    'max_depth': [6, 8, 10, 14, None],
+    'min_samples_split': [2, 5, 10],
+    'min_samples_leaf': [1, 2, 4],
+}
+
+# (result key, True if larger is better) for every objective
+OBJECTIVES = [('cv_accuracy', True), ('latency_ms', False), ('size_bytes', False)]
+
+# Single-row predictions timed per candidate (the median is reported)
+LATENCY_REPEATS = 50
+
+# Data shared with pool workers, set once per worker by _init_worker
+_worker_data: Dict[str, np.ndarray] = {}
+
+
+def sample_candidates(n: int, rng: np.random.Generator, baseline: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Up to `n` distinct parameter sets from SEARCH_SPACE, starting with `baseline`"""
+    candidates = [dict(baseline)] if baseline else []
+    seen = {tuple(sorted(candidate.items(), key=lambda item: item[0])) for candidate in candidates}
+    space = 1
+    for values in SEARCH_SPACE.values():
+        space *= len(values)
+    while len(candidates) < min(n, space):
+        params = {name: values[rng.integers(len(values))] for name, values in SEARCH_SPACE.items()}
+        key = tuple(sorted(params.items(), key=lambda item: item[0]))
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+    return candidates
+
+
+def _init_worker(X: np.ndarray, y: np.ndarray):
+    _worker_data['X'] = X
+    _worker_data['y'] = y
+
+
+def _fit_folds(params: Dict[str, Any], rows: np.ndarray, folds: Sequence[Tuple[np.ndarray, np.ndarray]],
+               random_state: int) -> Dict[str, Any]:
+    """CV accuracy of one candidate on the given rows; also returns the first fold's pickled model"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    X, y = _worker_data['X'][rows], _worker_data['y'][rows]
+    scores = []
+    model_bytes = None
+    start = time.perf_counter()
+    for train, test in folds:
+        model = RandomForestClassifier(random_state=random_state, **params)
+        model.fit(X[train], y[train])
+        scores.append(float(np.mean(model.predict(X[test]) == y[test])))
+        if model_bytes is None:
+            model_bytes = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+    return {
+        'params': params,
+        'cv_accuracy': float(np.mean(scores)),
+        'cv_std': float(np.std(scores)),
+        'fit_time': time.perf_counter() - start,
+        'model_bytes': model_bytes,
+    }
+
+
+def measure_latency(model, row: np.ndarray, repeats: int = LATENCY_REPEATS) -> Dict[str, float]:
+    """Median single-row predict_proba time in ms, for sklearn and the compiled engine"""
+    try:
+        from src.forest_engine import CompiledForest
+    except ImportError:
+        from forest_engine import CompiledForest
+
+    timings = {}
+    for engine, scorer in (('sklearn', model), ('compiled', CompiledForest.from_sklearn(model))):
+        scorer.predict_proba(row)
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            scorer.predict_proba(row)
+            samples.append(time.perf_counter() - start)
+        timings[engine] = float(np.median(samples)) * 1000
+    return timings
+
+
+def dominates(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """Whether `a` is at least as good as `b` on every objective and better on one"""
+    better = False
+    for key, maximize in OBJECTIVES:
+        if (a[key] < b[key]) if maximize else (a[key] > b[key]):
+            return False
+        if a[key] != b[key]:
+            better = True
+    return better
+
+
+def pareto_ranks(results: List[Dict[str, Any]]) -> List[int]:
+    """Front number of each result: 0 for the Pareto front, 1 for the front once that is removed, ..."""
+    ranks = [-1] * len(results)
+    remaining = set(range(len(results)))
+    rank = 0
+    while remaining:
+        front = {i for i in remaining if not any(dominates(results[j], results[i]) for j in remaining if j != i)}
+        for i in front:
+            ranks[i] = rank
+        remaining -= front
+        rank += 1
+    return ranks
+
+
+def successive_halving(X, y, candidates: List[Dict[str, Any]], factor: int = 3, final_candidates: int = 6,
+                       min_rows: int = 500, cv_folds: int = 5, n_jobs: int = 1, engine: str = 'sklearn',
+                       baseline: Optional[Dict[str, Any]] = None, random_state: int = 42,
+                       log=print) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """(final results, per-round summaries) of a successive-halving search over `candidates`
+
+    Rounds continue until about `final_candidates` remain, which are then
+    scored on all of the data; their Pareto front is the answer. `engine`
+    picks which single-row latency ('sklearn' or 'compiled') counts as the
+    latency objective; both are reported. `baseline`, if among the
+    candidates, survives every round so the final front can be compared
+    with it.
+    """
+    from sklearn.model_selection import StratifiedKFold, train_test_split
+
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    y = np.asarray(y)
+    rng = np.random.default_rng(random_state)
+    n_rounds = 1 + max(0, math.floor(math.log(len(candidates) / final_candidates, factor)))
+    row = X[rng.integers(len(X))][np.newaxis, :].astype(np.float64)
+    rounds = []
+
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(X, y)) as pool:
+        for round_index in range(n_rounds):
+            start = time.perf_counter()
+            n_rows = len(X) if round_index == n_rounds - 1 else \
+                max(min_rows, int(len(X) / factor ** (n_rounds - 1 - round_index)))
+            if n_rows < len(X):
+                rows, _ = train_test_split(np.arange(len(X)), train_size=n_rows, stratify=y,
+                                           random_state=random_state + round_index)
+            else:
+                rows = np.arange(len(X))
+            # Computed once per round and shared by every candidate
+            folds = list(StratifiedKFold(n_splits=cv_folds).split(rows, y[rows]))
+
+            futures = [pool.submit(_fit_folds, params, rows, folds, random_state) for params in candidates]
+            # Every fit of the round finishes before any timing starts, so
+            # the pool is idle while latency is measured
+            results = [future.result() for future in futures]
+            for result in results:
+                model_bytes = result.pop('model_bytes')
+                result['size_bytes'] = len(model_bytes)
+                result['latency'] = measure_latency(pickle.loads(model_bytes), row)
+                result['latency_ms'] = result['latency'][engine]
+
+            ranks = pareto_ranks(results)
+            for result, rank in zip(results, ranks):
+                result['pareto_rank'] = rank
+            results.sort(key=lambda result: (result['pareto_rank'], -result['cv_accuracy']))
+            keep = len(results) if round_index == n_rounds - 1 else max(1, math.ceil(len(results) / factor))
+            rounds.append({
+                'round': round_index,
+                'rows': int(len(rows)),
+                'candidates': len(results),
+                'kept': keep,
+                'best_cv_accuracy': max(result['cv_accuracy'] for result in results),
+                'time': time.perf_counter() - start,
+            })
+            log(f"[search] round {round_index}: {len(results)} candidates on {len(rows)} rows, "
+                f"keeping {keep} ({rounds[-1]['time']:.1f}s)")
+            candidates = [result['params'] for result in results[:keep]]
+            if baseline is not None and baseline not in candidates and any(
+                    result['params'] == baseline for result in results):
+                candidates.append(baseline)
+
+    return results, rounds
+
+
+def search_report(results: List[Dict[str, Any]], rounds: List[Dict[str, Any]],
+                  baseline: Optional[Dict[str, Any]] = None, engine: str = 'sklearn') -> Dict[str, Any]:
+    """Pareto front of the final round (fastest first), with the baseline's scores for comparison"""
+    front = sorted((result for result in results if result['pareto_rank'] == 0), key=lambda result: result['latency_ms'])
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'objectives': {key: 'max' if maximize else 'min' for key, maximize in OBJECTIVES},
+        'latency_engine': engine,
+        'rounds': rounds,
+        'pareto_front': front,
+        'final_round': results,
+    }
+    if baseline is not None:
+        report['baseline'] = next((result for result in results if result['params'] == baseline), None)
+    return report
+
+
+def format_front(report: Dict[str, Any]) -> str:
+    lines = [f"{'cv_accuracy':>11}  {'latency_ms':>10}  {'size_kb':>8}  params"]
+    for result in report['pareto_front']:
+        lines.append(f"{result['cv_accuracy']:>11.4f}  {result['latency_ms']:>10.3f}  "
+                     f"{result['size_bytes'] / 1024:>8.0f}  {result['params']}")
+    baseline = report.get('baseline')
+    if baseline is not None:
+        lines.append(f"Baseline: accuracy {baseline['cv_accuracy']:.4f}, {baseline['latency_ms']:.3f}ms, "
+                     f"{baseline['size_bytes'] / 1024:.0f} KB{'' if baseline['pareto_rank'] == 0 else ' (dominated)'}")
+    return '\n'.join(lines)
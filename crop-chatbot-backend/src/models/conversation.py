@@ -0,0 +1,44 @@
+import json
+from src.models.user import db
+from src.session_store import ConversationSession
+
+class Conversation(db.Model):
+    session_id = db.Column(db.String(64), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    turns = db.Column(db.Text, nullable=False, default='[]')
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), onupdate=db.func.now())
+
+    def __repr__(self):
+        return f'<Conversation {self.session_id}>'
+
+    def to_session(self):
+        return ConversationSession(self.session_id, json.loads(self.turns), self.summary)
+
+
+class SQLSessionPersistence:
+    """Stores conversation sessions in the app's SQLite database"""
+
+    def __init__(self, app):
+        self.app = app
+        with app.app_context():
+            db.create_all()
+
+    def load(self, session_id):
+        with self.app.app_context():
+            row = db.session.get(Conversation, session_id)
+            return row.to_session() if row is not None else None
+
+    def save(self, session):
+        with self.app.app_context():
+            row = db.session.get(Conversation, session.session_id)
+            if row is None:
+                row = Conversation(session_id=session.session_id)
+                db.session.add(row)
+            row.summary = session.summary
+            row.turns = json.dumps(list(session.turns))
+            db.session.commit()
+
+    def delete(self, session_id):
+        with self.app.app_context():
+            Conversation.query.filter_by(session_id=session_id).delete()
+            db.session.commit()
@@ -0,0 +1,234 @@
+"""Distil the trained crop model into a bundle the browser can evaluate
+
+The full forest (100 trees, depth 10) is too big to ship to phones on slow
+links. Here a small ensemble of depth-limited trees is trained to reproduce the
+forest's answers, using the forest itself as the labeller: samples are
+drawn around each crop's observed conditions (crop_info.json) plus
+uniformly over the whole input space, and labelled with the forest's
+predictions. The student trees are exported as flat arrays in a versioned
+JSON bundle that static/offline_model.js (OfflineCropModel.loadBundle)
+evaluates, and the agreement with the full model is measured on the
+exported bundle itself, with the same arithmetic the browser uses.
+
+    python src/offline_bundle.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Bumped whenever the bundle layout changes; the browser ignores other versions
+BUNDLE_FORMAT = 1
+
+FEATURE_NAMES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Span of each feature in the training data, used for background samples
+FEATURE_LOW = np.array([0, 5, 5, 8, 14, 3.5, 20])
+FEATURE_HIGH = np.array([140, 145, 205, 44, 100, 9.9, 300])
+
+# Classes kept per leaf, and decimal places kept for thresholds and probabilities
+LEAF_CLASSES = 2
+THRESHOLD_DECIMALS = 4
+PROBABILITY_DECIMALS = 3
+
+# Written next to the model; the ML API serves it at /api/crop/offline_bundle.json
+DEFAULT_BUNDLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offline_bundle.json')
+
+
+def sample_conditions(crop_info: Dict[str, Dict[str, Any]], per_crop: int, background: int,
+                      rng: np.random.Generator) -> np.ndarray:
+    """Inputs to label with the full model
+
+    For each crop, `per_crop` rows drawn around its averages (spread a
+    quarter of the observed range, clipped to that range widened by 10%), plus
+    `background` rows uniform over the whole input space so the student
+    also learns the boundaries between crops.
+    """
+    blocks = [rng.uniform(FEATURE_LOW, FEATURE_HIGH, size=(background, len(FEATURE_NAMES)))]
+    for info in crop_info.values():
+        low = np.array([info[f'{feature}_range'][0] for feature in FEATURE_NAMES], dtype=np.float64)
+        high = np.array([info[f'{feature}_range'][1] for feature in FEATURE_NAMES], dtype=np.float64)
+        average = np.array([info[f'avg_{feature}'] for feature in FEATURE_NAMES], dtype=np.float64)
+        margin = (high - low) * 0.1
+        spread = np.maximum((high - low) / 4, 1e-3)
+        block = rng.normal(average, spread, size=(per_crop, len(FEATURE_NAMES)))
+        blocks.append(np.clip(block, low - margin, high + margin))
+    return np.vstack(blocks)
+
+
+def export_tree(tree) -> Dict[str, List]:
+    """One fitted sklearn tree as flat arrays
+
+    Internal nodes go left when `x[feature] <= threshold`. A leaf has
+    feature -1 and `left` indexing its entry in `leaves`: up to LEAF_CLASSES
+    [class, probability] pairs.
+    """
+    structure = tree.tree_
+    feature, threshold, left, right, leaves = [], [], [], [], []
+    for node in range(structure.node_count):
+        if structure.children_left[node] == -1:
+            counts = structure.value[node][0]
+            probabilities = counts / counts.sum()
+            top = np.argsort(-probabilities, kind='stable')[:LEAF_CLASSES]
+            leaves.append([[int(c), round(float(probabilities[c]), PROBABILITY_DECIMALS)]
+                           for c in top if probabilities[c] > 0])
+            feature.append(-1)
+            threshold.append(0)
+            left.append(len(leaves) - 1)
+            right.append(-1)
+        else:
+            feature.append(int(structure.feature[node]))
+            threshold.append(round(float(structure.threshold[node]), THRESHOLD_DECIMALS))
+            left.append(int(structure.children_left[node]))
+            right.append(int(structure.children_right[node]))
+    return {'feature': feature, 'threshold': threshold, 'left': left, 'right': right, 'leaves': leaves}
+
+
+def bundle_proba(bundle: Dict[str, Any], X) -> np.ndarray:
+    """Class probabilities from a bundle, computed exactly as offline_model.js does"""
+    X = np.asarray(X, dtype=np.float64)
+    probabilities = np.zeros((X.shape[0], len(bundle['class_names'])))
+    rows = np.arange(X.shape[0])
+    for tree in bundle['trees']:
+        feature = np.asarray(tree['feature'])
+        threshold = np.asarray(tree['threshold'], dtype=np.float64)
+        left = np.asarray(tree['left'])
+        right = np.asarray(tree['right'])
+        node = np.zeros(X.shape[0], dtype=np.intp)
+        active = feature[node] >= 0
+        while active.any():
+            current = node[active]
+            goes_left = X[rows[active], feature[current]] <= threshold[current]
+            node[active] = np.where(goes_left, left[current], right[current])
+            active = feature[node] >= 0
+        for row, leaf in zip(rows, left[node]):
+            for class_index, probability in tree['leaves'][leaf]:
+                probabilities[row, class_index] += probability
+    return probabilities / len(bundle['trees'])
+
+
+def agreement(bundle: Dict[str, Any], teacher, X) -> float:
+    """Share of rows where the bundle's top crop is the full model's top crop"""
+    return float(np.mean(bundle_proba(bundle, X).argmax(axis=1) == teacher.predict(np.asarray(X))))
+
+
+def distil(teacher, class_names, crop_info: Dict[str, Dict[str, Any]], X=None, n_trees: int = 3,
+           max_depth: int = 10, per_crop: int = 1000, background: int = 20000,
+           random_state: int = 42) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(bundle, report) for a small tree ensemble that mimics `teacher`
+
+    `teacher` is anything with predict(X) returning encoded labels (the
+    sklearn forest or a CompiledForest). Agreement is reported on a fresh
+    sample drawn the same way as the training sample, on uniform random
+    inputs, and on `X` (e.g. the real training data) when given.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+
+    start = time.perf_counter()
+    rng = np.random.default_rng(random_state)
+    X_train = sample_conditions(crop_info, per_crop, background, rng)
+    if X is not None:
+        X_train = np.vstack([X_train, np.asarray(X, dtype=np.float64)])
+    y_train = teacher.predict(X_train)
+
+    student = RandomForestClassifier(n_estimators=n_trees, max_depth=max_depth, min_samples_leaf=2,
+                                     random_state=random_state)
+    student.fit(X_train, y_train)
+    # Student class indices are positions in student.classes_; map them back
+    # to the teacher's encoding so every class keeps its name
+    trees = []
+    for estimator in student.estimators_:
+        tree = export_tree(estimator)
+        tree['leaves'] = [[[int(student.classes_[c]), p] for c, p in leaf] for leaf in tree['leaves']]
+        trees.append(tree)
+
+    bundle = {
+        'format_version': BUNDLE_FORMAT,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'feature_names': FEATURE_NAMES,
+        'class_names': [str(name) for name in class_names],
+        'trees': trees,
+    }
+    bundle['version'] = hashlib.sha256(
+        json.dumps(bundle['trees'], separators=(',', ':')).encode('utf-8')).hexdigest()[:16]
+
+    report = {
+        'trees': n_trees,
+        'max_depth': max_depth,
+        'nodes': sum(len(tree['feature']) for tree in trees),
+        'training_rows': len(X_train),
+        'agreement_crop_conditions': agreement(bundle, teacher,
+                                               sample_conditions(crop_info, per_crop // 4, 0, rng)),
+        'agreement_uniform': agreement(bundle, teacher,
+                                       rng.uniform(FEATURE_LOW, FEATURE_HIGH, size=(background // 4, len(FEATURE_NAMES)))),
+    }
+    if X is not None:
+        report['agreement_training_data'] = agreement(bundle, teacher, X)
+    report['distil_time'] = time.perf_counter() - start
+    bundle['agreement'] = round(report['agreement_crop_conditions'], 4)
+    return bundle, report
+
+
+def save_bundle(bundle: Dict[str, Any], path: str = DEFAULT_BUNDLE_PATH) -> Dict[str, int]:
+    """Write the bundle as compact JSON; returns its raw and gzipped sizes in bytes
+
+    The file is replaced in one rename, so a server reading it never sees a
+    half-written bundle.
+    """
+    data = json.dumps(bundle, separators=(',', ':')).encode('utf-8')
+    temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)
+    except Exception:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return {'bytes': len(data), 'gzip_bytes': len(gzip.compress(data, compresslevel=9))}
+
+
+def export_offline_bundle(teacher, class_names, crop_info_path: str, path: str = DEFAULT_BUNDLE_PATH,
+                          X=None, **options) -> Dict[str, Any]:
+    """Distil `teacher`, write the bundle to `path` and return the report with its size"""
+    with open(crop_info_path, 'r') as f:
+        crop_info = json.load(f)
+    bundle, report = distil(teacher, class_names, crop_info, X=X, **options)
+    report.update(save_bundle(bundle, path))
+    report['path'] = path
+    report['version'] = bundle['version']
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"Offline bundle {report['version']}: {report['trees']} trees, depth {report['max_depth']}, "
+        f"{report['nodes']} nodes",
+        f"  size: {report['bytes'] / 1024:.1f} KB ({report['gzip_bytes'] / 1024:.1f} KB gzipped)",
+        f"  agreement with the full model: {report['agreement_crop_conditions']:.2%} near crop conditions, "
+        f"{report['agreement_uniform']:.2%} on uniform inputs",
+    ]
+    if 'agreement_training_data' in report:
+        lines.append(f"  agreement on the training data: {report['agreement_training_data']:.2%}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    try:
+        from src.forest_engine import load_or_compile
+    except ImportError:
+        from forest_engine import load_or_compile
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    forest = load_or_compile(os.path.join(base_dir, 'crop_forest'),
+                             os.path.join(base_dir, 'crop_recommendation_model.pkl'),
+                             os.path.join(base_dir, 'label_encoder.pkl'))
+    report = export_offline_bundle(forest, forest.class_names, os.path.join(base_dir, 'crop_info.json'))
+    print(format_report(report))
+    print(f"Written to {report['path']} in {report['distil_time']:.1f}s")
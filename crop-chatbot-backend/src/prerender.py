@@ -0,0 +1,124 @@
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from flask import Response, request
+
+# Marker serialized in place of a per-request value; the rendered bytes are
+# split around it and the real value is spliced in at request time
+_SLOT_MARKER = '\x00slot:{}\x00'
+
+
+def _dumps(payload: Any) -> bytes:
+    # Same bytes Flask's jsonify produces outside debug mode
+    return (json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def fingerprint(source: Any) -> str:
+    """Stable content hash of the data an entry is rendered from"""
+    return hashlib.sha256(_dumps(source)).hexdigest()
+
+
+class PrerenderedResponse:
+    """Serialized JSON body split into static byte chunks around named slots"""
+
+    __slots__ = ('chunks', 'slots', 'etag', 'status')
+
+    def __init__(self, payload: Dict[str, Any], slots: Iterable[str] = (), status: int = 200):
+        slots = set(slots)
+        body = _dumps({
+            key: _SLOT_MARKER.format(key) if key in slots else value
+            for key, value in payload.items()
+        })
+        markers = {slot: json.dumps(_SLOT_MARKER.format(slot)).encode('utf-8') for slot in slots}
+        # Keys are serialized sorted, so split in the order the markers appear
+        self.slots = tuple(sorted(slots, key=lambda slot: body.index(markers[slot])))
+        self.chunks = [body]
+        for slot in self.slots:
+            head, tail = self.chunks.pop().split(markers[slot], 1)
+            self.chunks.extend([head, tail])
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.status = status
+
+    def render(self, values: Dict[str, Any]) -> Tuple[bytes, str]:
+        """Final body bytes and ETag with the slot values filled in"""
+        if not self.slots:
+            return self.chunks[0], self.etag
+        parts = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            parts.append(json.dumps(values[slot], sort_keys=True, separators=(',', ':')).encode('utf-8'))
+            parts.append(chunk)
+        body = b''.join(parts)
+        return body, hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class Prerenderer:
+    """Static JSON responses built once and served as bytes
+
+    Entries live in namespaces (e.g. one per endpoint). sync() is given the
+    current source data for a namespace and a build function, and rebuilds
+    only the entries whose source fingerprint changed, so a reload of one
+    crop touches only that crop's responses. Each swap replaces a whole
+    namespace dict, so concurrent readers see either the old or new set;
+    sync_all() swaps several namespaces at once.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[Hashable, PrerenderedResponse]] = {}
+        self._fingerprints: Dict[str, Dict[Hashable, str]] = {}
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def sync(self, namespace: str, sources: Dict[Hashable, Any],
+             build: Callable[[Hashable, Any], PrerenderedResponse]) -> List[Hashable]:
+        """Bring a namespace in line with its sources; returns the rebuilt keys"""
+        return self.sync_all({namespace: (sources, build)})[namespace]
+
+    def sync_all(self, namespaces: Dict[str, Tuple[Dict[Hashable, Any], Callable[[Hashable, Any], PrerenderedResponse]]]
+                 ) -> Dict[str, List[Hashable]]:
+        """sync() several namespaces, publishing them together once all are built"""
+        with self._lock:
+            all_entries, all_prints, all_rebuilt = dict(self._entries), dict(self._fingerprints), {}
+            for namespace, (sources, build) in namespaces.items():
+                old_entries = self._entries.get(namespace, {})
+                old_prints = self._fingerprints.get(namespace, {})
+                entries, prints, rebuilt = {}, {}, []
+                for key, source in sources.items():
+                    prints[key] = fingerprint(source)
+                    if key in old_entries and old_prints.get(key) == prints[key]:
+                        entries[key] = old_entries[key]
+                    else:
+                        entries[key] = build(key, source)
+                        rebuilt.append(key)
+                all_entries[namespace], all_prints[namespace], all_rebuilt[namespace] = entries, prints, rebuilt
+            # One assignment, so a reader never mixes namespaces from before and after
+            self._entries = all_entries
+            self._fingerprints = all_prints
+            self.rebuilds += sum(len(rebuilt) for rebuilt in all_rebuilt.values())
+        return all_rebuilt
+
+    def get(self, namespace: str, key: Hashable) -> Optional[PrerenderedResponse]:
+        return self._entries.get(namespace, {}).get(key)
+
+    def respond(self, namespace: str, key: Hashable, **values: Any) -> Optional[Response]:
+        """Flask response for an entry, or None if it was never rendered
+
+        Honors If-None-Match with a bodiless 304.
+        """
+        entry = self.get(namespace, key)
+        if entry is None:
+            return None
+        body, etag = entry.render(values)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, status=entry.status, mimetype='application/json')
+        response.set_etag(etag)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': {namespace: len(entries) for namespace, entries in self._entries.items()},
+            'rebuilds': self.rebuilds,
+        }
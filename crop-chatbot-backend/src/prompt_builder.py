@@ -0,0 +1,148 @@
+import logging
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from knowledge_index import KnowledgeIndex
+
+logger = logging.getLogger(__name__)
+
+# Chat formats spend a few tokens per message on role and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_MAX_PASSAGES = 4
+
+_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Local estimate of BPE tokens: one per punctuation mark, ~4 characters per word piece"""
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECE_PATTERN.findall(text))
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message.get('content') or '') + MESSAGE_OVERHEAD_TOKENS
+
+
+class BuiltPrompt:
+    """Messages for one chat call and the tokens each part contributed"""
+
+    __slots__ = ('messages', 'token_counts', 'dropped')
+
+    def __init__(self, messages: List[Dict[str, str]], token_counts: Dict[str, int], dropped: Dict[str, int]):
+        self.messages = messages
+        self.token_counts = token_counts
+        self.dropped = dropped
+
+
+class PromptBuilder:
+    """Assembles chat prompts under a token budget
+
+    The system prefix (instructions plus static knowledge) is fixed at
+    construction and counted once. Per message, the user's text is always
+    included; the remaining budget goes first to knowledge passages ranked
+    by relevance to the message, then to conversation history, newest turn
+    first. Token counts per part are logged at debug level and summed in
+    stats() for tuning.
+    """
+
+    def __init__(self, system_prefix: str, knowledge_index: Optional[KnowledgeIndex] = None,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET, max_passages: int = DEFAULT_MAX_PASSAGES):
+        self.system_message = {'role': 'system', 'content': system_prefix}
+        self.system_tokens = count_message_tokens(self.system_message)
+        self.knowledge_index = knowledge_index
+        self.token_budget = token_budget
+        self.max_passages = max_passages
+        self._lock = threading.Lock()
+        self._totals = {'prompts': 0, 'system': 0, 'context': 0, 'history': 0, 'message': 0,
+                        'total': 0, 'dropped_passages': 0, 'dropped_turns': 0}
+        if self.system_tokens >= token_budget:
+            logger.warning("System prefix alone uses %d of %d prompt tokens", self.system_tokens, token_budget)
+
+    @classmethod
+    def from_env(cls, system_prefix: str, knowledge_index: Optional[KnowledgeIndex] = None) -> 'PromptBuilder':
+        """Builder configured from CROPBOT_PROMPT_TOKEN_BUDGET / CROPBOT_PROMPT_MAX_PASSAGES"""
+        return cls(
+            system_prefix,
+            knowledge_index,
+            token_budget=int(os.environ.get('CROPBOT_PROMPT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)),
+            max_passages=int(os.environ.get('CROPBOT_PROMPT_MAX_PASSAGES', DEFAULT_MAX_PASSAGES)),
+        )
+
+    def build(self, user_message: str, conversation_history: Optional[List[Dict[str, str]]] = None) -> BuiltPrompt:
+        """Messages for one turn: system prefix, history, then context and the user's message"""
+        remaining = self.token_budget - self.system_tokens
+
+        message_prefix = f"User Message: {user_message}"
+        message_tokens = count_tokens(message_prefix) + MESSAGE_OVERHEAD_TOKENS
+        remaining -= message_tokens
+
+        # Relevant passages, best first, while they fit
+        context_parts = []
+        context_tokens = 0
+        dropped_passages = 0
+        if self.knowledge_index is not None and self.max_passages > 0:
+            header = "Relevant agricultural knowledge:\n"
+            for _, passage in self.knowledge_index.search(user_message, k=self.max_passages):
+                part = f"- {passage.title}: {passage.text}\n"
+                cost = count_tokens(part) + (0 if context_parts else count_tokens(header))
+                if cost > remaining:
+                    dropped_passages += 1
+                    continue
+                context_parts.append(part)
+                context_tokens += cost
+                remaining -= cost
+            if context_parts:
+                context_parts.insert(0, header)
+
+        # Most recent turns first, stopping at the first that does not fit
+        history = []
+        history_tokens = 0
+        turns = list(conversation_history or [])
+        for index in range(len(turns) - 1, -1, -1):
+            cost = count_message_tokens(turns[index])
+            if cost > remaining:
+                break
+            history.append(turns[index])
+            history_tokens += cost
+            remaining -= cost
+        history.reverse()
+        dropped_turns = len(turns) - len(history)
+
+        content = ''.join(context_parts) + ('\n' if context_parts else '') + message_prefix
+        messages = [self.system_message] + history + [{'role': 'user', 'content': content}]
+        token_counts = {
+            'system': self.system_tokens,
+            'context': context_tokens,
+            'history': history_tokens,
+            'message': message_tokens,
+            'total': self.system_tokens + context_tokens + history_tokens + message_tokens,
+        }
+        dropped = {'passages': dropped_passages, 'turns': dropped_turns}
+
+        logger.debug("Prompt tokens: system=%(system)d context=%(context)d history=%(history)d "
+                     "message=%(message)d total=%(total)d", token_counts)
+        with self._lock:
+            self._totals['prompts'] += 1
+            for part, tokens in token_counts.items():
+                self._totals[part] += tokens
+            self._totals['dropped_passages'] += dropped_passages
+            self._totals['dropped_turns'] += dropped_turns
+        return BuiltPrompt(messages, token_counts, dropped)
+
+    def stats(self) -> Dict[str, Any]:
+        """Mean prompt tokens per part, for tuning the budget"""
+        with self._lock:
+            totals = dict(self._totals)
+        prompts = totals.pop('prompts')
+        return {
+            'token_budget': self.token_budget,
+            'prompts': prompts,
+            'mean_tokens': {part: round(tokens / prompts, 1) if prompts else 0.0
+                            for part, tokens in totals.items() if not part.startswith('dropped')},
+            'dropped_passages': totals['dropped_passages'],
+            'dropped_turns': totals['dropped_turns'],
+        }
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Feature order shared with the model
+FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Decimal places kept per feature when building a cache key, so readings such
+# as pH 6.50 / 6.5 or rainfall 202.94 / 202.9 share one entry
+DEFAULT_PRECISION = {
+    'N': 0,
+    'P': 0,
+    'K': 0,
+    'temperature': 1,
+    'humidity': 1,
+    'ph': 1,
+    'rainfall': 1,
+}
+
+
+class RecommendationCache:
+    """Bounded LRU/TTL cache for recommendations keyed on quantized inputs
+
+    `version_fn` returns a token identifying the artifact the cached values
+    were computed from (e.g. the model file's mtime and size). It is polled
+    at most every `check_interval` seconds; when the token changes, every
+    entry is dropped and `on_invalidate` is called.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: Optional[float] = 3600.0,
+                 precision: Optional[Dict[str, int]] = None,
+                 version_fn: Optional[Callable[[], Hashable]] = None,
+                 on_invalidate: Optional[Callable[[], None]] = None,
+                 check_interval: float = 1.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.precision = dict(DEFAULT_PRECISION)
+        if precision:
+            self.precision.update(precision)
+        self._digits = [self.precision[feature] for feature in FEATURES]
+        self.version_fn = version_fn
+        self.on_invalidate = on_invalidate
+        self.check_interval = check_interval
+        self._version = version_fn() if version_fn else None
+        self._next_check = time.monotonic() + check_interval
+        self._entries: 'OrderedDict[Tuple, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, conditions: Dict[str, float], *extra: Hashable) -> Tuple:
+        """Quantized cache key for one set of soil and climate values"""
+        values = tuple(
+            round(float(conditions[feature]), digits)
+            for feature, digits in zip(FEATURES, self._digits)
+        )
+        return values + extra
+
+    def _check_version(self, now: float):
+        if self.version_fn is None or now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        version = self.version_fn()
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+            self.invalidations += 1
+            if self.on_invalidate:
+                self.on_invalidate()
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        """Cached value for key, or None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(now)
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl is not None and now - entry[0] > self.ttl):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Tuple, value: Any):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
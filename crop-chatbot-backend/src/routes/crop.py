@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_cors import cross_origin
 import sys
 import os
+import hashlib
 import json
 import joblib
 import numpy as np
@@ -10,21 +11,112 @@ import numpy as np
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from crop_chatbot import CropChatbot
+from crop_registry import default_registry
+from session_store import SessionStore
+from static_assets import asset_response
 
 crop_bp = Blueprint('crop', __name__)
 
 # Initialize the chatbot
 chatbot = None
 
-def init_chatbot():
+def init_chatbot(warmup=False):
+    """Create the chatbot; artifacts load on first use unless warmup is requested"""
     global chatbot
     try:
         chatbot = CropChatbot()
+        if warmup or os.environ.get('CROPBOT_WARMUP') == '1':
+            chatbot.warmup()
         return True
     except Exception as e:
         print(f"Error initializing chatbot: {e}")
         return False
 
+# Conversations are kept server-side, so clients send only a session id and
+# the new message however long the conversation gets
+sessions = None
+
+def get_session_store():
+    """Create the session store on first use, backed by SQLite if CROPBOT_SESSION_PERSIST=1"""
+    global sessions
+    if sessions is None:
+        persistence = None
+        if os.environ.get('CROPBOT_SESSION_PERSIST') == '1':
+            from src.models.conversation import SQLSessionPersistence
+            persistence = SQLSessionPersistence(current_app._get_current_object())
+        sessions = SessionStore.from_env(persistence=persistence)
+    return sessions
+
+# Required input fields, in the order the model expects them
+REQUIRED_FIELDS = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Accepted range and error message for each input field
+FIELD_LIMITS = {
+    'N': (0, 200, 'Nitrogen (N) should be between 0-200'),
+    'P': (0, 200, 'Phosphorus (P) should be between 0-200'),
+    'K': (0, 200, 'Potassium (K) should be between 0-200'),
+    'temperature': (0, 50, 'Temperature should be between 0-50°C'),
+    'humidity': (0, 100, 'Humidity should be between 0-100%'),
+    'ph': (0, 14, 'pH should be between 0-14'),
+    'rainfall': (0, 500, 'Rainfall should be between 0-500mm'),
+}
+
+# Upper bound on rows accepted by a single batch request
+MAX_BATCH_ROWS = 10000
+
+def validate_conditions(data):
+    """Validate one set of soil and climate values
+
+    Returns a (conditions, error) pair where exactly one is None.
+    """
+    if not isinstance(data, dict):
+        return None, 'Expected an object with soil and climate values'
+    
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            return None, f'Missing required field: {field}'
+    
+    conditions = {}
+    for field in REQUIRED_FIELDS:
+        try:
+            value = float(data[field])
+        except (TypeError, ValueError) as e:
+            return None, f'Invalid input values: {str(e)}'
+        low, high, message = FIELD_LIMITS[field]
+        if not (low <= value <= high):
+            return None, message
+        conditions[field] = value
+    
+    return conditions, None
+
+def extract_batch_rows(data):
+    """Turn a batch payload into a list of per-row dicts
+
+    Accepts a bare JSON array of rows, {"rows": [...]}, or column arrays
+    as {"columns": {"N": [...], ...}}.
+    """
+    if isinstance(data, list):
+        return data
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON array of rows or an object with "rows" or "columns"')
+    if 'rows' in data:
+        if not isinstance(data['rows'], list):
+            raise ValueError('"rows" must be an array')
+        return data['rows']
+    if 'columns' in data:
+        columns = data['columns']
+        if not isinstance(columns, dict):
+            raise ValueError('"columns" must be an object of arrays')
+        lengths = {len(values) for values in columns.values() if isinstance(values, list)}
+        if len(lengths) != 1 or not all(isinstance(values, list) for values in columns.values()):
+            raise ValueError('All column arrays must be lists of the same length')
+        n_rows = lengths.pop()
+        return [
+            {field: values[i] for field, values in columns.items()}
+            for i in range(n_rows)
+        ]
+    raise ValueError('Expected a JSON array of rows or an object with "rows" or "columns"')
+
 @crop_bp.route('/recommend', methods=['POST'])
 @cross_origin()
 def recommend_crop():
@@ -38,62 +130,16 @@ def recommend_crop():
     try:
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Extract values
-        N = float(data['N'])
-        P = float(data['P'])
-        K = float(data['K'])
-        temperature = float(data['temperature'])
-        humidity = float(data['humidity'])
-        ph = float(data['ph'])
-        rainfall = float(data['rainfall'])
-        
-        # Validate ranges
-        if not (0 <= N <= 200):
-            return jsonify({'error': 'Nitrogen (N) should be between 0-200'}), 400
-        if not (0 <= P <= 200):
-            return jsonify({'error': 'Phosphorus (P) should be between 0-200'}), 400
-        if not (0 <= K <= 200):
-            return jsonify({'error': 'Potassium (K) should be between 0-200'}), 400
-        if not (0 <= temperature <= 50):
-            return jsonify({'error': 'Temperature should be between 0-50°C'}), 400
-        if not (0 <= humidity <= 100):
-            return jsonify({'error': 'Humidity should be between 0-100%'}), 400
-        if not (0 <= ph <= 14):
-            return jsonify({'error': 'pH should be between 0-14'}), 400
-        if not (0 <= rainfall <= 500):
-            return jsonify({'error': 'Rainfall should be between 0-500mm'}), 400
-        
-        # Get recommendation
-        best_crop, top_crops = chatbot.predict_crop(N, P, K, temperature, humidity, ph, rainfall)
-        crop_details = chatbot.get_crop_details(best_crop)
+        conditions, error = validate_conditions(data)
+        if error:
+            return jsonify({'error': error}), 400
         
-        response = {
-            'success': True,
-            'input_conditions': {
-                'N': N,
-                'P': P,
-                'K': K,
-                'temperature': temperature,
-                'humidity': humidity,
-                'ph': ph,
-                'rainfall': rainfall
-            },
-            'recommended_crop': best_crop,
-            'top_recommendations': [
-                {'crop': crop, 'confidence': float(confidence)}
-                for crop, confidence in top_crops
-            ],
-            'crop_details': crop_details,
-            'formatted_recommendation': chatbot.format_crop_recommendation(
-                N, P, K, temperature, humidity, ph, rainfall
-            )
-        }
+        # Run the model once; every part of the response renders from this result
+        result = chatbot.recommend(**conditions)
+        
+        # The markdown text is only built when the client asks for it
+        include_formatted = bool(data.get('include_formatted', False))
+        response = result.to_dict(include_formatted=include_formatted)
         
         return jsonify(response)
         
@@ -102,6 +148,103 @@ def recommend_crop():
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@crop_bp.route('/recommend/batch', methods=['POST'])
+@cross_origin()
+def recommend_crops_batch():
+    """Endpoint for scoring many rows of soil and climate data in one inference pass"""
+    global chatbot
+    
+    if chatbot is None:
+        if not init_chatbot():
+            return jsonify({'error': 'Chatbot initialization failed'}), 500
+    
+    try:
+        data = request.get_json()
+        
+        try:
+            rows = extract_batch_rows(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if len(rows) > MAX_BATCH_ROWS:
+            return jsonify({'error': f'Batch too large: at most {MAX_BATCH_ROWS} rows per request'}), 400
+        
+        top_k = 3
+        if isinstance(data, dict) and 'top_k' in data:
+            try:
+                top_k = int(data['top_k'])
+            except (TypeError, ValueError):
+                return jsonify({'error': 'top_k must be an integer'}), 400
+            if top_k < 1:
+                return jsonify({'error': 'top_k must be at least 1'}), 400
+        
+        # Validate every row, keeping per-row errors instead of failing the batch
+        results = [None] * len(rows)
+        valid_indices = []
+        features = []
+        for index, row in enumerate(rows):
+            conditions, error = validate_conditions(row)
+            if error:
+                results[index] = {'index': index, 'success': False, 'error': error}
+                continue
+            valid_indices.append(index)
+            features.append([conditions[field] for field in REQUIRED_FIELDS])
+        
+        best_crops, top_crops = chatbot.predict_crops_batch(
+            np.asarray(features, dtype=np.float64).reshape(-1, len(REQUIRED_FIELDS)), top_k=top_k
+        )
+        
+        for index, best_crop, top in zip(valid_indices, best_crops, top_crops):
+            results[index] = {
+                'index': index,
+                'success': True,
+                'recommended_crop': best_crop,
+                'top_recommendations': [
+                    {'crop': crop, 'confidence': confidence}
+                    for crop, confidence in top
+                ]
+            }
+        
+        return jsonify({
+            'success': True,
+            'total_rows': len(rows),
+            'valid_rows': len(valid_indices),
+            'invalid_rows': len(rows) - len(valid_indices),
+            'results': results
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+def sse_event(event, payload):
+    """One Server-Sent Events frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def stream_chat_events(user_message, conversation_history, session_id=None):
+    """'token' events as the answer arrives, then 'done' with the full text"""
+    # Sent at once so the browser sees the stream open before the first token
+    yield ": stream open\n\n"
+    parts = []
+    try:
+        for text in chatbot.stream_user_input(user_message, conversation_history):
+            parts.append(text)
+            yield sse_event('token', {'text': text})
+    except Exception as e:
+        yield sse_event('error', {'error': f'Internal server error: {str(e)}'})
+        return
+    response_text = ''.join(parts)
+    if session_id is not None:
+        get_session_store().append(session_id,
+                                   {'role': 'user', 'content': user_message},
+                                   {'role': 'assistant', 'content': response_text})
+    yield sse_event('done', {
+        'success': True,
+        'user_message': user_message,
+        'bot_response': response_text,
+        'session_id': session_id,
+        'timestamp': str(np.datetime64('now'))
+    })
+
 @crop_bp.route('/chat', methods=['POST'])
 @cross_origin()
 def chat():
@@ -120,14 +263,35 @@ def chat():
         
         user_message = data['message']
         conversation_history = data.get('conversation_history', [])
+        session_id = data.get('session_id')
+        
+        # Clients that still upload their own history are served statelessly;
+        # everyone else gets (or continues) a server-side session
+        if session_id or not conversation_history:
+            session_id = session_id or SessionStore.new_session_id()
+            conversation_history = get_session_store().history(session_id)
+        
+        # Stream tokens as Server-Sent Events when the client asks for them
+        if data.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            return Response(
+                stream_with_context(stream_chat_events(user_message, conversation_history, session_id)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
         
         # Process the message
-        response_text = chatbot.process_user_input(user_message)
+        response_text = chatbot.process_user_input(user_message, conversation_history)
+        
+        if session_id is not None:
+            get_session_store().append(session_id,
+                                       {'role': 'user', 'content': user_message},
+                                       {'role': 'assistant', 'content': response_text})
         
         response = {
             'success': True,
             'user_message': user_message,
             'bot_response': response_text,
+            'session_id': session_id,
             'timestamp': str(np.datetime64('now'))
         }
         
@@ -216,12 +380,13 @@ def get_agricultural_advice(topic):
             return jsonify({'error': 'Chatbot initialization failed'}), 500
     
     try:
-        advice = chatbot.get_agricultural_advice(topic)
+        advice, passages = chatbot.advice_with_passages(topic)
         
         response = {
             'success': True,
             'topic': topic,
-            'advice': advice
+            'advice': advice,
+            'passages': passages
         }
         
         return jsonify(response)
@@ -229,6 +394,34 @@ def get_agricultural_advice(topic):
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@crop_bp.route('/offline_bundle.json', methods=['GET'])
+@cross_origin()
+def get_offline_bundle():
+    """Distilled copy of the model for the browser's offline mode (see offline_bundle.py)"""
+    global chatbot
+    
+    if chatbot is None:
+        if not init_chatbot():
+            return jsonify({'error': 'Chatbot initialization failed'}), 500
+    
+    chatbot.artifacts.refresh(['offline_bundle'])
+    try:
+        bundle = chatbot.artifacts.get('offline_bundle')
+    except FileNotFoundError:
+        return jsonify({'error': 'Offline bundle not built'}), 404
+    return asset_response(bundle)
+
+@crop_bp.route('/registry.js', methods=['GET'])
+@cross_origin()
+def get_offline_registry():
+    """Crop table for the browser's offline model, loaded by index.html as a script"""
+    snapshot = default_registry().snapshot
+    body = 'window.CROP_REGISTRY = ' + json.dumps(snapshot.offline_table(), separators=(',', ':'), ensure_ascii=False) + ';\n'
+    response = Response(body, mimetype='application/javascript')
+    response.set_etag(hashlib.sha256(body.encode('utf-8')).hexdigest()[:32])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @crop_bp.route('/health', methods=['GET'])
 @cross_origin()
 def health_check():
@@ -241,9 +434,11 @@ def health_check():
         'success': True,
         'status': 'healthy',
         'chatbot_status': chatbot_status,
+        'artifacts': chatbot.artifacts.report() if chatbot is not None else None,
+        'recommendation_cache': chatbot.recommendation_cache.stats() if chatbot is not None else None,
+        'llm': chatbot.llm.stats() if chatbot is not None else None,
+        'response_cache': chatbot.response_cache.stats() if chatbot is not None else None,
+        'prompt': chatbot.prompt_builder.stats() if chatbot is not None and chatbot._prompt_builder is not None else None,
+        'sessions': sessions.stats() if sessions is not None else None,
         'message': 'Crop recommendation API is running'
     })
-
-# Initialize chatbot when module is imported
-init_chatbot()
-
@@ -1,154 +1,68 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_cors import cross_origin
+import hashlib
 import json
 import os
+import sys
+
+# Add the src directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from artifacts import ArtifactStore
+from recommendation_cache import RecommendationCache
+from rule_engine import RuleEngine, RULE_FEATURES
+from intent_router import IntentRouter
+from prerender import Prerenderer, PrerenderedResponse
+from knowledge_index import KnowledgeIndex, KNOWLEDGE_FILES, format_passages
+from crop_registry import default_registry
+from static_assets import asset_response
 
 crop_enhanced_bp = Blueprint('crop_enhanced', __name__)
 
+# Artifact paths resolve as on the ML API: CROPBOT_<NAME>_PATH, then
+# CROPBOT_ARTIFACT_DIR, then src/
+ARTIFACTS = ArtifactStore()
+
 # Load the enhanced agricultural knowledge base
 def load_agricultural_knowledge():
     try:
-        with open('/home/ubuntu/agricultural_knowledge.json', 'r') as f:
+        with open(ARTIFACTS.paths['agricultural_knowledge'], 'r') as f:
             return json.load(f)
     except FileNotFoundError:
         return {}
 
 AGRICULTURAL_KNOWLEDGE = load_agricultural_knowledge()
 
-# Simple crop data without ML dependencies
-CROP_DATA = {
-    "rice": {
-        "name": "Rice",
-        "category": "cereal",
-        "optimal_conditions": {
-            "temperature": "20-35°C",
-            "humidity": "80-90%",
-            "rainfall": "150-300cm",
-            "ph": "5.5-7.0"
-        },
-        "description": "Rice is a staple food crop that requires high humidity and abundant water.",
-        "fielding": {
-            "land_preparation": "Prepare flooded fields with proper leveling. Use puddling to create a water-tight layer.",
-            "planting": "Transplant 20-25 day old seedlings with 20x15 cm spacing. Plant 2-3 seedlings per hill.",
-            "spacing": "20 cm between rows, 15 cm between plants"
-        },
-        "management": {
-            "water": "Maintain 2-5 cm water depth throughout growing season. Drain before harvest.",
-            "nutrients": "Apply 120 kg N, 60 kg P2O5, 40 kg K2O per hectare in split doses.",
-            "weeds": "Use pre-emergence herbicides and manual weeding at 20-25 days after transplanting."
-        },
-        "maintenance": {
-            "disease_prevention": "Use resistant varieties, proper spacing, and avoid excessive nitrogen.",
-            "pest_control": "Monitor for stem borer, brown planthopper. Use IPM strategies.",
-            "harvesting": "Harvest when 80% of grains are golden yellow. Moisture content should be 20-25%."
-        }
-    },
-    "maize": {
-        "name": "Maize",
-        "category": "cereal", 
-        "optimal_conditions": {
-            "temperature": "21-27°C",
-            "humidity": "60-70%",
-            "rainfall": "50-75cm",
-            "ph": "6.0-7.5"
-        },
-        "description": "Maize is a versatile crop that can grow in various climatic conditions.",
-        "fielding": {
-            "land_preparation": "Deep plowing followed by 2-3 harrowings. Create ridges and furrows for drainage.",
-            "planting": "Plant seeds 2-3 cm deep with 60-75 cm row spacing and 20-25 cm plant spacing.",
-            "spacing": "60-75 cm between rows, 20-25 cm between plants"
-        },
-        "management": {
-            "water": "Requires 500-800 mm water. Critical stages: tasseling and grain filling.",
-            "nutrients": "Apply 150 kg N, 75 kg P2O5, 50 kg K2O per hectare. Side-dress nitrogen at knee-high stage.",
-            "weeds": "Pre-emergence herbicides followed by inter-cultivation at 25-30 days."
-        },
-        "maintenance": {
-            "disease_prevention": "Use certified seeds, crop rotation, and balanced nutrition.",
-            "pest_control": "Monitor for fall armyworm, corn borer. Use pheromone traps and biological control.",
-            "harvesting": "Harvest when husks are dry and kernels have black layer formation. Moisture 15-20%."
-        }
-    },
-    "wheat": {
-        "name": "Wheat",
-        "category": "cereal",
-        "optimal_conditions": {
-            "temperature": "15-25°C",
-            "humidity": "50-60%",
-            "rainfall": "30-100cm",
-            "ph": "6.0-7.5"
-        },
-        "description": "Wheat is a major cereal grain and staple food worldwide.",
-        "fielding": {
-            "land_preparation": "Deep plowing in summer, followed by 2-3 cultivations. Level the field properly.",
-            "planting": "Sow seeds 2-3 cm deep with 20-23 cm row spacing. Seed rate: 100-125 kg/ha.",
-            "spacing": "20-23 cm between rows, continuous seeding within rows"
-        },
-        "management": {
-            "water": "Requires 450-650 mm water. Critical stages: crown root initiation, tillering, flowering.",
-            "nutrients": "Apply 120 kg N, 60 kg P2O5, 40 kg K2O per hectare in split applications.",
-            "weeds": "Use pre-emergence herbicides and one hand weeding at 30-35 days."
-        },
-        "maintenance": {
-            "disease_prevention": "Use resistant varieties, seed treatment, and proper crop rotation.",
-            "pest_control": "Monitor for aphids, termites. Use integrated pest management.",
-            "harvesting": "Harvest when grains are hard and moisture content is 12-14%."
-        }
-    },
-    "cotton": {
-        "name": "Cotton",
-        "category": "cash_crop",
-        "optimal_conditions": {
-            "temperature": "21-30°C",
-            "humidity": "50-80%",
-            "rainfall": "50-100cm",
-            "ph": "5.8-8.0"
-        },
-        "description": "Cotton is an important cash crop used in textile production.",
-        "fielding": {
-            "land_preparation": "Deep plowing followed by harrowing. Create ridges and furrows for proper drainage.",
-            "planting": "Plant seeds 2-3 cm deep with 60-90 cm row spacing and 10-15 cm plant spacing.",
-            "spacing": "60-90 cm between rows, 10-15 cm between plants"
-        },
-        "management": {
-            "water": "Requires 700-1300 mm water. Critical stages: flowering and boll development.",
-            "nutrients": "Apply 150 kg N, 75 kg P2O5, 75 kg K2O per hectare in split doses.",
-            "weeds": "Use pre-emergence herbicides and 2-3 inter-cultivations."
-        },
-        "maintenance": {
-            "disease_prevention": "Use resistant varieties, seed treatment, and crop rotation.",
-            "pest_control": "Monitor for bollworm, whitefly. Use IPM with pheromone traps and beneficial insects.",
-            "harvesting": "Hand-pick when bolls are fully opened and fibers are dry. Multiple pickings required."
-        }
-    },
-    "apple": {
-        "name": "Apple",
-        "category": "fruit",
-        "optimal_conditions": {
-            "temperature": "15-25°C",
-            "humidity": "60-70%",
-            "rainfall": "100-125cm",
-            "ph": "6.0-7.0"
-        },
-        "description": "Apples are popular fruits that require temperate climate conditions.",
-        "fielding": {
-            "land_preparation": "Prepare pits 1m x 1m x 1m size. Fill with organic matter and topsoil.",
-            "planting": "Plant grafted saplings during dormant season. Space 4-6 meters apart.",
-            "spacing": "4-6 meters between trees in all directions"
-        },
-        "management": {
-            "water": "Deep watering weekly. Drip irrigation preferred. Mulch around trees.",
-            "nutrients": "Apply balanced NPK fertilizer. Organic compost annually in spring.",
-            "weeds": "Maintain weed-free circle around trees. Use mulching and manual weeding."
-        },
-        "maintenance": {
-            "disease_prevention": "Prune for air circulation. Use copper sprays during dormancy.",
-            "pest_control": "Monitor for codling moth, aphids. Use pheromone traps and beneficial insects.",
-            "harvesting": "Harvest when fruits are fully colored and easily separate from branch. Handle gently.",
-            "pruning": "Annual pruning during dormancy. Remove dead, diseased, and crossing branches."
-        }
-    }
-}
+# Crop facts are shared with the other blueprints through the registry
+# (crop_registry.json), which swaps in a new snapshot when the file changes
+REGISTRY = default_registry()
+CROP_DATA = REGISTRY.snapshot.crop_data()
+
+# Suitability rules compiled once from CROP_DATA's optimal conditions
+RULES = RuleEngine(CROP_DATA)
+
+# Cache of rule-engine results keyed on quantized inputs, dropped whenever
+# the rule table is recompiled
+RULE_CACHE = RecommendationCache(maxsize=4096, version_fn=lambda: RULES.version, check_interval=0)
+
+# Chat intents in priority order; a message mentioning several is answered by the first
+CHAT_INTENTS = [
+    ('land_preparation', ['land preparation', 'prepare land', 'soil preparation', 'tillage', 'plowing']),
+    ('planting', ['planting', 'sowing', 'seeding', 'transplanting', 'spacing']),
+    ('nutrients', ['nutrient', 'fertilizer', 'nitrogen', 'phosphorus', 'potassium', 'npk']),
+    ('water', ['water', 'irrigation', 'watering', 'drought', 'moisture']),
+    ('weeds', ['weed', 'weeding', 'herbicide', 'weed control']),
+    ('disease', ['disease', 'fungus', 'bacteria', 'virus', 'disease prevention']),
+    ('pruning', ['pruning', 'trimming', 'cutting', 'prune']),
+    ('harvesting', ['harvest', 'harvesting', 'picking', 'when to harvest']),
+    ('rice', ['rice', 'paddy']),
+    ('maize', ['maize', 'corn']),
+    ('wheat', ['wheat']),
+    ('cotton', ['cotton']),
+    ('apple', ['apple']),
+]
+
+CHAT_ROUTER = IntentRouter(CHAT_INTENTS)
 
 ENHANCED_AGRICULTURAL_ADVICE = {
     "land_preparation": {
@@ -234,198 +148,13 @@ ENHANCED_AGRICULTURAL_ADVICE = {
     }
 }
 
-@crop_enhanced_bp.route('/health', methods=['GET'])
-@cross_origin()
-def health_check():
-    """Health check endpoint"""
-    return jsonify({
-        'success': True,
-        'status': 'healthy',
-        'message': 'Enhanced Crop recommendation API is running',
-        'version': '2.0.0-enhanced',
-        'features': ['crop_recommendation', 'detailed_chat', 'fielding_guidance', 'management_advice', 'maintenance_tips']
-    })
-
-@crop_enhanced_bp.route('/crops', methods=['GET'])
-@cross_origin()
-def get_crops():
-    """Get list of available crops with enhanced information"""
-    crops = list(CROP_DATA.keys())
-    categories = {}
+def render_chat_answer(intent, crop_info=None):
+    """Answer text for a chat intent, built from the crop's CROP_DATA entry where it applies"""
+    response = ""
     
-    for crop, data in CROP_DATA.items():
-        category = data['category']
-        if category not in categories:
-            categories[category] = []
-        categories[category].append(crop)
-    
-    return jsonify({
-        'success': True,
-        'crops': crops,
-        'categories': categories,
-        'total_crops': len(crops),
-        'enhanced_features': ['fielding', 'management', 'maintenance']
-    })
-
-@crop_enhanced_bp.route('/recommend', methods=['POST'])
-@cross_origin()
-def recommend_crop():
-    """Enhanced crop recommendation with detailed guidance"""
-    try:
-        data = request.get_json()
-        
-        # Validate required fields
-        required_fields = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Extract values
-        temperature = float(data['temperature'])
-        humidity = float(data['humidity'])
-        ph = float(data['ph'])
-        rainfall = float(data['rainfall'])
-        
-        # Simple rule-based recommendation
-        recommendations = []
-        
-        # Rice conditions
-        if (20 <= temperature <= 35 and humidity >= 80 and 
-            5.5 <= ph <= 7.0 and rainfall >= 150):
-            recommendations.append(('rice', 0.9))
-        
-        # Maize conditions  
-        if (21 <= temperature <= 27 and 60 <= humidity <= 70 and
-            6.0 <= ph <= 7.5 and 50 <= rainfall <= 75):
-            recommendations.append(('maize', 0.85))
-        
-        # Wheat conditions
-        if (15 <= temperature <= 25 and 50 <= humidity <= 60 and
-            6.0 <= ph <= 7.5 and 30 <= rainfall <= 100):
-            recommendations.append(('wheat', 0.8))
-        
-        # Cotton conditions
-        if (21 <= temperature <= 30 and 50 <= humidity <= 80 and
-            5.8 <= ph <= 8.0 and 50 <= rainfall <= 100):
-            recommendations.append(('cotton', 0.75))
-        
-        # Apple conditions
-        if (15 <= temperature <= 25 and 60 <= humidity <= 70 and
-            6.0 <= ph <= 7.0 and 100 <= rainfall <= 125):
-            recommendations.append(('apple', 0.7))
-        
-        # Default recommendation if no specific match
-        if not recommendations:
-            recommendations = [('rice', 0.5), ('maize', 0.4), ('wheat', 0.3)]
-        
-        # Sort by confidence
-        recommendations.sort(key=lambda x: x[1], reverse=True)
-        
-        # Format response with enhanced details
-        best_crop = recommendations[0][0]
-        top_recommendations = [
-            {'crop': crop, 'confidence': confidence}
-            for crop, confidence in recommendations[:3]
-        ]
-        
-        crop_details = CROP_DATA.get(best_crop, {})
-        
-        # Extract ranges from optimal conditions for frontend compatibility
-        optimal_conditions = crop_details.get('optimal_conditions', {})
-        
-        # Parse temperature range
-        temp_str = optimal_conditions.get('temperature', '20-30°C')
-        temp_range = [20, 30]  # default
-        try:
-            temp_parts = temp_str.replace('°C', '').split('-')
-            if len(temp_parts) == 2:
-                temp_range = [float(temp_parts[0]), float(temp_parts[1])]
-        except:
-            pass
-            
-        # Parse humidity range
-        humidity_str = optimal_conditions.get('humidity', '60-80%')
-        humidity_range = [60, 80]  # default
-        try:
-            humidity_parts = humidity_str.replace('%', '').split('-')
-            if len(humidity_parts) == 2:
-                humidity_range = [float(humidity_parts[0]), float(humidity_parts[1])]
-        except:
-            pass
-            
-        # Parse rainfall range
-        rainfall_str = optimal_conditions.get('rainfall', '100-200cm')
-        rainfall_range = [100, 200]  # default
-        try:
-            rainfall_parts = rainfall_str.replace('cm', '').replace('mm', '').split('-')
-            if len(rainfall_parts) == 2:
-                rainfall_range = [float(rainfall_parts[0]), float(rainfall_parts[1])]
-        except:
-            pass
-            
-        # Parse pH range
-        ph_str = optimal_conditions.get('ph', '6.0-7.0')
-        ph_range = [6.0, 7.0]  # default
-        try:
-            ph_parts = ph_str.split('-')
-            if len(ph_parts) == 2:
-                ph_range = [float(ph_parts[0]), float(ph_parts[1])]
-        except:
-            pass
-        
-        response = {
-            'success': True,
-            'input_conditions': {
-                'N': data['N'],
-                'P': data['P'], 
-                'K': data['K'],
-                'temperature': temperature,
-                'humidity': humidity,
-                'ph': ph,
-                'rainfall': rainfall
-            },
-            'recommended_crop': best_crop,
-            'top_recommendations': top_recommendations,
-            'crop_details': {
-                **crop_details,
-                'temperature_range': temp_range,
-                'humidity_range': humidity_range,
-                'rainfall_range': rainfall_range,
-                'ph_range': ph_range
-            },
-            'detailed_guidance': {
-                'fielding': crop_details.get('fielding', {}),
-                'management': crop_details.get('management', {}),
-                'maintenance': crop_details.get('maintenance', {})
-            },
-            'note': 'Enhanced recommendation system with detailed guidance'
-        }
-        
-        return jsonify(response)
-        
-    except ValueError as e:
-        return jsonify({'error': f'Invalid input values: {str(e)}'}), 400
-    except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
-
-@crop_enhanced_bp.route('/chat', methods=['POST'])
-@cross_origin()
-def enhanced_chat():
-    """Enhanced chat responses with detailed agricultural guidance"""
-    try:
-        data = request.get_json()
-        
-        if 'message' not in data:
-            return jsonify({'error': 'Missing message field'}), 400
-        
-        user_message = data['message'].lower()
-        
-        # Enhanced keyword-based responses
-        response = ""
-        
-        # Land preparation queries
-        if any(word in user_message for word in ['land preparation', 'prepare land', 'soil preparation', 'tillage', 'plowing']):
-            response = """Land preparation is crucial for successful crop establishment. Here's a step-by-step guide:
+    # Land preparation queries
+    if intent == 'land_preparation':
+        response = """Land preparation is crucial for successful crop establishment. Here's a step-by-step guide:
 
 1. **Primary Tillage**: Deep plowing (20-25 cm) to break hardpan and improve soil structure
 2. **Secondary Tillage**: Disking and harrowing to create a fine, level seedbed
@@ -435,9 +164,9 @@ def enhanced_chat():
 
 Benefits: Improves soil aeration, water infiltration, nutrient availability, and weed control."""
 
-        # Planting queries
-        elif any(word in user_message for word in ['planting', 'sowing', 'seeding', 'transplanting', 'spacing']):
-            response = """Proper planting techniques ensure optimal crop establishment:
+    # Planting queries
+    elif intent == 'planting':
+        response = """Proper planting techniques ensure optimal crop establishment:
 
 **Planting Methods**:
 - **Direct seeding**: Broadcasting, drilling, or precision planting
@@ -454,9 +183,9 @@ Benefits: Improves soil aeration, water infiltration, nutrient availability, and
 - Maize: 60-75 cm rows, 20-25 cm plants
 - Wheat: 20-23 cm row spacing"""
 
-        # Nutrient management queries
-        elif any(word in user_message for word in ['nutrient', 'fertilizer', 'nitrogen', 'phosphorus', 'potassium', 'npk']):
-            response = """Comprehensive nutrient management follows the 4R principles:
+    # Nutrient management queries
+    elif intent == 'nutrients':
+        response = """Comprehensive nutrient management follows the 4R principles:
 
 **The 4Rs**:
 1. **Right Source**: Choose appropriate fertilizer type
@@ -476,9 +205,9 @@ Benefits: Improves soil aeration, water infiltration, nutrient availability, and
 - Phosphorus: Purple/reddish leaves, poor roots
 - Potassium: Brown leaf edges, weak stems"""
 
-        # Water management queries
-        elif any(word in user_message for word in ['water', 'irrigation', 'watering', 'drought', 'moisture']):
-            response = """Efficient water management is essential for crop productivity:
+    # Water management queries
+    elif intent == 'water':
+        response = """Efficient water management is essential for crop productivity:
 
 **Irrigation Methods**:
 - **Drip irrigation**: Most efficient, 90-95% efficiency
@@ -497,9 +226,9 @@ Benefits: Improves soil aeration, water infiltration, nutrient availability, and
 - Germination and establishment
 - Flowering and fruit/grain development"""
 
-        # Weed control queries
-        elif any(word in user_message for word in ['weed', 'weeding', 'herbicide', 'weed control']):
-            response = """Integrated Weed Management (IWM) combines multiple strategies:
+    # Weed control queries
+    elif intent == 'weeds':
+        response = """Integrated Weed Management (IWM) combines multiple strategies:
 
 **Prevention**:
 - Use clean, certified seeds
@@ -525,9 +254,9 @@ Benefits: Improves soil aeration, water infiltration, nutrient availability, and
 - Post-emergence selective herbicides
 - Always follow label instructions"""
 
-        # Disease prevention queries
-        elif any(word in user_message for word in ['disease', 'fungus', 'bacteria', 'virus', 'disease prevention']):
-            response = """Disease prevention is more effective than treatment:
+    # Disease prevention queries
+    elif intent == 'disease':
+        response = """Disease prevention is more effective than treatment:
 
 **Prevention Strategies**:
 1. **Resistant Varieties**: Choose disease-resistant cultivars
@@ -548,9 +277,9 @@ Benefits: Improves soil aeration, water infiltration, nutrient availability, and
 - Learn to identify disease symptoms
 - Take action at first signs of disease"""
 
-        # Pruning queries
-        elif any(word in user_message for word in ['pruning', 'trimming', 'cutting', 'prune']):
-            response = """Proper pruning improves plant health and productivity:
+    # Pruning queries
+    elif intent == 'pruning':
+        response = """Proper pruning improves plant health and productivity:
 
 **Pruning Techniques**:
 - **Thinning**: Remove entire branches to improve light penetration
@@ -570,9 +299,9 @@ Benefits: Improves soil aeration, water infiltration, nutrient availability, and
 - Enhanced fruit/flower production
 - Disease prevention"""
 
-        # Harvesting queries
-        elif any(word in user_message for word in ['harvest', 'harvesting', 'picking', 'when to harvest']):
-            response = """Optimal harvesting ensures maximum quality and yield:
+    # Harvesting queries
+    elif intent == 'harvesting':
+        response = """Optimal harvesting ensures maximum quality and yield:
 
 **Timing Indicators**:
 - **Color**: Fruits/vegetables reach characteristic color
@@ -597,10 +326,10 @@ Benefits: Improves soil aeration, water infiltration, nutrient availability, and
 - Tomatoes: Full color, slight give when pressed
 - Apples: Easy separation from branch, full color"""
 
-        # Crop-specific queries
-        elif any(word in user_message for word in ['rice', 'paddy']):
-            crop_info = CROP_DATA.get('rice', {})
-            response = f"""Rice cultivation guide:
+    # Crop-specific queries
+    elif intent == 'rice':
+        crop_info = crop_info or {}
+        response = f"""Rice cultivation guide:
 
 **Land Preparation**: {crop_info.get('fielding', {}).get('land_preparation', 'Prepare flooded fields with proper leveling.')}
 
@@ -614,9 +343,9 @@ Benefits: Improves soil aeration, water infiltration, nutrient availability, and
 
 Rice requires flooded conditions and is typically grown in monsoon season."""
 
-        elif any(word in user_message for word in ['maize', 'corn']):
-            crop_info = CROP_DATA.get('maize', {})
-            response = f"""Maize cultivation guide:
+    elif intent == 'maize':
+        crop_info = crop_info or {}
+        response = f"""Maize cultivation guide:
 
 **Land Preparation**: {crop_info.get('fielding', {}).get('land_preparation', 'Deep plowing with proper drainage.')}
 
@@ -630,9 +359,9 @@ Rice requires flooded conditions and is typically grown in monsoon season."""
 
 Maize is versatile and can adapt to various climatic conditions."""
 
-        elif any(word in user_message for word in ['wheat']):
-            crop_info = CROP_DATA.get('wheat', {})
-            response = f"""Wheat cultivation guide:
+    elif intent == 'wheat':
+        crop_info = crop_info or {}
+        response = f"""Wheat cultivation guide:
 
 **Land Preparation**: {crop_info.get('fielding', {}).get('land_preparation', 'Deep plowing and proper field preparation.')}
 
@@ -646,9 +375,9 @@ Maize is versatile and can adapt to various climatic conditions."""
 
 Wheat is a major cereal crop grown in cooler seasons."""
 
-        elif any(word in user_message for word in ['cotton']):
-            crop_info = CROP_DATA.get('cotton', {})
-            response = f"""Cotton cultivation guide:
+    elif intent == 'cotton':
+        crop_info = crop_info or {}
+        response = f"""Cotton cultivation guide:
 
 **Land Preparation**: {crop_info.get('fielding', {}).get('land_preparation', 'Prepare ridges and furrows for drainage.')}
 
@@ -662,9 +391,9 @@ Wheat is a major cereal crop grown in cooler seasons."""
 
 Cotton is an important cash crop requiring warm climate."""
 
-        elif any(word in user_message for word in ['apple']):
-            crop_info = CROP_DATA.get('apple', {})
-            response = f"""Apple cultivation guide:
+    elif intent == 'apple':
+        crop_info = crop_info or {}
+        response = f"""Apple cultivation guide:
 
 **Land Preparation**: {crop_info.get('fielding', {}).get('land_preparation', 'Prepare large pits with organic matter.')}
 
@@ -680,9 +409,9 @@ Cotton is an important cash crop requiring warm climate."""
 
 Apples require temperate climate and careful management."""
 
-        # General agricultural advice
-        else:
-            response = """I'm your agricultural assistant! I can help you with:
+    # General agricultural advice
+    else:
+        response = """I'm your agricultural assistant! I can help you with:
 
 🌱 **Crop Fielding**: Land preparation, planting methods, spacing guidelines
 🌾 **Crop Management**: Nutrient management, water management, weed control
@@ -706,56 +435,328 @@ Apples require temperate climate and careful management."""
 - "When should I harvest cotton?"
 
 Feel free to ask about any aspect of crop cultivation!"""
+    
+    return response
+
+GUIDANCE_TYPES = ['fielding', 'management', 'maintenance']
+
+GENERAL_ADVICE = "General agricultural advice: Focus on soil health, proper irrigation, integrated pest management, and sustainable farming practices. For detailed guidance, try topics like: land_preparation, planting, nutrient_management, water_management, weed_control, disease_prevention, pruning, harvesting."
+
+# Serialized bodies of every static answer, rebuilt only when their source data changes
+PRERENDERED = Prerenderer()
+
+def _build_chat_response(intent, source):
+    return PrerenderedResponse({
+        'success': True,
+        'user_message': None,
+        'bot_response': render_chat_answer(intent, source),
+        'response_type': 'enhanced_guidance',
+        'intent': None,
+        'note': 'Enhanced chat system with detailed agricultural guidance'
+    }, slots=('user_message', 'intent'))
+
+def _build_crops_response(key, source):
+    return PrerenderedResponse({
+        'success': True,
+        'crops': source['crops'],
+        'categories': source['categories'],
+        'total_crops': len(source['crops']),
+        'enhanced_features': ['fielding', 'management', 'maintenance']
+    })
+
+def _build_crop_response(crop_name, crop_info):
+    return PrerenderedResponse({
+        'success': True,
+        'crop_name': crop_name,
+        'crop_details': crop_info,
+        'enhanced_features': ['fielding', 'management', 'maintenance']
+    })
+
+def _build_advice_response(topic, advice_data):
+    return PrerenderedResponse({
+        'success': True,
+        'topic': None,
+        'advice': advice_data if topic is not None else GENERAL_ADVICE
+    }, slots=('topic',))
+
+def _build_guidance_response(key, guidance_data):
+    crop_name, guidance_type = key
+    return PrerenderedResponse({
+        'success': True,
+        'crop_name': crop_name,
+        'guidance_type': guidance_type,
+        'guidance': guidance_data
+    })
+
+def prerender_responses(crop_data, advice):
+    """Render any static response whose crop data or advice source changed
+
+    Every namespace is built from the given data and published in one swap.
+    """
+    categories = {}
+    for crop, data in crop_data.items():
+        categories.setdefault(data['category'], []).append(crop)
+
+    advice_sources = {None: GENERAL_ADVICE}
+    advice_sources.update(advice)
+
+    return PRERENDERED.sync_all({
+        'chat': ({intent: crop_data.get(intent) for intent in [None] + CHAT_ROUTER.intents}, _build_chat_response),
+        'crops': ({None: {'crops': list(crop_data.keys()), 'categories': categories}}, _build_crops_response),
+        'crop': (dict(crop_data), _build_crop_response),
+        'advice': (advice_sources, _build_advice_response),
+        'guidance': ({
+            (crop, guidance_type): data.get(guidance_type, {})
+            for crop, data in crop_data.items() for guidance_type in GUIDANCE_TYPES
+        }, _build_guidance_response),
+    })
+
+def reload_content(crop_data=None, advice=None):
+    """Swap in new crop data and/or advice, rebuilding only the affected responses
+
+    The responses are rendered from the new data before it is published, and
+    the routes take a missing prerendered entry to mean "not found", so a
+    request during a reload answers from either the old or the new set.
+    """
+    global CROP_DATA, ENHANCED_AGRICULTURAL_ADVICE
+    rebuilt = prerender_responses(CROP_DATA if crop_data is None else crop_data,
+                                  ENHANCED_AGRICULTURAL_ADVICE if advice is None else advice)
+    if crop_data is not None:
+        CROP_DATA = crop_data
+        RULES.compile(CROP_DATA)
+    if advice is not None:
+        ENHANCED_AGRICULTURAL_ADVICE = advice
+    return rebuilt
+
+# Registry reloads rebuild the rules and only the responses whose crop changed
+REGISTRY.subscribe(lambda snapshot: reload_content(crop_data=snapshot.crop_data()))
+
+prerender_responses(CROP_DATA, ENHANCED_AGRICULTURAL_ADVICE)
+
+# Passage search over the knowledge files and CROP_DATA; each file is
+# re-indexed when it changes on disk, CROP_DATA when the rules recompile
+KNOWLEDGE = KnowledgeIndex()
+for _name in KNOWLEDGE_FILES:
+    KNOWLEDGE.add_json_file(_name, ARTIFACTS.paths[_name])
+KNOWLEDGE.add_source('crop_data', lambda: CROP_DATA, lambda: RULES.version)
+
+@crop_enhanced_bp.before_request
+def refresh_registry():
+    """Pick up edits to the crop data files (checked at most once a second)"""
+    REGISTRY.refresh()
+
+@crop_enhanced_bp.route('/health', methods=['GET'])
+@cross_origin()
+def health_check():
+    """Health check endpoint"""
+    return jsonify({
+        'success': True,
+        'status': 'healthy',
+        'message': 'Enhanced Crop recommendation API is running',
+        'version': '2.0.0-enhanced',
+        'features': ['crop_recommendation', 'detailed_chat', 'fielding_guidance', 'management_advice', 'maintenance_tips'],
+        'recommendation_cache': RULE_CACHE.stats(),
+        'prerendered': PRERENDERED.stats(),
+        'knowledge_index': KNOWLEDGE.stats(),
+        'crop_registry': REGISTRY.stats()
+    })
+
+@crop_enhanced_bp.route('/crops', methods=['GET'])
+@cross_origin()
+def get_crops():
+    """Get list of available crops with enhanced information"""
+    return PRERENDERED.respond('crops', None)
+
+@crop_enhanced_bp.route('/recommend', methods=['POST'])
+@cross_origin()
+def recommend_crop():
+    """Enhanced crop recommendation with detailed guidance"""
+    try:
+        data = request.get_json()
+        
+        # Validate required fields
+        required_fields = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+        for field in required_fields:
+            if field not in data:
+                return jsonify({'error': f'Missing required field: {field}'}), 400
+        
+        # Extract values
+        temperature = float(data['temperature'])
+        humidity = float(data['humidity'])
+        ph = float(data['ph'])
+        rainfall = float(data['rainfall'])
+        
+        # Near-identical readings share one cached rule evaluation
+        conditions = {
+            'N': data['N'],
+            'P': data['P'],
+            'K': data['K'],
+            'temperature': temperature,
+            'humidity': humidity,
+            'ph': ph,
+            'rainfall': rainfall
+        }
+        cache_key = RULE_CACHE.key(conditions)
+        recommendations = RULE_CACHE.get(cache_key)
+        if recommendations is None:
+            # Graded scores for every crop from the precompiled rule table
+            recommendations = RULES.recommend(conditions, top_k=3)
+            RULE_CACHE.put(cache_key, recommendations)
+        
+        # Format response with enhanced details
+        best_crop = recommendations[0][0]
+        top_recommendations = [
+            {'crop': crop, 'confidence': confidence}
+            for crop, confidence in recommendations
+        ]
+        
+        crop_details = CROP_DATA.get(best_crop, {})
+        
+        response = {
+            'success': True,
+            'input_conditions': {
+                'N': data['N'],
+                'P': data['P'], 
+                'K': data['K'],
+                'temperature': temperature,
+                'humidity': humidity,
+                'ph': ph,
+                'rainfall': rainfall
+            },
+            'recommended_crop': best_crop,
+            'top_recommendations': top_recommendations,
+            'crop_details': {
+                **crop_details,
+                # Ranges parsed once at startup, for frontend compatibility
+                **RULES.ranges_for(best_crop)
+            },
+            'detailed_guidance': {
+                'fielding': crop_details.get('fielding', {}),
+                'management': crop_details.get('management', {}),
+                'maintenance': crop_details.get('maintenance', {})
+            },
+            'note': 'Enhanced recommendation system with detailed guidance'
+        }
+        
+        return jsonify(response)
+        
+    except ValueError as e:
+        return jsonify({'error': f'Invalid input values: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@crop_enhanced_bp.route('/recommend/batch', methods=['POST'])
+@cross_origin()
+def recommend_crops_batch():
+    """Score many rows against the rule table in one vectorized pass"""
+    try:
+        data = request.get_json()
+        rows = data.get('rows') if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            return jsonify({'error': 'Expected a JSON array of rows or an object with "rows"'}), 400
+        
+        # Per-row validation errors are reported by index instead of failing the batch
+        results = [None] * len(rows)
+        valid_indices = []
+        features = []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                results[index] = {'index': index, 'success': False, 'error': 'Expected an object'}
+                continue
+            missing = [field for field in RULE_FEATURES if field not in row]
+            if missing:
+                results[index] = {'index': index, 'success': False, 'error': f'Missing required field: {missing[0]}'}
+                continue
+            try:
+                features.append([float(row[field]) for field in RULE_FEATURES])
+            except (TypeError, ValueError) as e:
+                results[index] = {'index': index, 'success': False, 'error': f'Invalid input values: {str(e)}'}
+                continue
+            valid_indices.append(index)
+        
+        if features:
+            for index, recommendations in zip(valid_indices, RULES.recommend_batch(features, top_k=3)):
+                results[index] = {
+                    'index': index,
+                    'success': True,
+                    'recommended_crop': recommendations[0][0],
+                    'top_recommendations': [
+                        {'crop': crop, 'confidence': confidence}
+                        for crop, confidence in recommendations
+                    ]
+                }
         
         return jsonify({
             'success': True,
-            'user_message': data['message'],
-            'bot_response': response,
-            'response_type': 'enhanced_guidance',
-            'note': 'Enhanced chat system with detailed agricultural guidance'
+            'total_rows': len(rows),
+            'valid_rows': len(valid_indices),
+            'results': results
         })
         
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@crop_enhanced_bp.route('/chat', methods=['POST'])
+@cross_origin()
+def enhanced_chat():
+    """Enhanced chat responses with detailed agricultural guidance"""
+    try:
+        data = request.get_json()
+        
+        if 'message' not in data:
+            return jsonify({'error': 'Missing message field'}), 400
+        
+        user_message = data['message'].lower()
+        
+        # Every keyword list is matched in one pass; the highest priority intent answers
+        match = CHAT_ROUTER.route(user_message)
+        
+        # Messages outside the guided topics are answered from the knowledge base
+        if match.intent is None:
+            passages = KNOWLEDGE.search(user_message, k=3)
+            if passages:
+                return jsonify({
+                    'success': True,
+                    'user_message': data['message'],
+                    'bot_response': format_passages(passages),
+                    'response_type': 'knowledge_search',
+                    'passages': [passage.to_dict(score) for score, passage in passages],
+                    'intent': match.to_dict(),
+                    'note': 'Enhanced chat system with detailed agricultural guidance'
+                })
+        
+        return PRERENDERED.respond('chat', match.intent, user_message=data['message'], intent=match.to_dict())
+        
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 @crop_enhanced_bp.route('/crop/<crop_name>', methods=['GET'])
 @cross_origin()
 def get_enhanced_crop_info(crop_name):
     """Get enhanced information about a specific crop"""
-    crop_name_lower = crop_name.lower()
-    
-    if crop_name_lower not in CROP_DATA:
+    response = PRERENDERED.respond('crop', crop_name.lower())
+    if response is None:
         return jsonify({'error': f'Crop "{crop_name}" not found'}), 404
     
-    crop_info = CROP_DATA[crop_name_lower]
-    
-    return jsonify({
-        'success': True,
-        'crop_name': crop_name_lower,
-        'crop_details': crop_info,
-        'enhanced_features': ['fielding', 'management', 'maintenance']
-    })
+    return response
 
 @crop_enhanced_bp.route('/advice/<topic>', methods=['GET'])
 @cross_origin()
 def get_enhanced_agricultural_advice(topic):
     """Get enhanced agricultural advice on specific topics"""
-    topic_lower = topic.lower()
+    response = PRERENDERED.respond('advice', topic.lower(), topic=topic)
+    if response is not None:
+        return response
     
-    if topic_lower not in ENHANCED_AGRICULTURAL_ADVICE:
+    passages = KNOWLEDGE.search(topic, k=3)
+    if passages:
         return jsonify({
             'success': True,
             'topic': topic,
-            'advice': "General agricultural advice: Focus on soil health, proper irrigation, integrated pest management, and sustainable farming practices. For detailed guidance, try topics like: land_preparation, planting, nutrient_management, water_management, weed_control, disease_prevention, pruning, harvesting."
+            'advice': format_passages(passages),
+            'passages': [passage.to_dict(score) for score, passage in passages]
         })
-    
-    advice_data = ENHANCED_AGRICULTURAL_ADVICE[topic_lower]
-    
-    return jsonify({
-        'success': True,
-        'topic': topic,
-        'advice': advice_data
-    })
+    return PRERENDERED.respond('advice', None, topic=topic)
 
 @crop_enhanced_bp.route('/guidance/<crop_name>/<guidance_type>', methods=['GET'])
 @cross_origin()
@@ -764,19 +765,34 @@ def get_crop_guidance(crop_name, guidance_type):
     crop_name_lower = crop_name.lower()
     guidance_type_lower = guidance_type.lower()
     
-    if crop_name_lower not in CROP_DATA:
-        return jsonify({'error': f'Crop "{crop_name}" not found'}), 404
-    
-    if guidance_type_lower not in ['fielding', 'management', 'maintenance']:
-        return jsonify({'error': f'Guidance type "{guidance_type}" not supported. Use: fielding, management, or maintenance'}), 400
+    if guidance_type_lower in GUIDANCE_TYPES:
+        response = PRERENDERED.respond('guidance', (crop_name_lower, guidance_type_lower))
+        if response is not None:
+            return response
     
-    crop_info = CROP_DATA[crop_name_lower]
-    guidance_data = crop_info.get(guidance_type_lower, {})
+    if PRERENDERED.get('crop', crop_name_lower) is None:
+        return jsonify({'error': f'Crop "{crop_name}" not found'}), 404
     
-    return jsonify({
-        'success': True,
-        'crop_name': crop_name_lower,
-        'guidance_type': guidance_type_lower,
-        'guidance': guidance_data
-    })
+    return jsonify({'error': f'Guidance type "{guidance_type}" not supported. Use: fielding, management, or maintenance'}), 400
 
+@crop_enhanced_bp.route('/registry.js', methods=['GET'])
+@cross_origin()
+def get_offline_registry():
+    """Crop table for the browser's offline model, loaded by index.html as a script"""
+    snapshot = REGISTRY.snapshot
+    body = 'window.CROP_REGISTRY = ' + json.dumps(snapshot.offline_table(), separators=(',', ':'), ensure_ascii=False) + ';\n'
+    response = Response(body, mimetype='application/javascript')
+    response.set_etag(hashlib.sha256(body.encode('utf-8')).hexdigest()[:32])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@crop_enhanced_bp.route('/offline_bundle.json', methods=['GET'])
+@cross_origin()
+def get_offline_bundle():
+    """Distilled copy of the trained model for the browser's offline mode, preloaded by index.html"""
+    ARTIFACTS.refresh(['offline_bundle'])
+    try:
+        bundle = ARTIFACTS.get('offline_bundle')
+    except FileNotFoundError:
+        return jsonify({'error': 'Offline bundle not built'}), 404
+    return asset_response(bundle)
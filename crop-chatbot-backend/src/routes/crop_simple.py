@@ -2,67 +2,22 @@ from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin
 import json
 import os
+import sys
+
+# Add the src directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from crop_registry import default_registry
 
 crop_bp = Blueprint('crop', __name__)
 
-# Simple crop data without ML dependencies
-CROP_DATA = {
-    "rice": {
-        "name": "Rice",
-        "category": "cereal",
-        "optimal_conditions": {
-            "temperature": "20-35°C",
-            "humidity": "80-90%",
-            "rainfall": "150-300cm",
-            "ph": "5.5-7.0"
-        },
-        "description": "Rice is a staple food crop that requires high humidity and abundant water."
-    },
-    "maize": {
-        "name": "Maize",
-        "category": "cereal", 
-        "optimal_conditions": {
-            "temperature": "21-27°C",
-            "humidity": "60-70%",
-            "rainfall": "50-75cm",
-            "ph": "6.0-7.5"
-        },
-        "description": "Maize is a versatile crop that can grow in various climatic conditions."
-    },
-    "wheat": {
-        "name": "Wheat",
-        "category": "cereal",
-        "optimal_conditions": {
-            "temperature": "15-25°C",
-            "humidity": "50-60%",
-            "rainfall": "30-100cm",
-            "ph": "6.0-7.5"
-        },
-        "description": "Wheat is a major cereal grain and staple food worldwide."
-    },
-    "cotton": {
-        "name": "Cotton",
-        "category": "cash_crop",
-        "optimal_conditions": {
-            "temperature": "21-30°C",
-            "humidity": "50-80%",
-            "rainfall": "50-100cm",
-            "ph": "5.8-8.0"
-        },
-        "description": "Cotton is an important cash crop used in textile production."
-    },
-    "apple": {
-        "name": "Apple",
-        "category": "fruit",
-        "optimal_conditions": {
-            "temperature": "15-25°C",
-            "humidity": "60-70%",
-            "rainfall": "100-125cm",
-            "ph": "6.0-7.0"
-        },
-        "description": "Apples are popular fruits that require temperate climate conditions."
-    }
-}
+# Crop facts come from the shared registry (crop_registry.json); this
+# blueprint shows them without the detailed guidance
+REGISTRY = default_registry()
+
+def crop_data():
+    """Crop key -> summary dict from the current registry snapshot"""
+    return REGISTRY.snapshot.crop_data(detailed=False)
 
 AGRICULTURAL_ADVICE = {
     "pest": {
@@ -112,10 +67,11 @@ def health_check():
 @cross_origin()
 def get_crops():
     """Get list of available crops"""
-    crops = list(CROP_DATA.keys())
+    crops_data = crop_data()
+    crops = list(crops_data.keys())
     categories = {}
     
-    for crop, data in CROP_DATA.items():
+    for crop, data in crops_data.items():
         category = data['category']
         if category not in categories:
             categories[category] = []
@@ -189,7 +145,7 @@ def recommend_crop():
             for crop, confidence in recommendations[:3]
         ]
         
-        crop_details = CROP_DATA.get(best_crop, {})
+        crop_details = crop_data().get(best_crop, {})
         
         response = {
             'success': True,
@@ -259,10 +215,11 @@ def get_crop_info(crop_name):
     """Get information about a specific crop"""
     crop_name_lower = crop_name.lower()
     
-    if crop_name_lower not in CROP_DATA:
+    crops_data = crop_data()
+    if crop_name_lower not in crops_data:
         return jsonify({'error': f'Crop "{crop_name}" not found'}), 404
     
-    crop_info = CROP_DATA[crop_name_lower]
+    crop_info = crops_data[crop_name_lower]
     
     return jsonify({
         'success': True,
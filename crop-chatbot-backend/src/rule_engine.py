@@ -0,0 +1,163 @@
+import re
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+# Every feature a rule may constrain, in request order
+RULE_FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+# Keys used for a feature in `optimal_conditions` tables
+FEATURE_ALIASES = {
+    'N': ['N', 'nitrogen'],
+    'P': ['P', 'phosphorus'],
+    'K': ['K', 'potassium'],
+    'temperature': ['temperature'],
+    'humidity': ['humidity'],
+    'ph': ['ph'],
+    'rainfall': ['rainfall'],
+}
+
+# Conversions into each feature's canonical unit (°C, %, and for rainfall the
+# scale the crop tables are written in, "150-300cm", which is the scale the
+# rule-based endpoint has always compared requests against)
+UNIT_CONVERSIONS = {
+    '°C': lambda v: v,
+    'C': lambda v: v,
+    '°F': lambda v: (v - 32.0) * 5.0 / 9.0,
+    'F': lambda v: (v - 32.0) * 5.0 / 9.0,
+    '%': lambda v: v,
+    'cm': lambda v: v,
+    'mm': lambda v: v / 10.0,
+}
+
+# Ranges shown for a crop whose table has no entry for a feature
+DEFAULT_RANGES = {
+    'temperature': [20, 30],
+    'humidity': [60, 80],
+    'rainfall': [100, 200],
+    'ph': [6.0, 7.0],
+}
+
+# A value this far outside a range, as a fraction of the range width, scores 0
+TOLERANCE_FRACTION = 0.5
+
+_RANGE_PATTERN = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*-\s*(-?\d+(?:\.\d+)?)\s*([^\d\s]*)\s*$')
+
+
+def parse_range(value: Any, feature: str) -> Optional[Tuple[float, float]]:
+    """Parse "20-35°C" style strings (or [low, high] pairs) into canonical units"""
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        low, high, unit = float(value[0]), float(value[1]), ''
+    else:
+        match = _RANGE_PATTERN.match(str(value))
+        if not match:
+            return None
+        low, high, unit = float(match.group(1)), float(match.group(2)), match.group(3)
+    if unit:
+        if unit not in UNIT_CONVERSIONS:
+            raise ValueError(f"Unknown unit {unit!r} in {feature} range {value!r}")
+        convert = UNIT_CONVERSIONS[unit]
+        low, high = convert(low), convert(high)
+    return (min(low, high), max(low, high))
+
+
+class CompiledRules:
+    """One immutable set of rule tables"""
+
+    __slots__ = ('crops', 'lower', 'upper', 'tolerance', 'weights', 'display_ranges')
+
+    def __init__(self, crops, lower, upper, tolerance, weights, display_ranges):
+        self.crops = crops
+        self.lower = lower
+        self.upper = upper
+        self.tolerance = tolerance
+        self.weights = weights
+        self.display_ranges = display_ranges
+
+
+class RuleEngine:
+    """Crop suitability rules compiled once into lower/upper bound arrays
+
+    Each crop's `optimal_conditions` become one row of `lower` and `upper`
+    (NaN where the crop sets no constraint). An input is scored against every
+    crop at once: 1.0 per feature inside the range, falling linearly to 0 at
+    TOLERANCE_FRACTION of the range width outside it, averaged over the
+    features the crop constrains. Adding a crop only means adding its data.
+    """
+
+    def __init__(self, crop_data: Dict[str, Dict[str, Any]]):
+        self.version = 0
+        self.compile(crop_data)
+
+    def compile(self, crop_data: Dict[str, Dict[str, Any]]):
+        """(Re)build the bound arrays from crop data"""
+        crops = list(crop_data)
+        lower = np.full((len(crops), len(RULE_FEATURES)), np.nan)
+        upper = np.full((len(crops), len(RULE_FEATURES)), np.nan)
+        display_ranges = {}
+
+        for row, crop in enumerate(crops):
+            conditions = crop_data[crop].get('optimal_conditions', {})
+            ranges = {}
+            for column, feature in enumerate(RULE_FEATURES):
+                for alias in FEATURE_ALIASES[feature]:
+                    if alias in conditions:
+                        parsed = parse_range(conditions[alias], feature)
+                        if parsed is not None:
+                            lower[row, column], upper[row, column] = parsed
+                            ranges[feature] = [parsed[0], parsed[1]]
+                        break
+            display_ranges[crop] = {
+                f'{feature}_range': ranges.get(feature, default)
+                for feature, default in DEFAULT_RANGES.items()
+            }
+
+        constrained = ~np.isnan(lower)
+        # Replace the whole table set in one assignment so readers never see a half-built one
+        self._rules = CompiledRules(
+            crops=np.asarray(crops, dtype=object),
+            lower=np.where(constrained, lower, 0.0),
+            upper=np.where(constrained, upper, 0.0),
+            tolerance=np.where(constrained, np.maximum(upper - lower, 1e-9) * TOLERANCE_FRACTION, 1.0),
+            weights=constrained / np.maximum(constrained.sum(axis=1, keepdims=True), 1),
+            display_ranges=display_ranges,
+        )
+        self.version += 1
+
+    @property
+    def crops(self) -> List[str]:
+        return list(self._rules.crops)
+
+    def _score(self, rules: 'CompiledRules', X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        values = X[:, np.newaxis, :]
+        distance = np.maximum(np.maximum(rules.lower - values, values - rules.upper), 0.0)
+        feature_scores = np.clip(1.0 - distance / rules.tolerance, 0.0, 1.0)
+        return (feature_scores * rules.weights).sum(axis=2)
+
+    def score(self, X) -> np.ndarray:
+        """Suitability in [0, 1] of every crop for each input row, shape (n_rows, n_crops)"""
+        return self._score(self._rules, X)
+
+    def recommend_batch(self, X, top_k: int = 3) -> List[List[Tuple[str, float]]]:
+        """Top-k (crop, score) pairs for each input row"""
+        rules = self._rules
+        scores = self._score(rules, X)
+        # Stable sort keeps table order between equally scored crops
+        order = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+        top_scores = np.take_along_axis(scores, order, axis=1)
+        names = rules.crops[order]
+        return [
+            [(crop, round(float(score), 4)) for crop, score in zip(row_names, row_scores)]
+            for row_names, row_scores in zip(names, top_scores)
+        ]
+
+    def recommend(self, conditions: Dict[str, float], top_k: int = 3) -> List[Tuple[str, float]]:
+        """Top-k (crop, score) pairs for one set of conditions"""
+        row = [float(conditions[feature]) for feature in RULE_FEATURES]
+        return self.recommend_batch([row], top_k=top_k)[0]
+
+    def ranges_for(self, crop: str) -> Dict[str, List[float]]:
+        """Parsed temperature/humidity/rainfall/pH ranges for display"""
+        return self._rules.display_ranges.get(crop, {f'{feature}_range': default for feature, default in DEFAULT_RANGES.items()})
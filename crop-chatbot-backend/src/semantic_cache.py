@@ -0,0 +1,266 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import re
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from knowledge_index import stem
+
+logger = logging.getLogger(__name__)
+
+# Width of the hashed character n-gram vectors used for similarity lookups
+EMBEDDING_DIM = 512
+NGRAM_SIZE = 3
+
+FORMAT_VERSION = 3
+
+# Filler dropped from cache keys. Unlike the search stopwords this keeps
+# interrogatives and modals: "how", "when" and "should" change the answer
+KEY_STOPWORDS = frozenset("""
+a an and the i me my we our you your it its this that is are am be do does did
+to of for in on at by with please tell
+""".split())
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def normalize(message: str) -> str:
+    """Cache key for a message: its stemmed words without filler, in order
+
+    "What fertilizers for the rice?" and "what fertilizer for rice" share a
+    key; "How do I plant rice?" and "When should I plant rice?" do not, nor
+    do "rotate rice after wheat" and "rotate wheat after rice".
+    """
+    return ' '.join(stem(token) for token in _TOKEN_PATTERN.findall(message.lower())
+                    if token not in KEY_STOPWORDS)
+
+
+def embed(normalized: str) -> np.ndarray:
+    """Unit-length hashed character n-gram vector of a normalized message"""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in normalized.split():
+        padded = f'#{word}#'
+        for i in range(max(len(padded) - NGRAM_SIZE + 1, 1)):
+            vector[zlib.crc32(padded[i:i + NGRAM_SIZE].encode('utf-8')) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def same_order(key: str, other: str) -> bool:
+    """Whether the words two normalized messages share appear in the same order in both
+
+    The n-gram vectors ignore word order, so a similar match is checked
+    with this before it is used.
+    """
+    words, other_words = key.split(), other.split()
+    shared = set(words) & set(other_words)
+    return [word for word in words if word in shared] == [word for word in other_words if word in shared]
+
+
+def _jsonable(version: Hashable) -> Any:
+    return json.loads(json.dumps(version))
+
+
+class SemanticCache:
+    """LRU cache of chat answers keyed on normalized message text
+
+    A lookup first tries the exact normalized key. If `threshold` is set,
+    it then takes the most similar stored message by cosine similarity of
+    hashed n-gram vectors, if that clears the threshold and the words both
+    messages share come in the same order. Entries persist to
+    `path` as JSON (written at most every `save_interval` seconds and at
+    exit). They are dropped when `version_fn` (e.g. the knowledge files'
+    mtimes) changes, including across restarts.
+    """
+
+    def __init__(self, maxsize: int = 1024, threshold: Optional[float] = None,
+                 ttl: Optional[float] = 86400.0, path: Optional[str] = None,
+                 version_fn: Optional[Callable[[], Hashable]] = None,
+                 check_interval: float = 1.0, save_interval: float = 5.0):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self.path = path
+        self.version_fn = version_fn
+        self.check_interval = check_interval
+        self.save_interval = save_interval
+        self._version = _jsonable(version_fn()) if version_fn else None
+        self._next_check = time.monotonic() + check_interval
+        # key -> (created wall-clock time, answer, vector slot)
+        self._entries: 'OrderedDict[str, Tuple[float, str, int]]' = OrderedDict()
+        self._vectors = np.zeros((maxsize, EMBEDDING_DIM), dtype=np.float32)
+        self._free_slots = list(range(maxsize - 1, -1, -1))
+        self._slot_keys: List[Optional[str]] = [None] * maxsize
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    @classmethod
+    def from_env(cls, default_path: Optional[str] = None,
+                 version_fn: Optional[Callable[[], Hashable]] = None) -> 'SemanticCache':
+        """Cache configured from CROPBOT_CHAT_CACHE_* variables
+
+        CROPBOT_CHAT_CACHE_PATH set to an empty string disables persistence.
+        """
+        threshold = os.environ.get('CROPBOT_CHAT_CACHE_THRESHOLD')
+        return cls(
+            maxsize=int(os.environ.get('CROPBOT_CHAT_CACHE_SIZE', '1024')),
+            threshold=float(threshold) if threshold else None,
+            ttl=float(os.environ.get('CROPBOT_CHAT_CACHE_TTL', '86400')),
+            path=os.environ.get('CROPBOT_CHAT_CACHE_PATH', default_path) or None,
+            version_fn=version_fn,
+        )
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _check_version(self, now: float):
+        if self.version_fn is None or now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        version = _jsonable(self.version_fn())
+        if version != self._version:
+            self._version = version
+            self._clear()
+            self.invalidations += 1
+            logger.info("Knowledge changed, chat answer cache cleared")
+
+    def _clear(self):
+        self._entries.clear()
+        self._vectors[:] = 0.0
+        self._free_slots = list(range(self.maxsize - 1, -1, -1))
+        self._slot_keys = [None] * self.maxsize
+        self._dirty = True
+
+    def _remove(self, key: str):
+        _, _, slot = self._entries.pop(key)
+        self._vectors[slot] = 0.0
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+
+    def _store(self, key: str, answer: str, created: float):
+        if key in self._entries:
+            self._remove(key)
+        while len(self._entries) >= self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        slot = self._free_slots.pop()
+        self._vectors[slot] = embed(key)
+        self._slot_keys[slot] = key
+        self._entries[key] = (created, answer, slot)
+
+    def get(self, message: str) -> Optional[str]:
+        """Cached answer for a message (or a similar one), or None on a miss"""
+        key = normalize(message)
+        with self._lock:
+            self._check_version(time.monotonic())
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[0]):
+                self._remove(key)
+                entry = None
+            if entry is None and self.threshold is not None and self._entries:
+                scores = self._vectors @ embed(key)
+                slot = int(np.argmax(scores))
+                if (scores[slot] >= self.threshold and self._slot_keys[slot] is not None
+                        and same_order(key, self._slot_keys[slot])):
+                    key = self._slot_keys[slot]
+                    entry = self._entries[key]
+                    if self._expired(entry[0]):
+                        self._remove(key)
+                        entry = None
+                    else:
+                        self.similar_hits += 1
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, message: str, answer: str):
+        """Store an answer, evicting the least recently used entry when full"""
+        key = normalize(message)
+        if not key:
+            return
+        with self._lock:
+            self._store(key, answer, time.time())
+            self._dirty = True
+        if self.path and time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """Write entries to `path` atomically; a failed write is logged and retried on the next save"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {
+                'format_version': FORMAT_VERSION,
+                'knowledge_version': self._version,
+                'entries': [[key, created, answer] for key, (created, answer, _) in self._entries.items()],
+            }
+            self._dirty = False
+            self._last_save = time.monotonic()
+        # A name of its own, since other threads and worker processes save to the same path
+        tmp_path = f'{self.path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.exception("Could not save chat answer cache to %s", self.path)
+            self._dirty = True
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self):
+        """Restore entries saved by an earlier process, unless the knowledge changed since"""
+        try:
+            with open(self.path, 'r') as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return
+        if payload.get('format_version') != FORMAT_VERSION or payload.get('knowledge_version') != self._version:
+            logger.info("Discarding chat answer cache saved for other knowledge files")
+            return
+        with self._lock:
+            for key, created, answer in payload.get('entries', [])[-self.maxsize:]:
+                if not self._expired(created):
+                    self._store(key, answer, created)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'similar_hits': self.similar_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'persistent': bool(self.path),
+        }
@@ -0,0 +1,354 @@
+"""Pre-fork production server for the crop recommendation API
+
+The master process imports the app, loads the model, label encoder, crop
+registry and knowledge index once, freezes the garbage collector and then
+forks the workers. Everything loaded before the fork is shared copy-on-write,
+so N workers cost little more memory than one. Each worker serves the shared
+listening socket with a fixed pool of threads.
+
+    python src/serve.py --workers 4 --threads 8 --bind 0.0.0.0:5000
+
+Signals to the master:
+    SIGHUP            reload changed model and data files, start a fresh set
+                      of workers, then retire the old ones gracefully
+    SIGTERM, SIGINT   stop accepting, let in-flight requests finish (up to
+                      --graceful-timeout seconds) and exit
+
+Benchmark requests/sec on /api/crop/recommend for 1..N workers:
+
+    python src/serve.py --benchmark --duration 10
+"""
+import argparse
+import gc
+import http.client
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# Same import root as main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger('cropbot.serve')
+
+DEFAULT_APP = 'src.main:app'
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler without per-request access logging"""
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server that handles connections on a fixed-size thread pool
+
+    Keep-alive connections hold a thread while open, so idle ones are closed
+    after `keepalive` seconds.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads: int = 4, keepalive: float = 2.0, handler=None, fd=None):
+        handler = type('KeepAliveRequestHandler', (handler or WSGIRequestHandler,), {'timeout': keepalive})
+        handler.protocol_version = 'HTTP/1.1'
+        super().__init__(host, port, app, handler=handler, fd=fd)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='cropbot-worker')
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._handle, request, client_address)
+
+    def drain(self):
+        """Wait for in-flight requests after serve_forever() returns"""
+        self.executor.shutdown(wait=True)
+        self.server_close()
+
+
+def load_app(spec: str):
+    """Import "module:attribute" and return the WSGI app"""
+    module_name, _, attribute = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attribute or 'app')
+
+
+def preload(app, reload: bool = False) -> Dict[str, float]:
+    """Load everything the app will need before forking, so workers share it
+
+    Importing the app has already built the crop registry, rule tables,
+    prerendered responses and knowledge index. The ML chatbot is warmed up
+    too when its blueprint is registered. With `reload`, files that changed
+    on disk since the last preload are loaded again.
+    """
+    start = time.perf_counter()
+    load_times = {}
+    crop_enhanced = sys.modules.get('src.routes.crop_enhanced')
+    if crop_enhanced is not None:
+        crop_enhanced.REGISTRY.refresh(force=reload)
+        crop_enhanced.KNOWLEDGE.refresh(force=reload)
+    blueprint = app.blueprints.get('crop')
+    if blueprint is not None and blueprint.import_name.endswith('routes.crop'):
+        ml_routes = sys.modules[blueprint.import_name]
+        if ml_routes.chatbot is None:
+            ml_routes.init_chatbot()
+        if ml_routes.chatbot is not None:
+            if reload:
+                ml_routes.chatbot.artifacts.refresh(list(ml_routes.chatbot.artifacts.paths))
+                ml_routes.chatbot.registry.refresh(force=True)
+            load_times.update(ml_routes.chatbot.warmup())
+    # Objects that survive to here live as long as the workers; moving them
+    # out of the collector's reach stops gc passes in each worker from
+    # touching (and so copying) the shared pages
+    gc.collect()
+    gc.freeze()
+    load_times['preload'] = time.perf_counter() - start
+    return load_times
+
+
+class Master:
+    """Forks, supervises and replaces worker processes"""
+
+    def __init__(self, app, bind: str = '0.0.0.0:5000', workers: int = 1, threads: int = 4,
+                 keepalive: float = 2.0, graceful_timeout: float = 30.0, access_log: bool = False):
+        self.app = app
+        host, _, port = bind.rpartition(':')
+        self.host = host or '0.0.0.0'
+        self.port = int(port)
+        self.workers = workers
+        self.threads = threads
+        self.keepalive = keepalive
+        self.graceful_timeout = graceful_timeout
+        self.handler = WSGIRequestHandler if access_log else QuietRequestHandler
+        self.socket: Optional[socket.socket] = None
+        self.children: Dict[int, int] = {}  # pid -> generation
+        self.generation = 0
+        self._signals: List[int] = []
+
+    def listen(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        self.socket = socket.create_server((self.host, self.port), family=family, backlog=2048)
+        # Workers race to accept; the losers must get EAGAIN instead of blocking
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = self.generation
+            return
+        try:
+            self._run_worker()
+        except BaseException:
+            logger.exception("Worker %d crashed", os.getpid())
+            os._exit(1)
+        os._exit(0)
+
+    def _run_worker(self):
+        for signum in (signal.SIGHUP, signal.SIGINT):
+            signal.signal(signum, signal.SIG_IGN)
+        # Database connections opened by the master must not be shared across processes
+        database = self.app.extensions.get('sqlalchemy')
+        if database is not None:
+            with self.app.app_context():
+                for engine in database.engines.values():
+                    engine.dispose(close=False)
+        server = PooledWSGIServer(self.host, self.port, self.app, threads=self.threads,
+                                  keepalive=self.keepalive, handler=self.handler, fd=self.socket.fileno())
+        # shutdown() blocks until serve_forever() returns, so it cannot run in the handler itself
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+        server.serve_forever(poll_interval=0.5)
+        server.drain()
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def stop_workers(self, pids: List[int], timeout: float):
+        """SIGTERM `pids`, then SIGKILL any still running after `timeout` seconds"""
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    remaining.discard(pid)
+                    self.children.pop(pid, None)
+            time.sleep(0.05)
+        for pid in remaining:
+            logger.warning("Worker %d did not stop in %.0fs, killing it", pid, timeout)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.children.pop(pid, None)
+
+    def reload(self):
+        """Reload changed files, start new workers, then retire the old generation"""
+        logger.info("Reloading")
+        old = list(self.children)
+        preload(self.app, reload=True)
+        self.generation += 1
+        for _ in range(self.workers):
+            self.spawn()
+        self.stop_workers(old, self.graceful_timeout)
+
+    def run(self):
+        if self.socket is None:
+            self.listen()
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._on_signal)
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info("Serving on http://%s:%d with %d workers x %d threads",
+                    self.host, self.port, self.workers, self.threads)
+        while True:
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                else:
+                    logger.info("Shutting down")
+                    self.stop_workers(list(self.children), self.graceful_timeout)
+                    self.socket.close()
+                    return
+            # Replace workers that died on their own
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in self.children:
+                generation = self.children.pop(pid)
+                if generation == self.generation:
+                    logger.warning("Worker %d exited with status %d, restarting it", pid, status)
+                    self.spawn()
+            time.sleep(0.1)
+
+
+def _load_worker(port: int, connections: int, duration: float, body: bytes, results):
+    """One load-generator process: `connections` keep-alive clients posting for `duration` seconds"""
+    counts = [0] * connections
+    errors = [0] * connections
+    deadline = time.monotonic() + duration
+    headers = {'Content-Type': 'application/json'}
+
+    def client(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        while time.monotonic() < deadline:
+            try:
+                conn.request('POST', '/api/crop/recommend', body, headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    counts[index] += 1
+                else:
+                    errors[index] += 1
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((sum(counts), sum(errors)))
+
+
+def _wait_for_port(port: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def benchmark(worker_counts: List[int], threads: int, duration: float, clients: int, port: int = 5099):
+    """Requests/sec on /api/crop/recommend for each worker count, with `clients` load processes"""
+    body = json.dumps({'N': 90, 'P': 42, 'K': 43, 'temperature': 20.9, 'humidity': 82,
+                       'ph': 6.5, 'rainfall': 203}).encode('utf-8')
+    rows = []
+    for workers in worker_counts:
+        server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--bind', f'127.0.0.1:{port}',
+                                   '--workers', str(workers), '--threads', str(threads)])
+        try:
+            _wait_for_port(port)
+            results = multiprocessing.Queue()
+            # Enough open connections to keep every worker thread busy
+            connections = max(1, workers * threads // clients)
+            loaders = [multiprocessing.Process(target=_load_worker, args=(port, connections, duration, body, results))
+                       for _ in range(clients)]
+            for loader in loaders:
+                loader.start()
+            totals = [results.get() for _ in loaders]
+            for loader in loaders:
+                loader.join()
+            requests = sum(count for count, _ in totals)
+            errors = sum(error for _, error in totals)
+            rows.append((workers, requests / duration, errors))
+            print(f"workers={workers:<3d} threads={threads:<3d} {requests / duration:9.1f} req/s  errors={errors}",
+                  flush=True)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', default=os.environ.get('CROPBOT_APP', DEFAULT_APP),
+                        help='WSGI app as module:attribute (default %(default)s)')
+    parser.add_argument('--bind', default=os.environ.get('CROPBOT_BIND', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('CROPBOT_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('CROPBOT_THREADS', '4')),
+                        help='request threads per worker')
+    parser.add_argument('--keepalive', type=float, default=float(os.environ.get('CROPBOT_KEEPALIVE', '2')),
+                        help='seconds an idle keep-alive connection may hold a thread')
+    parser.add_argument('--graceful-timeout', type=float,
+                        default=float(os.environ.get('CROPBOT_GRACEFUL_TIMEOUT', '30')))
+    parser.add_argument('--access-log', action='store_true')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='measure req/s for 1..--workers workers instead of serving')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per benchmark run')
+    parser.add_argument('--clients', type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help='load-generator processes for the benchmark')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+
+    if args.benchmark:
+        benchmark(list(range(1, args.workers + 1)), args.threads, args.duration, args.clients)
+        return
+
+    app = load_app(args.app)
+    load_times = preload(app)
+    logger.info("Preloaded in %.1f ms", load_times['preload'] * 1000)
+    Master(app, bind=args.bind, workers=args.workers, threads=args.threads, keepalive=args.keepalive,
+           graceful_timeout=args.graceful_timeout, access_log=args.access_log).run()
+
+
+if __name__ == "__main__":
+    main()
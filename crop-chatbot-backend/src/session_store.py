@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Rough fixed cost of a session object, on top of its text
+SESSION_OVERHEAD_BYTES = 512
+
+# Characters kept from each folded turn, and for the whole summary
+SUMMARY_TURN_CHARS = 160
+SUMMARY_MAX_CHARS = 1200
+
+
+def summarize_turns(summary: str, turns: List[Dict[str, str]]) -> str:
+    """Fold turns into a running summary, keeping its most recent lines under SUMMARY_MAX_CHARS
+
+    Extractive and local: each turn keeps the start of its text, so the
+    model still sees what was asked and roughly what was answered.
+    """
+    lines = summary.split('\n') if summary else []
+    for turn in turns:
+        speaker = 'User' if turn['role'] == 'user' else 'Assistant'
+        text = ' '.join(turn['content'].split())
+        if len(text) > SUMMARY_TURN_CHARS:
+            text = text[:SUMMARY_TURN_CHARS].rsplit(' ', 1)[0] + '...'
+        lines.append(f'{speaker}: {text}')
+    while lines and sum(len(line) + 1 for line in lines) > SUMMARY_MAX_CHARS:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+class ConversationSession:
+    """Recent turns of one conversation plus a summary of everything older"""
+
+    __slots__ = ('session_id', 'turns', 'summary', 'size')
+
+    def __init__(self, session_id: str, turns: List[Dict[str, str]] = (), summary: str = ''):
+        self.session_id = session_id
+        self.turns: Deque[Dict[str, str]] = deque(turns)
+        self.summary = summary
+        self.size = 0
+        self.resize()
+
+    def resize(self):
+        """Recompute the approximate memory footprint after a change"""
+        self.size = SESSION_OVERHEAD_BYTES + len(self.summary) + sum(len(turn['content']) for turn in self.turns)
+
+    def history(self) -> List[Dict[str, str]]:
+        """Chat messages for the model: the summary (if any) then the recent turns"""
+        messages = []
+        if self.summary:
+            messages.append({'role': 'system', 'content': f'Summary of the earlier conversation:\n{self.summary}'})
+        messages.extend(self.turns)
+        return messages
+
+
+class SessionStore:
+    """Bounded in-memory conversation sessions with optional persistence
+
+    Each session keeps at most `max_turns` turns; older turns are folded
+    into its summary by `summarizer`, so the history sent to the model
+    stays constant-size however long the conversation runs. Sessions are
+    kept in LRU order and the least recently used are dropped once their
+    total size passes `memory_limit` bytes. With `persistence` set (an
+    object with load(session_id), save(session) and delete(session_id)),
+    every change is written through and a dropped session is reloaded
+    when it returns.
+    """
+
+    def __init__(self, max_turns: int = 10, memory_limit: int = 64 * 1024 * 1024,
+                 summarizer: Callable[[str, List[Dict[str, str]]], str] = summarize_turns,
+                 persistence: Any = None):
+        self.max_turns = max_turns
+        self.memory_limit = memory_limit
+        self.summarizer = summarizer
+        self.persistence = persistence
+        self._sessions: 'OrderedDict[str, ConversationSession]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.summarized_turns = 0
+
+    @classmethod
+    def from_env(cls, persistence: Any = None) -> 'SessionStore':
+        """Store configured from CROPBOT_SESSION_MAX_TURNS / CROPBOT_SESSION_MEMORY_MB"""
+        return cls(
+            max_turns=int(os.environ.get('CROPBOT_SESSION_MAX_TURNS', '10')),
+            memory_limit=int(float(os.environ.get('CROPBOT_SESSION_MEMORY_MB', '64')) * 1024 * 1024),
+            persistence=persistence,
+        )
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    def _get(self, session_id: str) -> Optional[ConversationSession]:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            return session
+        if self.persistence is None:
+            return None
+        session = self.persistence.load(session_id)
+        if session is not None:
+            self._sessions[session_id] = session
+            self._size += session.size
+            self._evict()
+        return session
+
+    def _evict(self):
+        # The most recently used session always stays, even if it alone is over the limit
+        while self._size > self.memory_limit and len(self._sessions) > 1:
+            _, session = self._sessions.popitem(last=False)
+            self._size -= session.size
+            self.evictions += 1
+
+    def history(self, session_id: str) -> List[Dict[str, str]]:
+        """Messages to send with the next turn of a session (empty for unknown ids)"""
+        with self._lock:
+            session = self._get(session_id)
+            return session.history() if session is not None else []
+
+    def append(self, session_id: str, *turns: Dict[str, str]):
+        """Record turns, folding the oldest into the summary past max_turns"""
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                session = ConversationSession(session_id)
+                self._sessions[session_id] = session
+                self._size += session.size
+            self._size -= session.size
+            session.turns.extend({'role': turn['role'], 'content': turn['content']} for turn in turns)
+            if len(session.turns) > self.max_turns:
+                folded = [session.turns.popleft() for _ in range(len(session.turns) - self.max_turns)]
+                session.summary = self.summarizer(session.summary, folded)
+                self.summarized_turns += len(folded)
+            session.resize()
+            self._size += session.size
+            self._evict()
+        if self.persistence is not None:
+            try:
+                self.persistence.save(session)
+            except Exception:
+                logger.exception("Could not persist conversation session %s", session_id)
+
+    def discard(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._size -= session.size
+        if self.persistence is not None:
+            self.persistence.delete(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'sessions': len(self._sessions),
+            'memory_bytes': self._size,
+            'memory_limit': self.memory_limit,
+            'max_turns': self.max_turns,
+            'evictions': self.evictions,
+            'summarized_turns': self.summarized_turns,
+            'persistent': self.persistence is not None,
+        }
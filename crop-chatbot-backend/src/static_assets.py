@@ -0,0 +1,216 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are built
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Page served for the root and any path that is not a file (client-side routing)
+INDEX_FILE = 'index.html'
+
+# Types worth compressing; images other than icons and SVG are already compressed
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml',
+                      'image/vnd.microsoft.icon', 'image/x-icon')
+
+# Fingerprinted URLs never change content, so clients may keep them for a year
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+# Unversioned URLs must be revalidated (cheaply, with If-None-Match) on every use
+REVALIDATE_CACHE = 'no-cache'
+
+_REFERENCE = re.compile(r'''(?P<attr>\b(?:src|href)=)(?P<quote>["'])(?P<slash>/?)(?P<name>[^"'?#:]+)(?P=quote)''')
+
+
+def _compress(body: bytes) -> Dict[str, bytes]:
+    """Encoded variants of a body, best first, keeping only those that are smaller"""
+    variants = {}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=11)
+    variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(body)}
+
+
+class StaticAsset:
+    """One static file held in memory with its precompressed variants"""
+
+    __slots__ = ('name', 'body', 'mimetype', 'digest', 'url_name', 'variants')
+
+    def __init__(self, name: str, body: bytes):
+        self.name = name
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.set_body(body)
+
+    def set_body(self, body: bytes):
+        self.body = body
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        stem, extension = os.path.splitext(self.name)
+        self.url_name = f'{stem}.{self.digest[:10]}{extension}'
+        compressible = self.mimetype.startswith(COMPRESSIBLE_TYPES)
+        self.variants = _compress(body) if compressible else {}
+
+    def select(self, accept_encoding) -> Tuple[Optional[str], bytes, str]:
+        """(encoding, body, strong ETag) for the best variant the client accepts"""
+        for encoding, data in self.variants.items():
+            if accept_encoding[encoding]:
+                # Each representation needs its own strong ETag
+                return encoding, data, f'{self.digest}-{encoding}'
+        return None, self.body, self.digest
+
+
+def asset_response(asset: StaticAsset, cache_control: str = REVALIDATE_CACHE) -> Response:
+    """Flask response with the best variant of an asset for this request
+
+    Honors If-None-Match with a bodiless 304.
+    """
+    encoding, body, etag = asset.select(request.accept_encodings)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=asset.mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if asset.variants:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+class StaticAssets:
+    """The static folder, loaded into memory and served with compression and caching
+
+    Every file is read once, gzip (and brotli, when the module is installed)
+    variants are built up front and each request picks one from
+    Accept-Encoding. Every file is also reachable under a fingerprinted name
+    (offline_model.3f2a9c1b0d.js) that is served as immutable; references
+    to local files in HTML are rewritten to those names, so the page itself
+    is the only thing a returning client revalidates. The folder is
+    rescanned at most every `check_interval` seconds and changed files are
+    loaded into a new table that replaces the old one in a single
+    assignment.
+    """
+
+    def __init__(self, folder: str, check_interval: float = 1.0):
+        self.folder = folder
+        self.check_interval = check_interval
+        self._assets: Dict[str, StaticAsset] = {}
+        self._files: Dict[str, Tuple[int, int]] = {}
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.refresh(force=True)
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        files = {}
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files[os.path.relpath(path, self.folder).replace(os.sep, '/')] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _rewrite(self, asset: StaticAsset, assets: Dict[str, StaticAsset]):
+        """Point an HTML page's references to local files at their fingerprinted names"""
+        def replace(match):
+            target = assets.get(match.group('name'))
+            if target is None or target is asset:
+                return match.group(0)
+            quote = match.group('quote')
+            return f"{match.group('attr')}{quote}{match.group('slash')}{target.url_name}{quote}"
+        asset.set_body(_REFERENCE.sub(replace, asset.body.decode('utf-8')).encode('utf-8'))
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload if any file was added, changed or removed; returns whether the table was replaced"""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        with self._lock:
+            self._next_check = now + self.check_interval
+            try:
+                files = self._scan()
+            except OSError:
+                logger.exception("Could not scan static folder %s", self.folder)
+                return False
+            if files == self._files and not force:
+                return False
+            assets = {}
+            for name, version in files.items():
+                old = self._assets.get(name)
+                if old is not None and self._files.get(name) == version and not old.mimetype == 'text/html':
+                    assets[name] = old
+                    continue
+                try:
+                    with open(os.path.join(self.folder, name), 'rb') as f:
+                        assets[name] = StaticAsset(name, f.read())
+                except OSError:
+                    # Usually a file caught mid-write; the next check retries
+                    logger.exception("Could not load static file %s", name)
+                    return False
+            # Pages are rewritten last, once every fingerprint is known
+            for asset in assets.values():
+                if asset.mimetype == 'text/html':
+                    self._rewrite(asset, assets)
+            by_url = dict(assets)
+            by_url.update({asset.url_name: asset for asset in assets.values()})
+            self._assets = by_url
+            self._files = files
+            self.reloads += 1
+        return True
+
+    def url_for(self, name: str) -> str:
+        """Fingerprinted URL of a static file (the plain name if it is unknown)"""
+        asset = self._assets.get(name)
+        return '/' + (asset.url_name if asset is not None else name)
+
+    def respond(self, path: str) -> Optional[Response]:
+        """Flask response for a static path, or None if there is no such file
+
+        The empty path and unknown paths get the index page.
+        """
+        self.refresh()
+        assets = self._assets
+        asset = assets.get(path) or assets.get(INDEX_FILE)
+        if asset is None:
+            return None
+        return asset_response(asset, IMMUTABLE_CACHE if path == asset.url_name else REVALIDATE_CACHE)
+
+    def stats(self) -> Dict[str, Any]:
+        assets = {asset.name: asset for asset in self._assets.values()}
+        return {
+            'files': len(assets),
+            'bytes': sum(len(asset.body) for asset in assets.values()),
+            'compressed_bytes': {
+                encoding: sum(len(asset.variants.get(encoding, asset.body)) for asset in assets.values())
+                for encoding in (('br', 'gzip') if brotli is not None else ('gzip',))
+            },
+            'reloads': self.reloads,
+        }
+
+
+if __name__ == "__main__":
+    from flask import Flask
+
+    static = StaticAssets(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    for name, asset in sorted((asset.name, asset) for asset in set(static._assets.values())):
+        sizes = ', '.join(f'{encoding} {len(data)}' for encoding, data in asset.variants.items())
+        print(f"{name} -> {asset.url_name}: {len(asset.body)} bytes" + (f" ({sizes})" if sizes else ''))
+
+    app = Flask(__name__)
+    repeats = 10000
+    with app.test_request_context('/', headers={'Accept-Encoding': 'gzip, deflate, br'}):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            static.respond('')
+        print(f"\nIndex response: {(time.perf_counter() - start) / repeats * 1e6:.1f}us")
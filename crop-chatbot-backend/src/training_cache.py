@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from forest_engine import publish_directory
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# Modules whose code shapes the trained artifacts; editing any of them
+# invalidates every cache entry
+CODE_MODULES = ('training_pipeline.py', 'forest_engine.py', 'offline_bundle.py', 'dataset_store.py',
+                'crop_stats.py', 'forest_updates.py')
+
+# Name of the file that marks a complete entry
+MANIFEST = 'manifest.json'
+
+READ_CHUNK = 1024 * 1024
+
+
+def _stat(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def code_version() -> str:
+    """Hash of the training code and the library versions it runs on"""
+    import numpy
+    import sklearn
+
+    digest = hashlib.sha256(f'{FORMAT_VERSION}:{sklearn.__version__}:{numpy.__version__}'.encode('utf-8'))
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in CODE_MODULES:
+        with open(os.path.join(base_dir, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class TrainingCache:
+    """Trained artifacts stored by a hash of everything that produced them
+
+    The key covers the content of every input file, the hyperparameters
+    and code_version(). A run whose key has an entry copies the stored
+    artifacts into place instead of training. File hashes are remembered by
+    (path, mtime, size), so unchanged multi-gigabyte inputs are not read
+    again. Entries are written to a temporary directory and renamed into
+    place, so an interrupted run never leaves a partial entry, and the
+    least recently used are removed beyond `max_entries`.
+    """
+
+    def __init__(self, directory: str = 'training_cache', max_entries: int = 64):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._hashes_path = os.path.join(directory, 'file_hashes.json')
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> 'TrainingCache':
+        """Cache configured from CROPBOT_TRAINING_CACHE_DIR / CROPBOT_TRAINING_CACHE_ENTRIES"""
+        return cls(
+            directory=os.environ.get('CROPBOT_TRAINING_CACHE_DIR', 'training_cache'),
+            max_entries=int(os.environ.get('CROPBOT_TRAINING_CACHE_ENTRIES', '64')),
+        )
+
+    def _load_hashes(self) -> Dict[str, Any]:
+        try:
+            with open(self._hashes_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def file_hash(self, path: str) -> str:
+        """sha256 of a file's content, reused while its mtime and size are unchanged"""
+        path = os.path.abspath(path)
+        hashes = self._load_hashes()
+        version = list(_stat(path))
+        known = hashes.get(path)
+        if known is not None and known['version'] == version:
+            return known['sha256']
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+                digest.update(chunk)
+        hashes[path] = {'version': version, 'sha256': digest.hexdigest()}
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f'{self._hashes_path}.{uuid.uuid4().hex}'
+        with open(temporary, 'w') as f:
+            json.dump(hashes, f)
+        os.replace(temporary, self._hashes_path)
+        return hashes[path]['sha256']
+
+    def key(self, data_paths: Iterable[str], params: Dict[str, Any]) -> str:
+        """Cache key for training on `data_paths` (in order) with `params`"""
+        digest = hashlib.sha256(code_version().encode('utf-8'))
+        for path in data_paths:
+            digest.update(self.file_hash(path).encode('utf-8'))
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Manifest of a complete entry, or None"""
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, MANIFEST), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Touched so pruning sees it as recently used
+        os.utime(entry_dir)
+        return manifest
+
+    def restore(self, key: str, destinations: Dict[str, str]) -> List[str]:
+        """Copy an entry's artifacts to their destination paths; returns the names restored
+
+        A running server may have the destinations memory-mapped, so each is
+        copied next to its destination first and then swapped in: files with
+        os.replace, directories published as a new version (see
+        forest_engine.publish_directory).
+        """
+        entry_dir = self._entry_dir(key)
+        restored = []
+        for name, destination in destinations.items():
+            source = os.path.join(entry_dir, name)
+            if not os.path.exists(source):
+                continue
+            temporary = f'{os.path.abspath(destination)}.{uuid.uuid4().hex}.tmp'
+            try:
+                if os.path.isdir(source):
+                    shutil.copytree(source, temporary)
+                    publish_directory(temporary, destination)
+                else:
+                    shutil.copy2(source, temporary)
+                    os.replace(temporary, destination)
+            except Exception:
+                if os.path.isdir(temporary):
+                    shutil.rmtree(temporary)
+                elif os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+            restored.append(name)
+        return restored
+
+    def store(self, key: str, sources: Dict[str, str], metadata: Dict[str, Any]):
+        """Save artifacts (files or directories) under `key`, with `metadata` in the manifest"""
+        entry_dir = self._entry_dir(key)
+        temporary = f'{entry_dir}.{uuid.uuid4().hex}.tmp'
+        os.makedirs(temporary)
+        try:
+            for name, source in sources.items():
+                if os.path.isdir(source):
+                    shutil.copytree(source, os.path.join(temporary, name))
+                elif os.path.exists(source):
+                    shutil.copy2(source, os.path.join(temporary, name))
+            with open(os.path.join(temporary, MANIFEST), 'w') as f:
+                json.dump({'key': key, 'created': time.time(), 'files': sorted(sources), **metadata}, f, indent=2)
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.replace(temporary, entry_dir)
+        except Exception:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+        self.prune()
+
+    def prune(self):
+        """Remove the least recently used entries beyond max_entries"""
+        entries = []
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if os.path.isdir(shard_dir):
+                entries.extend(os.path.join(shard_dir, name) for name in os.listdir(shard_dir)
+                               if not name.endswith('.tmp'))
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for entry_dir in entries[self.max_entries:]:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            logger.info("Removed training cache entry %s", os.path.basename(entry_dir))
+
+    def stats(self) -> Dict[str, Any]:
+        return {'directory': self.directory, 'hits': self.hits, 'misses': self.misses,
+                'max_entries': self.max_entries}
@@ -1,73 +1,245 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import StratifiedKFold, cross_validate, train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 from sklearn.preprocessing import LabelEncoder
+import argparse
 import joblib
 import json
 import os
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
+from forest_engine import CompiledForest
+from offline_bundle import export_offline_bundle, format_report
+from model_search import format_front, sample_candidates, search_report, successive_halving
+from training_cache import TrainingCache
+from dataset_store import DatasetStore
+from crop_stats import CHUNK_ROWS, CropStatsAggregator, aggregate, iter_chunks
+from forest_updates import (add_trees, applied_before, fit_trees, initial_provenance, load_provenance,
+                            provenance_sources, save_provenance, summarize)
+
+# Forest hyperparameters used unless others are given (e.g. picked from a search)
+DEFAULT_MODEL_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'min_samples_split': 5,
+    'min_samples_leaf': 2,
+}
+
+def replace_file(path, write):
+    """Call write(temporary_path), then move the result over `path` in one rename
+    
+    A server may have the old file memory-mapped (joblib mmap_mode='r');
+    rewriting it in place would truncate those mappings.
+    """
+    temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        write(temporary)
+        os.replace(temporary, path)
+    except Exception:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
 
 class CropModelTrainer:
-    def __init__(self, data_path=None):
+    def __init__(self, data_path=None, n_jobs=None, model_params=None, use_cache=True):
         self.data_path = data_path or '/home/ubuntu/upload/Crop_recommendation.csv'
+        # Cores used for tree building and cross-validation (-1: all of them)
+        self.n_jobs = n_jobs if n_jobs is not None else int(os.environ.get('CROPBOT_TRAIN_JOBS', '1'))
+        self.cv_folds = 5
+        self.model_params = {**DEFAULT_MODEL_PARAMS, **(model_params or {})}
+        self.search_path = 'model_search.json'
+        # Finished runs are kept by a hash of their inputs, so a rerun on
+        # unchanged data and settings just copies the artifacts back
+        self.cache = TrainingCache.from_env() if use_cache else None
+        # CSVs are converted once into float32 partitions that load memory-mapped
+        self.dataset = DatasetStore.from_env()
+        self.stage_times = {}
         self.model = None
         self.label_encoder = None
+        # Where each tree of the model came from, in estimators_ order
+        self.provenance = None
+        # Mergeable state behind crop_info.json, so updates only aggregate new rows
+        self.crop_stats = None
         self.feature_names = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
         self.model_path = 'crop_recommendation_model.pkl'
         self.encoder_path = 'label_encoder.pkl'
         self.crop_info_path = 'crop_info.json'
+        self.forest_path = 'crop_forest'
+        self.bundle_path = 'offline_bundle.json'
+        self.provenance_path = 'tree_provenance.json'
+        self.crop_stats_path = 'crop_stats.npz'
+    
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage; the wall-clock time is logged and kept in stage_times"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] = time.perf_counter() - start
+            print(f"[{name}] {self.stage_times[name]:.2f}s")
+    
+    def artifact_paths(self):
+        """Where each trained artifact is written"""
+        return {
+            'model': self.model_path,
+            'label_encoder': self.encoder_path,
+            'crop_info': self.crop_info_path,
+            'forest': self.forest_path,
+            'offline_bundle': self.bundle_path,
+            'provenance': self.provenance_path,
+            'crop_stats': self.crop_stats_path,
+        }
+    
+    def training_params(self):
+        """Everything besides the data and code that changes what training produces"""
+        return {
+            'model_params': self.model_params,
+            'feature_names': self.feature_names,
+            'cv_folds': self.cv_folds,
+            'test_size': 0.2,
+            'random_state': 42,
+        }
+    
+    def restore_cached(self, data_paths):
+        """Put a cached run's artifacts in place; returns its cache key and whether it was found"""
+        if self.cache is None:
+            return None, False
+        with self.stage('cache_lookup'):
+            try:
+                key = self.cache.key(data_paths, self.training_params())
+            except OSError:
+                # Missing or unreadable input: a miss, so loading reports the error
+                return None, False
+            manifest = self.cache.lookup(key)
+        if manifest is None:
+            return key, False
+        with self.stage('cache_restore'):
+            restored = self.cache.restore(key, self.artifact_paths())
+            self.model = joblib.load(self.model_path)
+            self.label_encoder = joblib.load(self.encoder_path)
+        print(f"Inputs unchanged since {datetime.fromtimestamp(manifest['created']).isoformat(timespec='seconds')}, "
+              f"restored {', '.join(restored)} from cache entry {key[:12]}")
+        print(f"Cached accuracy: {manifest['accuracy']:.4f}, cross-validation accuracy: {manifest['cv_accuracy']:.4f}")
+        return key, True
+    
+    def store_cached(self, key, data_paths, accuracy, cv_accuracy):
+        """Keep this run's artifacts for later runs with the same inputs"""
+        if self.cache is None or key is None:
+            return
+        try:
+            self.cache.store(key, self.artifact_paths(), {
+                'data_paths': [os.path.abspath(path) for path in data_paths],
+                'params': self.training_params(),
+                'accuracy': float(accuracy),
+                'cv_accuracy': float(cv_accuracy),
+                'stage_times': self.stage_times,
+            })
+            print(f"Artifacts cached as {key[:12]}")
+        except Exception as e:
+            print(f"Error caching artifacts: {e}")
+    
+    def create_model(self, random_state=42, n_jobs=None):
+        """Untrained forest with the trainer's hyperparameters"""
+        return RandomForestClassifier(random_state=random_state, n_jobs=n_jobs, **self.model_params)
+    
+    def parallel_plan(self):
+        """(processes for CV folds, threads per forest) that together use n_jobs cores"""
+        cores = joblib.effective_n_jobs(self.n_jobs)
+        fold_jobs = min(self.cv_folds, cores)
+        return fold_jobs, max(1, cores // fold_jobs)
+        
+    def load_data(self, data_paths=None):
+        """Load and prepare the training data
         
-    def load_data(self):
-        """Load and prepare the training data"""
+        Each CSV is added to the dataset store on first use (or when it
+        changes), so later loads only map its partitions. Returns float32
+        features and the labels as a pandas Categorical.
+        """
         try:
-            df = pd.read_csv(self.data_path)
-            print(f"Loaded dataset with shape: {df.shape}")
-            
-            # Prepare features and target
-            X = df[self.feature_names]
-            y = df['label']
+            data_paths = data_paths or [self.data_path]
+            for path in data_paths:
+                self.dataset.ingest_csv(path)
+            X, codes = self.dataset.load(data_paths)
+            y = pd.Categorical.from_codes(codes, self.dataset.manifest['categories'])
+            print(f"Loaded dataset with shape: {X.shape}")
             
             return X, y
         except Exception as e:
             print(f"Error loading data: {e}")
             return None, None
     
+    def encode_labels(self, y, fit=False):
+        """Integer labels for y; with fit=True a new label encoder is fitted first
+        
+        Categorical labels, as load_data returns them, are encoded through
+        their codes, so no per-row array of strings is built.
+        """
+        if isinstance(y, pd.Categorical):
+            categories = np.asarray(y.categories, dtype=object)
+            present = np.flatnonzero(np.bincount(y.codes, minlength=len(categories)))
+            if fit:
+                self.label_encoder = LabelEncoder().fit(categories[present])
+            lookup = np.zeros(len(categories), dtype=np.intp)
+            lookup[present] = self.label_encoder.transform(categories[present])
+            return lookup[y.codes]
+        if fit:
+            self.label_encoder = LabelEncoder()
+            return self.label_encoder.fit_transform(y)
+        return self.label_encoder.transform(y)
+    
     def train_model(self, X, y, test_size=0.2, random_state=42):
         """Train the crop recommendation model"""
         try:
-            # Encode the target labels
-            self.label_encoder = LabelEncoder()
-            y_encoded = self.label_encoder.fit_transform(y)
-            
-            # Split the data
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y_encoded, test_size=test_size, random_state=random_state, stratify=y_encoded
-            )
+            with self.stage('prepare'):
+                # Encode the target labels
+                y_encoded = self.encode_labels(y, fit=True)
+                
+                # Trees work in float32; converting once saves a copy per fit,
+                # and lets joblib memory-map one array into every CV worker
+                X = np.ascontiguousarray(X, dtype=np.float32)
+                
+                # Split the data
+                X_train, X_test, y_train, y_test = train_test_split(
+                    X, y_encoded, test_size=test_size, random_state=random_state, stratify=y_encoded
+                )
+                
+                # Fold indices, computed once and shared by every CV worker
+                folds = list(StratifiedKFold(n_splits=self.cv_folds).split(X, y_encoded))
             
             # Create and train the model
-            self.model = RandomForestClassifier(
-                n_estimators=100,
-                random_state=random_state,
-                max_depth=10,
-                min_samples_split=5,
-                min_samples_leaf=2
-            )
+            cores = joblib.effective_n_jobs(self.n_jobs)
+            self.model = self.create_model(random_state, n_jobs=cores)
             
-            print("Training the model...")
-            self.model.fit(X_train, y_train)
+            print(f"Training the model on {cores} core(s)...")
+            with self.stage('fit'):
+                self.model.fit(X_train, y_train)
             
             # Evaluate the model
-            y_pred = self.model.predict(X_test)
-            accuracy = accuracy_score(y_test, y_pred)
+            with self.stage('evaluate'):
+                y_pred = self.model.predict(X_test)
+                accuracy = accuracy_score(y_test, y_pred)
             
             print(f"Model Accuracy: {accuracy:.4f}")
             
-            # Cross-validation
-            cv_scores = cross_val_score(self.model, X, y_encoded, cv=5)
+            # Serving scores one row at a time, where a thread pool only adds overhead
+            self.model.set_params(n_jobs=None)
+            
+            # Cross-validation: folds run in separate processes, and each
+            # fold's forest builds its trees on its share of the cores
+            fold_jobs, fold_threads = self.parallel_plan()
+            with self.stage('cross_validate'):
+                cv_results = cross_validate(
+                    self.create_model(random_state, n_jobs=fold_threads), X, y_encoded, cv=folds, n_jobs=fold_jobs
+                )
+            cv_scores = cv_results['test_score']
             print(f"Cross-validation scores: {cv_scores}")
             print(f"Mean CV accuracy: {cv_scores.mean():.4f} (+/- {cv_scores.std() * 2:.4f})")
+            print(f"Cross-validation ran {self.cv_folds} folds on {fold_jobs} process(es) x {fold_threads} thread(s)")
             
             # Feature importance
             feature_importance = dict(zip(self.feature_names, self.model.feature_importances_))
@@ -81,34 +253,49 @@ class CropModelTrainer:
             print(f"Error training model: {e}")
             return None, None
     
+    def search_hyperparameters(self, X, y, n_candidates=27, factor=3, engine='sklearn', random_state=42):
+        """Successive-halving search over forest size, depth and leaf settings
+        
+        Scores every candidate on CV accuracy, single-row latency and model
+        size, writes the Pareto front to search_path and returns the report.
+        """
+        try:
+            y_encoded = LabelEncoder().fit_transform(np.asarray(y))
+            candidates = sample_candidates(n_candidates, np.random.default_rng(random_state), self.model_params)
+            cores = joblib.effective_n_jobs(self.n_jobs)
+            print(f"Searching {len(candidates)} candidates on {cores} process(es)...")
+            with self.stage('search'):
+                results, rounds = successive_halving(
+                    X, y_encoded, candidates, factor=factor, cv_folds=self.cv_folds, n_jobs=cores,
+                    engine=engine, baseline=self.model_params, random_state=random_state
+                )
+            report = search_report(results, rounds, baseline=self.model_params, engine=engine)
+            report['rows'] = len(y_encoded)
+            
+            with open(self.search_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            
+            print("\nPareto front (fastest first):")
+            print(format_front(report))
+            print(f"Search results saved to {self.search_path}")
+            return report
+            
+        except Exception as e:
+            print(f"Error searching hyperparameters: {e}")
+            return None
+    
     def generate_crop_info(self, X, y):
-        """Generate detailed crop information for the knowledge base"""
+        """Generate detailed crop information for the knowledge base
+        
+        One pass over the data in chunks (spread over n_jobs processes when
+        there are several), with averages, ranges, standard deviations and
+        percentile bands for every crop.
+        """
         try:
-            df = pd.DataFrame(X, columns=self.feature_names)
-            df['label'] = y
-            
-            crop_info = {}
-            for crop in self.label_encoder.classes_:
-                crop_data = df[df['label'] == crop]
-                crop_info[crop] = {
-                    'avg_N': float(crop_data['N'].mean()),
-                    'avg_P': float(crop_data['P'].mean()),
-                    'avg_K': float(crop_data['K'].mean()),
-                    'avg_temperature': float(crop_data['temperature'].mean()),
-                    'avg_humidity': float(crop_data['humidity'].mean()),
-                    'avg_ph': float(crop_data['ph'].mean()),
-                    'avg_rainfall': float(crop_data['rainfall'].mean()),
-                    'N_range': [float(crop_data['N'].min()), float(crop_data['N'].max())],
-                    'P_range': [float(crop_data['P'].min()), float(crop_data['P'].max())],
-                    'K_range': [float(crop_data['K'].min()), float(crop_data['K'].max())],
-                    'temperature_range': [float(crop_data['temperature'].min()), float(crop_data['temperature'].max())],
-                    'humidity_range': [float(crop_data['humidity'].min()), float(crop_data['humidity'].max())],
-                    'ph_range': [float(crop_data['ph'].min()), float(crop_data['ph'].max())],
-                    'rainfall_range': [float(crop_data['rainfall'].min()), float(crop_data['rainfall'].max())],
-                    'sample_count': len(crop_data)
-                }
-            
-            return crop_info
+            chunks = -(-len(X) // CHUNK_ROWS)
+            self.crop_stats = aggregate(iter_chunks(X, y), n_jobs=min(chunks, joblib.effective_n_jobs(self.n_jobs)),
+                                        feature_names=self.feature_names)
+            return self.crop_stats.crop_info(self.label_encoder.classes_)
             
         except Exception as e:
             print(f"Error generating crop info: {e}")
@@ -122,12 +309,24 @@ class CropModelTrainer:
                 return False
             
             # Save model and encoder
-            joblib.dump(self.model, self.model_path)
-            joblib.dump(self.label_encoder, self.encoder_path)
+            replace_file(self.model_path, lambda path: joblib.dump(self.model, path))
+            replace_file(self.encoder_path, lambda path: joblib.dump(self.label_encoder, path))
             
             print(f"Model saved to {self.model_path}")
             print(f"Label encoder saved to {self.encoder_path}")
             
+            # Flattened copy of the forest for the compiled serving engine,
+            # published as a new version so running servers keep their mappings
+            forest = CompiledForest.from_sklearn(
+                self.model, class_names=self.label_encoder.classes_, feature_names=self.feature_names
+            )
+            forest.save(self.forest_path)
+            print(f"Compiled forest saved to {self.forest_path}")
+            
+            if self.provenance is not None:
+                save_provenance(self.provenance, self.provenance_path)
+                print(f"Tree provenance saved to {self.provenance_path}")
+            
             return True
             
         except Exception as e:
@@ -137,8 +336,12 @@ class CropModelTrainer:
     def save_crop_info(self, crop_info):
         """Save crop information to JSON file"""
         try:
-            with open(self.crop_info_path, 'w') as f:
-                json.dump(crop_info, f, indent=2)
+            def write(path):
+                with open(path, 'w') as f:
+                    json.dump(crop_info, f, indent=2)
+            replace_file(self.crop_info_path, write)
+            if self.crop_stats is not None:
+                self.crop_stats.save(self.crop_stats_path)
             
             print(f"Crop information saved to {self.crop_info_path}")
             return True
@@ -147,6 +350,29 @@ class CropModelTrainer:
             print(f"Error saving crop info: {e}")
             return False
     
+    def save_offline_bundle(self, X=None):
+        """Distil the trained model into the browser's offline bundle; needs crop_info saved first"""
+        try:
+            if self.model is None or self.label_encoder is None:
+                print("No model to distil. Train the model first.")
+                return False
+            
+            # The compiled forest gives the same answers as the model, faster
+            teacher = CompiledForest.from_sklearn(
+                self.model, class_names=self.label_encoder.classes_, feature_names=self.feature_names
+            )
+            report = export_offline_bundle(
+                teacher, self.label_encoder.classes_, self.crop_info_path, self.bundle_path,
+                X=None if X is None else np.asarray(X, dtype=np.float64)
+            )
+            print(format_report(report))
+            print(f"Offline bundle saved to {self.bundle_path}")
+            return True
+            
+        except Exception as e:
+            print(f"Error saving offline bundle: {e}")
+            return False
+    
     def validate_model(self, X, y):
         """Validate the trained model with additional metrics"""
         try:
@@ -154,8 +380,8 @@ class CropModelTrainer:
                 print("No model to validate. Train the model first.")
                 return False
             
-            y_encoded = self.label_encoder.transform(y)
-            y_pred = self.model.predict(X)
+            y_encoded = self.encode_labels(y)
+            y_pred = self.model.predict(np.asarray(X, dtype=np.float32))
             
             # Classification report
             print("\nClassification Report:")
@@ -178,19 +404,16 @@ class CropModelTrainer:
     def retrain_with_new_data(self, new_data_path):
         """Retrain the model with additional data"""
         try:
-            # Load existing data
-            X_old, y_old = self.load_data()
-            if X_old is None:
-                return False
-            
-            # Load new data
-            new_df = pd.read_csv(new_data_path)
-            X_new = new_df[self.feature_names]
-            y_new = new_df['label']
+            data_paths = [self.data_path, new_data_path]
+            cache_key, cached = self.restore_cached(data_paths)
+            if cached:
+                return True
             
-            # Combine datasets
-            X_combined = pd.concat([X_old, X_new], ignore_index=True)
-            y_combined = pd.concat([y_old, y_new], ignore_index=True)
+            # Old and new data are read from their stored partitions; only
+            # a CSV not seen before is converted
+            X_combined, y_combined = self.load_data(data_paths)
+            if X_combined is None:
+                return False
             
             print(f"Combined dataset shape: {X_combined.shape}")
             
@@ -200,10 +423,13 @@ class CropModelTrainer:
             if accuracy is not None:
                 # Generate updated crop info
                 crop_info = self.generate_crop_info(X_combined, y_combined)
+                self.provenance = initial_provenance(len(self.model.estimators_), data_paths, len(X_combined))
                 
                 # Save everything
                 self.save_model()
                 self.save_crop_info(crop_info)
+                self.save_offline_bundle(X_combined)
+                self.store_cached(cache_key, data_paths, accuracy, cv_accuracy)
                 
                 print("Model retrained successfully!")
                 return True
@@ -214,13 +440,130 @@ class CropModelTrainer:
             print(f"Error retraining model: {e}")
             return False
     
+    def update_with_new_data(self, new_data_path, n_trees=10, max_trees=None, holdout=0.2, tolerance=0.01,
+                             validation_rows=5000, random_state=None, force=False):
+        """Add trees fitted on new data only, instead of retraining on everything
+        
+        A `holdout` share of the new rows is kept out of the new trees. The
+        updated forest is scored against the current one on those rows plus
+        up to `validation_rows` rows sampled from the data the forest was
+        trained on, and is only saved if it is no more than `tolerance`
+        less accurate. With `max_trees` the oldest trees are dropped
+        (a rolling window). Crop info is updated by merging statistics of
+        the new rows into the saved ones. A file already applied with the
+        same content is refused unless `force` is set, since its trees
+        would be added a second time.
+        """
+        try:
+            start = time.perf_counter()
+            with self.stage('load_model'):
+                if self.model is None or self.label_encoder is None:
+                    self.model = joblib.load(self.model_path)
+                    self.label_encoder = joblib.load(self.encoder_path)
+                provenance = load_provenance(self.provenance_path, len(self.model.estimators_), [self.data_path])
+            
+            with self.stage('load_data'):
+                X_new, y_new = self.load_data([new_data_path])
+            if X_new is None or len(X_new) < 2:
+                print("Not enough new data to update the model")
+                return False
+            unknown = set(y_new.categories[np.bincount(y_new.codes, minlength=len(y_new.categories)) > 0])
+            unknown -= set(self.label_encoder.classes_)
+            if unknown:
+                print(f"New data has crops the model does not know ({', '.join(sorted(unknown))}); "
+                      f"run a full retrain instead")
+                return False
+            X_new = np.ascontiguousarray(X_new, dtype=np.float32)
+            y_encoded = self.encode_labels(y_new)
+            source_hash = self.dataset.manifest['sources'][os.path.abspath(new_data_path)]['sha256']
+            if applied_before(provenance, new_data_path, source_hash) and not force:
+                print(f"{new_data_path} was already applied with the same content; the model is unchanged "
+                      f"(use --force to add trees from it again)")
+                return False
+            
+            rng = np.random.default_rng(random_state)
+            order = rng.permutation(len(X_new))
+            n_holdout = max(1, int(len(X_new) * holdout))
+            held_out, train = order[:n_holdout], order[n_holdout:]
+            
+            # Held-out new rows show whether the update learned the new data;
+            # a sample of the earlier data shows whether it forgot the old
+            X_val, y_val = [X_new[held_out]], [y_encoded[held_out]]
+            earlier = [source for source in provenance_sources(provenance)
+                       if os.path.exists(source) and self.dataset.is_current(source)]
+            if earlier:
+                X_old, codes = self.dataset.sample(validation_rows, earlier, rng)
+                X_val.append(X_old)
+                y_val.append(self.encode_labels(pd.Categorical.from_codes(codes, self.dataset.manifest['categories'])))
+            
+            n_classes = len(self.label_encoder.classes_)
+            cores = joblib.effective_n_jobs(self.n_jobs)
+            print(f"Fitting {n_trees} tree(s) on {len(train)} new rows...")
+            with self.stage('fit'):
+                trees = fit_trees(X_new[train], y_encoded[train], n_classes, n_trees, self.model_params,
+                                  random_state=int(rng.integers(2 ** 31)), n_jobs=cores)
+                updated, updated_provenance = add_trees(self.model, trees, provenance, new_data_path,
+                                                        len(train), max_trees=max_trees, source_hash=source_hash)
+                updated.set_params(n_jobs=None)
+            
+            with self.stage('validate'):
+                scores = {}
+                for name, model in (('current', self.model), ('updated', updated)):
+                    scores[name] = [accuracy_score(y, model.predict(X)) for X, y in zip(X_val, y_val)]
+                    scores[name].append(accuracy_score(np.concatenate(y_val), model.predict(np.vstack(X_val))))
+            labels = ['new data (held out)'] + (['earlier data (sample)'] if earlier else []) + ['all']
+            for index, label in enumerate(labels):
+                print(f"Accuracy on {label}: {scores['current'][index]:.4f} -> {scores['updated'][index]:.4f}")
+            if scores['updated'][-1] < scores['current'][-1] - tolerance:
+                print(f"Update rejected: accuracy fell by more than {tolerance:.4f}; the model is unchanged")
+                return False
+            
+            with self.stage('crop_info'):
+                crop_info = None
+                if applied_before(provenance, new_data_path, source_hash):
+                    print(f"{new_data_path} is already counted in the crop info")
+                elif os.path.exists(self.crop_stats_path):
+                    self.crop_stats = CropStatsAggregator.load(self.crop_stats_path)
+                    self.crop_stats.merge(aggregate(iter_chunks(X_new, y_new), feature_names=self.feature_names))
+                    crop_info = self.crop_stats.crop_info(self.label_encoder.classes_)
+                else:
+                    print(f"No {self.crop_stats_path} to merge into; crop info left unchanged")
+            
+            with self.stage('save'):
+                self.model = updated
+                self.provenance = updated_provenance
+                self.save_model()
+                if crop_info is not None:
+                    self.save_crop_info(crop_info)
+            with self.stage('offline_bundle'):
+                self.save_offline_bundle()
+            
+            removed = updated_provenance['updates'][-1]['trees_removed']
+            print(f"Model updated: {len(trees)} tree(s) added, {removed} removed, "
+                  f"{len(self.model.estimators_)} in total")
+            print(summarize(self.provenance))
+            print(f"Wall-clock time: {time.perf_counter() - start:.2f}s")
+            return True
+            
+        except Exception as e:
+            print(f"Error updating model: {e}")
+            return False
+    
     def full_training_pipeline(self):
         """Complete training pipeline"""
         print("Starting full training pipeline...")
         print("=" * 50)
         
+        start = time.perf_counter()
+        
+        cache_key, cached = self.restore_cached([self.data_path])
+        if cached:
+            print(f"Wall-clock time: {time.perf_counter() - start:.2f}s")
+            return True
+        
         # Load data
-        X, y = self.load_data()
+        with self.stage('load_data'):
+            X, y = self.load_data()
         if X is None:
             return False
         
@@ -230,28 +573,73 @@ class CropModelTrainer:
             return False
         
         # Validate model
-        self.validate_model(X, y)
+        with self.stage('validate'):
+            self.validate_model(X, y)
         
         # Generate crop info
-        crop_info = self.generate_crop_info(X, y)
+        with self.stage('crop_info'):
+            crop_info = self.generate_crop_info(X, y)
+        self.provenance = initial_provenance(len(self.model.estimators_), [self.data_path], len(X))
         
         # Save everything
-        model_saved = self.save_model()
-        info_saved = self.save_crop_info(crop_info)
+        with self.stage('save'):
+            model_saved = self.save_model()
+            info_saved = self.save_crop_info(crop_info)
         
         if model_saved and info_saved:
+            with self.stage('offline_bundle'):
+                self.save_offline_bundle(X)
+            self.store_cached(cache_key, [self.data_path], accuracy, cv_accuracy)
             print("\n" + "=" * 50)
             print("Training pipeline completed successfully!")
             print(f"Final accuracy: {accuracy:.4f}")
             print(f"Cross-validation accuracy: {cv_accuracy:.4f}")
             print(f"Number of crops: {len(self.label_encoder.classes_)}")
+            print(f"Wall-clock time: {time.perf_counter() - start:.2f}s "
+                  f"({', '.join(f'{name} {seconds:.2f}s' for name, seconds in self.stage_times.items())})")
             return True
         
         return False
 
 def main():
     """Main function to run the training pipeline"""
-    trainer = CropModelTrainer()
+    parser = argparse.ArgumentParser(description='Train the crop recommendation model')
+    parser.add_argument('--data', help='Training CSV with N, P, K, temperature, humidity, ph, rainfall and label')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Cores for tree building and cross-validation, -1 for all (default: CROPBOT_TRAIN_JOBS or 1)')
+    parser.add_argument('--params', type=json.loads, default=None,
+                        help='Forest hyperparameters as JSON, e.g. \'{"n_estimators": 50, "max_depth": 14}\'')
+    parser.add_argument('--search', action='store_true',
+                        help='Search hyperparameters and write the Pareto front instead of training')
+    parser.add_argument('--candidates', type=int, default=27, help='Candidates in the first search round')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always train, even if a cached run had the same data, settings and code')
+    parser.add_argument('--update', metavar='CSV',
+                        help='Add trees fitted on this CSV to the saved model instead of retraining')
+    parser.add_argument('--trees', type=int, default=10, help='Trees fitted on the new data in an --update')
+    parser.add_argument('--window', type=int, default=None,
+                        help='With --update, keep at most this many trees, dropping the oldest')
+    parser.add_argument('--force', action='store_true',
+                        help='With --update, add trees even if the CSV was already applied unchanged')
+    args = parser.parse_args()
+    
+    trainer = CropModelTrainer(args.data, n_jobs=args.jobs, model_params=args.params, use_cache=not args.no_cache)
+    if args.search:
+        X, y = trainer.load_data()
+        if X is not None and trainer.search_hyperparameters(X, y, n_candidates=args.candidates) is not None:
+            print("\nHyperparameter search completed successfully!")
+        else:
+            print("\nHyperparameter search failed!")
+        return
+    
+    if args.update:
+        if trainer.update_with_new_data(args.update, n_trees=args.trees, max_trees=args.window,
+                                        force=args.force):
+            print("\nModel update completed successfully!")
+        else:
+            print("\nModel update failed!")
+        return
+    
     success = trainer.full_training_pipeline()
     
     if success: